@@ -0,0 +1,45 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Helpers that are shared by the legos.
+'''
+from kitty.model import Static, ENC_STR_DEFAULT
+
+
+def _is_plain_static(field):
+    return type(field) == Static and field.get_name() is None and field._encoder is ENC_STR_DEFAULT
+
+
+def coalesce_statics(fields):
+    '''
+    Merge adjacent unnamed static fields into a single static field.
+    Static fields do not mutate, so the result renders the same
+    and has the same mutations, with fewer fields to walk.
+
+    :param fields: list of fields
+    :return: list of fields, with adjacent unnamed statics merged
+    '''
+    result = []
+    for field in fields:
+        if _is_plain_static(field) and result and _is_plain_static(result[-1]):
+            result[-1] = Static(result[-1]._default_value + field._default_value)
+        elif _is_plain_static(field) and not len(field._default_value):
+            continue
+        else:
+            result.append(field)
+    return result
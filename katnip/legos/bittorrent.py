@@ -20,23 +20,54 @@ Bittorent file (.torrent) protocol lego.
 Those legos impelent the bencoding format:
 https://wiki.theory.org/BitTorrentSpecification#Bencoding
 '''
+import threading
+from collections import OrderedDict
 from kitty.model import Container, TakeFrom
-from kitty.model import Delimiter, String, SizeInBytes, SInt64
+from kitty.model import Delimiter, String, Static, SizeInBytes, SInt64
 from kitty.model import ENC_INT_DEC
-
-
-_unique_ids = {}
+from kitty.core import KittyException
 
 
 def _merge(*args):
     return '-'.join(args)
 
 
-def _unique_name(name):
-    if name not in _unique_ids:
-        _unique_ids[name] = 0
-    _unique_ids[name] += 1
-    return _merge(name, str(_unique_ids[name]))
+class NamingContext(object):
+    '''
+    Generates unique names for the legos that are created without a name.
+    Use a context per template, so the names of a template do not depend
+    on the legos that were created before it.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def unique_name(self, name):
+        '''
+        :param name: base name
+        :return: the base name with a running index, e.g. ``TString-3``
+        '''
+        with self._lock:
+            index = self._counters.get(name, 0) + 1
+            self._counters[name] = index
+        return _merge(name, str(index))
+
+
+# used by legos that are created without a name and without a context
+_default_context = NamingContext()
+
+
+def _unique_name(name, ctx=None):
+    if ctx is None:
+        ctx = _default_context
+    return ctx.unique_name(name)
+
+
+def _elements(fields, name, take_subsets):
+    if take_subsets:
+        return TakeFrom(fields=fields, name=name, min_elements=len(fields)/2)
+    return Container(fields=fields, name=name)
 
 
 class TString(Container):
@@ -45,15 +76,16 @@ class TString(Container):
     Format: ``<string length encoded in base ten ASCII>:<string data>``
     '''
 
-    def __init__(self, value, fuzz_value=True, fuzz_length=True, fuzz_delim=True, name=None):
+    def __init__(self, value, fuzz_value=True, fuzz_length=True, fuzz_delim=True, name=None, ctx=None):
         '''
         :param value: str, will be enclosed in String
         :param fuzz_value: bool (default: True)
         :param fuzz_length: bool (default: True)
         :param fuzz_delim: bool (default: True)
         :param name: name of container (default: None)
+        :param ctx: :class:`~katnip.legos.bittorrent.NamingContext` for the name if it is not set (default: None)
         '''
-        name = name if name is not None else _unique_name(type(self).__name__)
+        name = name if name is not None else _unique_name(type(self).__name__, ctx)
         if isinstance(value, str):
             fvalue = String(value=value, fuzzable=fuzz_value, name=_merge(name, 'value'))
         else:
@@ -72,14 +104,15 @@ class TInteger(Container):
     Format: `` i<integer encoded in base ten ASCII>e``
     '''
 
-    def __init__(self, value, fuzz_value=True, fuzz_delims=True, name=None):
+    def __init__(self, value, fuzz_value=True, fuzz_delims=True, name=None, ctx=None):
         '''
         :param value: int, will be enclosed in a Int32
         :fuzz_value: bool (default: True)
         :fuzz_delims: bool (default: True)
         :param name: name of container (default: None)
+        :param ctx: :class:`~katnip.legos.bittorrent.NamingContext` for the name if it is not set (default: None)
         '''
-        name = name if name is not None else _unique_name(type(self).__name__)
+        name = name if name is not None else _unique_name(type(self).__name__, ctx)
         super(TInteger, self).__init__(name=name, fields=[
             String(value='i', max_size=1, fuzzable=fuzz_delims, name=_merge(name, 'start')),
             SInt64(value=value, encoder=ENC_INT_DEC, fuzzable=fuzz_value, name=_merge(name, 'value')),
@@ -92,16 +125,19 @@ class TList(Container):
     Bencoded list.
     Format: ``l<bencoded values>e``
     '''
-    def __init__(self, fields=[], fuzz_delims=True, name=None):
+    def __init__(self, fields=[], fuzz_delims=True, name=None, ctx=None, take_subsets=True):
         '''
         :param fields: content of the list, Fields...
         :fuzz_delims: bool (default: True)
         :param name: name of container (default: None)
+        :param ctx: :class:`~katnip.legos.bittorrent.NamingContext` for the name if it is not set (default: None)
+        :param take_subsets: render subsets of the fields (with TakeFrom), otherwise
+            all the fields are rendered in their order (default: True)
         '''
-        name = name if name is not None else _unique_name(type(self).__name__)
+        name = name if name is not None else _unique_name(type(self).__name__, ctx)
         super(TList, self).__init__(name=name, fields=[
             String(value='l', max_size=1, fuzzable=fuzz_delims, name=_merge(name, 'start')),
-            TakeFrom(fields=fields, name=_merge(name, 'fields'), min_elements=len(fields)/2),
+            _elements(fields, _merge(name, 'fields'), take_subsets),
             String(value='e', max_size=1, fuzzable=fuzz_delims, name=_merge(name, 'end'))
         ])
 
@@ -112,13 +148,17 @@ class TDict(Container):
     Format: ``d<bencoded string><bencoded element>e``
     '''
 
-    def __init__(self, fields={}, fuzz_keys=True, fuzz_delims=True, name=None):
+    def __init__(self, fields={}, fuzz_keys=True, fuzz_delims=True, name=None, ctx=None, take_subsets=True):
         '''
-        :param fields: dictionary of strings and torrent fields
+        :param fields: dictionary of strings and torrent fields,
+            use an OrderedDict to keep the order of the keys
         :fuzz_delims: bool (default: True)
         :param name: name of container (default: None)
+        :param ctx: :class:`~katnip.legos.bittorrent.NamingContext` for the name if it is not set (default: None)
+        :param take_subsets: render subsets of the fields (with TakeFrom), otherwise
+            all the fields are rendered in their order (default: True)
         '''
-        name = name if name is not None else _unique_name(type(self).__name__)
+        name = name if name is not None else _unique_name(type(self).__name__, ctx)
         dictionary_fields = []
         for k, v in fields.items():
             dictionary_fields.append(Container(name=_merge(name, 'container', k), fields=[
@@ -127,6 +167,110 @@ class TDict(Container):
             ]))
         super(TDict, self).__init__(name=name, fields=[
             String(value='d', max_size=1, fuzzable=fuzz_delims, name=_merge(name, 'start')),
-            TakeFrom(name=_merge(name, 'fields'), fields=dictionary_fields, min_elements=len(dictionary_fields)/2),
+            _elements(dictionary_fields, _merge(name, 'fields'), take_subsets),
             String(value='e', max_size=1, fuzzable=fuzz_delims, name=_merge(name, 'end'))
         ])
+
+
+def _decode_string(data, offset):
+    '''
+    :return: (string, offset after the string)
+    '''
+    colon = data.index(':', offset)
+    length = int(data[offset:colon])
+    start = colon + 1
+    end = start + length
+    if length < 0 or end > len(data):
+        raise ValueError('string length (%d) exceeds the data' % length)
+    return data[start:end], end
+
+
+class _BencodeDecoder(object):
+
+    def __init__(self, data, ctx, blob_keys, blob_size, fuzz_keys, fuzz_delims, take_subsets):
+        self.data = data
+        self.ctx = ctx
+        self.blob_keys = blob_keys
+        self.blob_size = blob_size
+        self.fuzz_keys = fuzz_keys
+        self.fuzz_delims = fuzz_delims
+        self.take_subsets = take_subsets
+
+    def decode(self, offset, name=None, key=None):
+        '''
+        :return: (lego, offset after the value)
+        '''
+        data = self.data
+        kind = data[offset]
+        if kind == 'i':
+            end = data.index('e', offset)
+            value = int(data[offset + 1:end])
+            if not -2 ** 63 <= value < 2 ** 63:
+                raise ValueError('integer (%d) does not fit in 64 bits' % value)
+            return TInteger(value, fuzz_delims=self.fuzz_delims, name=name, ctx=self.ctx), end + 1
+        elif kind == 'l':
+            fields = []
+            offset += 1
+            while data[offset] != 'e':
+                field, offset = self.decode(offset)
+                fields.append(field)
+            lego = TList(fields=fields, fuzz_delims=self.fuzz_delims, name=name, ctx=self.ctx, take_subsets=self.take_subsets)
+            return lego, offset + 1
+        elif kind == 'd':
+            fields = OrderedDict()
+            offset += 1
+            while data[offset] != 'e':
+                dict_key, offset = _decode_string(data, offset)
+                fields[dict_key], offset = self.decode(offset, key=dict_key)
+            lego = TDict(
+                fields=fields, fuzz_keys=self.fuzz_keys, fuzz_delims=self.fuzz_delims,
+                name=name, ctx=self.ctx, take_subsets=self.take_subsets
+            )
+            return lego, offset + 1
+        value, end = _decode_string(data, offset)
+        if key in self.blob_keys or len(value) > self.blob_size:
+            # a single field, only its length is fuzzed
+            name = name if name is not None else self.ctx.unique_name(TString.__name__)
+            value = Static(value=value, name=_merge(name, 'value'))
+        return TString(value, fuzz_delim=self.fuzz_delims, name=name, ctx=self.ctx), end
+
+
+def lego_from_bencode(data, name=None, ctx=None, blob_keys=('pieces',), blob_size=1024, fuzz_keys=True, fuzz_delims=True, take_subsets=False):
+    '''
+    Create a lego from bencoded data, e.g. the content of a .torrent file.
+
+    The keys of the dictionaries are kept in their order in the data,
+    so the default render of the lego is the decoded data.
+    Large binary values (e.g. the SHA1 hashes in ``pieces``) are kept
+    as a single :class:`~kitty.model.low_level.field.Static` field,
+    so they are not string-mutated, only their length is fuzzed.
+
+    :param data: the bencoded data
+    :param name: name of the lego (default: None)
+    :param ctx: naming context for the legos (default: None - new context)
+    :param blob_keys: dictionary keys whose string values are kept as a single field (default: ('pieces',))
+    :param blob_size: strings that are longer than this are kept as a single field (default: 1024)
+    :param fuzz_keys: should fuzz the dictionary keys (default: True)
+    :param fuzz_delims: should fuzz the delimiters (default: True)
+    :param take_subsets: render subsets of the lists and dictionaries, see :class:`~katnip.legos.bittorrent.TList`
+        (default: False - the default render is the decoded data)
+    :raises: KittyException if the data is not valid bencoded data
+    :return: the lego (TDict, TList, TString or TInteger)
+
+    :example:
+
+        ::
+
+            with open('file.torrent', 'rb') as f:
+                torrent = Template(name='torrent', fields=lego_from_bencode(f.read(), fuzz_delims=False))
+    '''
+    if ctx is None:
+        ctx = NamingContext()
+    decoder = _BencodeDecoder(data, ctx, blob_keys, blob_size, fuzz_keys, fuzz_delims, take_subsets)
+    try:
+        lego, end = decoder.decode(0, name=name)
+    except (ValueError, IndexError) as ex:
+        raise KittyException('invalid bencoded data: %s' % ex)
+    if end != len(data):
+        raise KittyException('invalid bencoded data: %d extra bytes after the value' % (len(data) - end))
+    return lego
@@ -23,9 +23,12 @@ JSON legos - simplified fuzzing of JSON-based protocols
 from __future__ import absolute_import
 import json
 import types
+from fnmatch import fnmatch
+from random import Random
 from kitty.model import Container
 from kitty.model import Group, String, Static, BaseField, SInt32
 from kitty.model import ENC_INT_DEC
+from katnip.legos._utils import coalesce_statics
 
 
 def _valuename(name):
@@ -117,7 +120,7 @@ class JsonObject(Container):
             if i != (len(items) - 1):
                 fields.append(Static(','))
         fields.append(Static('}'))
-        super(JsonObject, self).__init__(fields, name=name)
+        super(JsonObject, self).__init__(coalesce_statics(fields), name=name)
 
 
 class JsonArray(Container):
@@ -139,7 +142,7 @@ class JsonArray(Container):
             if i != (len(self.values) - 1):
                 fields.append(Static(','))
         fields.append(Static(']'))
-        super(JsonArray, self).__init__(fields, name=name)
+        super(JsonArray, self).__init__(coalesce_statics(fields), name=name)
 
 
 #
@@ -147,9 +150,42 @@ class JsonArray(Container):
 #
 class _JsonStringContext:
 
-    def __init__(self):
+    def __init__(self, paths=None, max_depth=None, selected=None):
+        '''
+        :param paths: fnmatch patterns of the JSON paths of the fuzzed values (default: None - all paths)
+        :param max_depth: max depth of the fuzzed values (default: None - any depth)
+        :param selected: set of JSON paths of the fuzzed values (default: None - all paths)
+        '''
         self.idx = 0
         self._names = set([])
+        self.path = []
+        self.leaves = []
+        self._paths = paths
+        self._max_depth = max_depth
+        self._selected = selected
+
+    def _json_path(self):
+        return '$' + ''.join('[%d]' % p if isinstance(p, int) else '.%s' % p for p in self.path)
+
+    def fuzz_leaf(self):
+        '''
+        :return: should the value at the current JSON path be fuzzed
+        '''
+        path = self._json_path()
+        if self._max_depth is not None and len(self.path) > self._max_depth:
+            return False
+        if self._paths is not None and not any(fnmatch(path, pattern) for pattern in self._paths):
+            return False
+        if self._selected is not None and path not in self._selected:
+            return False
+        return True
+
+    def add_leaf(self, field):
+        '''
+        Record a value field with the JSON path it was created at
+        '''
+        self.leaves.append((self._json_path(), field))
+        return field
 
     def uname(self, name, enforce=True):
         if name in self._names:
@@ -178,20 +214,22 @@ def dict_to_JsonObject(the_dict, name=None, ctx=None):
         ctx = _JsonStringContext()
     members = {}
     for (k, v) in the_dict.items():
+        ctx.path.append(k)
         if v is None:
             val = JsonNull(name=ctx.uname(k), fuzzable=False)
         elif isinstance(v, types.BooleanType):
-            val = JsonBoolean(name=ctx.uname(k), value=v, fuzzable=True)
+            val = ctx.add_leaf(JsonBoolean(name=ctx.uname(k), value=v, fuzzable=ctx.fuzz_leaf()))
         elif isinstance(v, types.StringTypes):
-            val = JsonString(name=ctx.uname(k), value=v, fuzzable=True)
+            val = ctx.add_leaf(JsonString(name=ctx.uname(k), value=v, fuzzable=ctx.fuzz_leaf()))
         elif isinstance(v, types.ListType):
             val = list_to_JsonArray(v, k, ctx)
         elif isinstance(v, types.DictionaryType):
             val = dict_to_JsonObject(v, k, ctx)
         elif isinstance(v, types.IntType):
-            val = SInt32(v, encoder=ENC_INT_DEC, name=ctx.uname(k))
+            val = ctx.add_leaf(SInt32(v, encoder=ENC_INT_DEC, fuzzable=ctx.fuzz_leaf(), name=ctx.uname(k)))
         else:
             raise ValueError('type not supported: %s' % type(v))
+        ctx.path.pop()
         members[k] = val
     if name is None:
         name = 'obj'
@@ -214,41 +252,83 @@ def list_to_JsonArray(the_list, name=None, ctx=None):
     if ctx is None:
         ctx = _JsonStringContext()
     elements = []
-    for v in the_list:
+    for i, v in enumerate(the_list):
+        ctx.path.append(i)
         if v is None:
             elements.append(JsonNull(ctx.uname('null'), fuzzable=False))
         elif isinstance(v, types.BooleanType):
-            elements.append(JsonBoolean(ctx.uname('bool'), value=v, fuzzable=True))
+            elements.append(ctx.add_leaf(JsonBoolean(ctx.uname('bool'), value=v, fuzzable=ctx.fuzz_leaf())))
         elif isinstance(v, types.StringTypes):
-            elements.append(JsonString(ctx.uname('string'), v, fuzzable=True))
+            elements.append(ctx.add_leaf(JsonString(ctx.uname('string'), v, fuzzable=ctx.fuzz_leaf())))
         elif isinstance(v, types.ListType):
             elements.append(list_to_JsonArray(v, None, ctx))
         elif isinstance(v, types.DictionaryType):
             elements.append(dict_to_JsonObject(v, None, ctx))
         elif isinstance(v, types.IntType):
-            elements.append(SInt32(v, encoder=ENC_INT_DEC, name=ctx.uname('int')))
+            elements.append(ctx.add_leaf(SInt32(v, encoder=ENC_INT_DEC, fuzzable=ctx.fuzz_leaf(), name=ctx.uname('int'))))
         else:
             raise ValueError('type not supported: %s' % type(v))
+        ctx.path.pop()
     if name is None:
         name = 'array'
     return JsonArray(name=ctx.uname(name, False), values=elements)
 
 
-def str_to_json(json_str, name=None):
+def _select_leaves(leaves, max_mutations, seed):
+    '''
+    Sample the fuzzed values until the mutation budget is used.
+
+    :param leaves: list of (json path, field) of the values
+    :return: set of JSON paths of the selected values
+    '''
+    candidates = sorted((leaf for leaf in leaves if leaf[1].num_mutations()), key=lambda leaf: leaf[0])
+    Random(seed).shuffle(candidates)
+    selected = set()
+    total = 0
+    for path, field in candidates:
+        num = field.num_mutations()
+        if total + num <= max_mutations:
+            total += num
+            selected.add(path)
+    return selected
+
+
+def _json_to_lego(parsed, name, ctx):
+    if type(parsed) == list:
+        return list_to_JsonArray(parsed, name, ctx)
+    elif type(parsed) == dict:
+        return dict_to_JsonObject(parsed, name, ctx)
+    raise ValueError('parsing json string resulted in unsupported type (%s)' % type(parsed))
+
+
+def str_to_json(json_str, name=None, max_mutations=None, seed=0, paths=None, max_depth=None):
     '''
     Create a JSON lego based on a json string.
 
+    By default, all strings, booleans and integers are fuzzed.
+    The fuzzed values can be limited by their JSON path, by their depth
+    and by a total mutation budget.
+    JSON paths are in the form ``$.key[index].key``.
+
     :param name: name of the generated container
     :param json_str: json string to base the template on
+    :param max_mutations: max total number of mutations, values are sampled (by seed)
+        until the budget is used (default: None - no limit)
+    :param seed: seed for sampling the values when max_mutations is set (default: 0)
+    :type paths: list of str
+    :param paths: only fuzz values whose JSON path matches one of these
+        fnmatch patterns, e.g. ``['$.user.*']`` (default: None - all paths)
+    :param max_depth: only fuzz values up to this depth, values of the top level
+        object or array are at depth 1 (default: None - any depth)
     :rtype: :class:`~katnip.legos.json.JsonArray` or :class:`~katnip.legos.json.JsonObject`
     :return: JSON object or JSON array.
     '''
     parsed = json.loads(json_str)
-    result = None
-    if type(parsed) == list:
-        result = list_to_JsonArray(parsed, name)
-    elif type(parsed) == dict:
-        result = dict_to_JsonObject(parsed, name)
-    else:
-        raise ValueError('parsing json string resulted in unsupported type (%s)' % type(parsed))
+    ctx = _JsonStringContext(paths, max_depth)
+    result = _json_to_lego(parsed, name, ctx)
+    if max_mutations is not None:
+        # the budget depends on the mutations of each value,
+        # so the values are built once to count them, and again with the selection
+        selected = _select_leaves(ctx.leaves, max_mutations, seed)
+        result = _json_to_lego(parsed, name, _JsonStringContext(paths, max_depth, selected))
     return result
@@ -19,16 +19,43 @@
 TLV (tag/type-length-value) legos.
 Simplify fuzzing of TLV-based protocol.
 '''
-from kitty.model import BitField
+import struct
+from binascii import hexlify
+from kitty.model import BitField, String
 from kitty.model import SizeInBytes
 from kitty.model import ENC_INT_BE, ENC_BITS_DEFAULT
 from kitty.model import Container
+from kitty.core import KittyException
+from katnip.model.low_level.container import CachedContainer
 
 
-class TLV(Container):
+_struct_formats = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+def _int_reader(num_bytes, mode):
+    '''
+    :param num_bytes: size of the integer in bytes
+    :param mode: 'be' for big endian, 'le' for little endian
+    :return: function(buff, offset) -> unsigned integer
+    '''
+    if num_bytes in _struct_formats:
+        fmt = struct.Struct(('>' if mode == 'be' else '<') + _struct_formats[num_bytes])
+        return lambda buff, offset: fmt.unpack_from(buff, offset)[0]
+
+    def read(buff, offset):
+        raw = buff[offset:offset + num_bytes].tobytes()
+        if mode == 'le':
+            raw = raw[::-1]
+        return int(hexlify(raw), 16)
+    return read
+
+
+class TLV(CachedContainer):
     '''
     A container for fuzzing TLV elements,
     it represents a full binary TLV element.
+    The element is rendered from cache while none of its fields is mutated,
+    so the lengths of nested elements are not recalculated on each render.
     '''
 
     def __init__(self, name, tag, fields=None, tag_size=32, length_size=32, encoder=ENC_INT_BE, fuzzable=True, fuzz_tag=False, fuzz_length=True):
@@ -87,14 +114,83 @@ class TLVFactory(object):
         :param fuzz_length: should fuzz the element length (default: True)
         '''
         return TLV(
-            name=name, tag=tag, value=fields, tag_size=self._tag_size, length_size=self._len_size,
+            name=name, tag=tag, fields=fields, tag_size=self._tag_size, length_size=self._len_size,
             encoder=self._encoder, fuzzable=fuzzable, fuzz_tag=fuzz_tag, fuzz_length=fuzz_length)
 
+    def parse(self, data, name, nested_tags=None, fuzz_values=True, fuzz_tag=False, fuzz_length=True):
+        '''
+        Parse a binary stream of TLV elements.
+
+        The stream is parsed in a single pass over a memoryview of the data.
+        Only the values of non-nested elements are copied,
+        as the default values of :class:`~kitty.model.low_level.field.String` fields.
+
+        :param data: the TLV stream (str, bytearray or memoryview)
+        :param name: name of the resulted container, the elements are named ``<name>-<index>``
+        :type nested_tags: collection of int or func(tag) -> bool
+        :param nested_tags: tags of elements whose value is a TLV stream itself (default: None)
+        :param fuzz_values: should fuzz the values of non-nested elements (default: True)
+        :param fuzz_tag: should fuzz the tag values (default: False)
+        :param fuzz_length: should fuzz the element lengths (default: True)
+        :raises: KittyException if the data is not a valid TLV stream
+        :return: container with a TLV element for each top level element in the stream
+
+        :example:
+
+            ::
+
+                factory = TLVFactory(tag_size=8, length_size=16)
+                Template(name='capture', fields=factory.parse(captured, 'capture', nested_tags=[0x30, 0x31]))
+        '''
+        mode = getattr(self._encoder, '_mode', None)
+        if mode not in ('be', 'le') or self._tag_size % 8 or self._len_size % 8:
+            raise KittyException('parsing requires a byte aligned binary encoder for tag and length')
+        if nested_tags is None:
+            is_nested = lambda tag: False
+        elif callable(nested_tags):
+            is_nested = nested_tags
+        else:
+            is_nested = frozenset(nested_tags).__contains__
+        tag_bytes = self._tag_size // 8
+        header_bytes = tag_bytes + self._len_size // 8
+        read_tag = _int_reader(tag_bytes, mode)
+        read_length = _int_reader(self._len_size // 8, mode)
+        buff = memoryview(data)
+        offset = 0
+        index = 0
+        # each entry is (end offset, fields, (name, tag) of the nested element)
+        stack = [(len(buff), [], None)]
+        while True:
+            end, fields, element = stack[-1]
+            if offset == end:
+                stack.pop()
+                if element is None:
+                    return Container(name=name, fields=fields)
+                elem_name, tag = element
+                stack[-1][1].append(self.element(elem_name, tag, fields, fuzz_tag=fuzz_tag, fuzz_length=fuzz_length))
+                continue
+            if offset + header_bytes > end:
+                raise KittyException('TLV header at offset %d exceeds its enclosing element' % offset)
+            tag = read_tag(buff, offset)
+            length = read_length(buff, offset + tag_bytes)
+            value_offset = offset + header_bytes
+            offset = value_offset + length
+            if offset > end:
+                raise KittyException('TLV value at offset %d exceeds its enclosing element' % value_offset)
+            elem_name = '%s-%d' % (name, index)
+            index += 1
+            if is_nested(tag):
+                offset = value_offset
+                stack.append((value_offset + length, [], (elem_name, tag)))
+            else:
+                value = String(name='%s-data' % elem_name, value=buff[value_offset:offset].tobytes(), fuzzable=fuzz_values)
+                fields.append(self.element(elem_name, tag, value, fuzz_tag=fuzz_tag, fuzz_length=fuzz_length))
+
 
 if __name__ == '__main__':
     from kitty.model import String
     tlv = TLVFactory()
-    elem = tlv.element('version', 0x1, value=String(name='version-string', value='1.2.3'))
+    elem = tlv.element('version', 0x1, fields=String(name='version-string', value='1.2.3'))
     print elem.num_mutations()
     print elem.render().bytes.encode('hex')
     while elem.mutate():
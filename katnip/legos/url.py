@@ -358,7 +358,7 @@ class HttpUrl(Url):
             path = Path(path=parsed.path[1:], fuzz_delims=fuzz_delims, fuzzable=fuzzable, name='path')
         if parsed.query:
             search = Search(search=parsed.query, fuzz_delims=fuzz_delims, fuzzable=fuzzable, name='search')
-        return HttpUrl(scheme=parsed.scheme, login=login, hostport=hostport, path=path, search=search, fuzzable=fuzzable)
+        return HttpUrl(scheme=parsed.scheme, login=login, hostport=hostport, path=path, search=search, fuzzable=fuzzable, fuzz_delims=fuzz_delims, name=name)
 
 
 class FType(Container):
@@ -547,3 +547,138 @@ def url_from_string(url, fuzz_delims=True, fuzzable=True, name=None):
         return generator(the_url=url, fuzz_delims=fuzz_delims, fuzzable=fuzzable, name=name)
     else:
         raise KittyException('Unknown URL scheme (%s)' % scheme)
+
+
+class UrlBuilder(object):
+    '''
+    Build URL legos for many URLs.
+
+    Identical URL components (schemes, login, host and port, paths, searches)
+    are built once, as prototypes, and each URL gets a copy of them.
+    A copy of a field shares the immutable parts of the prototype
+    (its mutation library and default value), so building many URLs
+    with common components takes less time and memory than
+    calling :func:`~katnip.legos.url.url_from_string` for each of them.
+
+    :example:
+
+        ::
+
+            builder = UrlBuilder(fuzz_delims=False)
+            legos = builder.from_strings(open('crawled_urls.txt').read().splitlines())
+    '''
+
+    def __init__(self, fuzz_delims=True, fuzzable=True):
+        '''
+        :param fuzz_delims: should fuzz delimiters (default: True)
+        :param fuzzable: should the resulted containers be fuzzable (default: True)
+        '''
+        self.fuzz_delims = fuzz_delims
+        self.fuzzable = fuzzable
+        self._prototypes = {}
+        self._generators = {
+            'http': self._http_url,
+            'https': self._http_url,
+            'ftp': self._ftp_url,
+            'ftps': self._ftp_url,
+            'mailto': self._email_url,
+        }
+
+    def _get(self, key, factory, *args, **kwargs):
+        '''
+        :return: copy of the prototype of the key, the prototype is built by factory if needed
+        '''
+        prototype = self._prototypes.get(key)
+        if prototype is None:
+            prototype = factory(*args, **kwargs)
+            self._prototypes[key] = prototype
+        return prototype.copy()
+
+    def _scheme(self, scheme):
+        return self._get(('scheme', scheme), String, name='scheme', value=scheme)
+
+    def _login(self, parsed):
+        if not parsed.username:
+            return None
+        return self._get(
+            ('login', parsed.username, parsed.password), Login,
+            username=parsed.username, password=parsed.password, name='login', fuzz_delims=self.fuzz_delims
+        )
+
+    def _hostport(self, parsed, fuzzable):
+        port = int(parsed.port) if parsed.port else None
+        return self._get(
+            ('hostport', parsed.hostname, port, fuzzable), HostPort,
+            host=parsed.hostname, port=port, fuzz_delim=self.fuzz_delims, fuzzable=fuzzable, name='hostport'
+        )
+
+    def _path(self, parsed, fuzzable):
+        if not parsed.path:
+            return None
+        return self._get(
+            ('path', parsed.path, fuzzable), Path,
+            path=parsed.path[1:], fuzz_delims=self.fuzz_delims, fuzzable=fuzzable, name='path'
+        )
+
+    def _http_url(self, parsed, name):
+        search = None
+        if parsed.query:
+            search = self._get(
+                ('search', parsed.query), Search,
+                search=parsed.query, fuzz_delims=self.fuzz_delims, fuzzable=self.fuzzable, name='search'
+            )
+        return HttpUrl(
+            scheme=self._scheme(parsed.scheme), login=self._login(parsed),
+            hostport=self._hostport(parsed, self.fuzzable), path=self._path(parsed, self.fuzzable), search=search,
+            fuzz_delims=self.fuzz_delims, fuzzable=self.fuzzable, name=name
+        )
+
+    def _ftp_url(self, parsed, name):
+        ftype = None
+        if parsed.params.startswith('type='):
+            the_type = parsed.params[-1]
+            ftype = self._get(('ftype', the_type), FType, the_type=the_type, fuzz_delims=self.fuzz_delims, name='ftype')
+        return FtpUrl(
+            scheme=self._scheme(parsed.scheme), login=self._login(parsed),
+            hostport=self._hostport(parsed, self.fuzzable), path=self._path(parsed, True), ftype=ftype,
+            fuzz_delims=self.fuzz_delims, fuzzable=self.fuzzable, name=name
+        )
+
+    def _email_url(self, parsed, name):
+        email_address = self._get(
+            ('email', parsed.path), EmailAddress.from_string,
+            parsed.path, self.fuzz_delims, self.fuzzable, 'email'
+        )
+        return EmailUrl(email_address, scheme=self._scheme(parsed.scheme), fuzz_delim=self.fuzz_delims, fuzzable=self.fuzzable, name=name)
+
+    def from_string(self, url, name=None):
+        '''
+        Create a URL lego from string
+
+        :param url: the URL string
+        :param name: name of the resulted container (default: None)
+        :raises: KittyException if the URL has no scheme, or its scheme is not supported
+        '''
+        parsed = urlparse(url)
+        scheme = parsed.scheme
+        if not scheme:
+            raise KittyException('URL is invalid (no scheme)')
+        if scheme not in self._generators:
+            raise KittyException('Unknown URL scheme (%s)' % scheme)
+        return self._generators[scheme](parsed, name)
+
+    def from_strings(self, urls, name_format='url_%d'):
+        '''
+        Create URL legos from a list of strings
+
+        :param urls: iterable of URL strings
+        :param name_format: format of the container names, formatted with the URL index (default: 'url_%d')
+        :return: list of URL legos
+        '''
+        return [self.from_string(url, name=name_format % i) for i, url in enumerate(urls)]
+
+    def clear(self):
+        '''
+        Drop the prototypes
+        '''
+        self._prototypes = {}
@@ -17,11 +17,12 @@
 '''
 Legos to generate USB HID reports
 '''
-from kitty.model import Container, OneOf, TakeFrom
+from kitty.model import BaseField, Container, OneOf
 from kitty.model import MutableField
-from kitty.model import U8, BitField, Static
-from kitty.model import ENC_INT_LE
-from kitty.core import KittyException
+from kitty.model import U8, BitField
+from kitty.model import ENC_INT_LE, ENC_STR_DEFAULT
+from kitty.model.low_level.encoder import StrEncoder
+from kitty.core import KittyException, khash
 from random import Random
 
 
@@ -55,6 +56,9 @@ opcodes = {
     0xC0: 'End Collection',
 }
 
+# all the opcodes, with each number of arguments
+_random_opcodes = [tag | i for tag in sorted(opcodes) for i in range(4)]
+
 
 class NameGen(object):
     def __init__(self):
@@ -74,37 +78,73 @@ class NameGen(object):
         return cur_name
 
 
-class RandomHidReport(TakeFrom):
+class RandomHidReport(BaseField):
     '''
     Generate random sequences of valid, interesting opcodes, and try to screw them up.
+
+    Each mutation is generated from the seed and the mutation index alone,
+    so any mutation can be reproduced (or skipped to) without generating
+    the ones before it, e.g. to split a session between several fuzzers.
+    The default value is sequence 0, and mutation i is sequence i + 1.
     '''
 
-    def __init__(self, name=None, fuzzable=True):
-        namer = NameGen()
-        fields = []
-        r = Random()
-        for tag in opcodes:
-            for i in range(4):
-                opcode = tag | i
-                current = chr(opcode)
-                for j in range(i):
-                    current += chr(r.randint(0, 255))
-                fields.append(Static(name=namer.gen(opcode), value=current))
-        super(RandomHidReport, self).__init__(
-            fields=fields,
-            min_elements=10,
-            max_elements=40,
-            fuzzable=fuzzable,
-            name=name
-        )
-
-
-def GenerateHidReport(report_str, name=None):
+    _encoder_type_ = StrEncoder
+
+    def __init__(self, name=None, fuzzable=True, seed=0, num_mutations=496, min_elements=10, max_elements=40):
+        '''
+        :param name: name of the field (default: None)
+        :param fuzzable: is field fuzzable (default: True)
+        :param seed: seed for the generated sequences (default: 0)
+        :param num_mutations: number of mutations (default: 496, as many as the TakeFrom it replaced)
+        :param min_elements: minimal number of opcodes in a sequence (default: 10)
+        :param max_elements: maximal number of opcodes in a sequence (default: 40)
+        '''
+        self._seed = seed
+        self._min_elements = min_elements
+        self._max_elements = min(max_elements, len(_random_opcodes))
+        super(RandomHidReport, self).__init__(value=self.generate(0), encoder=ENC_STR_DEFAULT, fuzzable=fuzzable, name=name)
+        self._num_mutations = num_mutations
+
+    def generate(self, index):
+        '''
+        :param index: index of the sequence
+        :return: the sequence of opcodes (with random arguments) for the index
+        '''
+        r = Random(self._seed * 0x100000000 + index)
+        count = r.randint(self._min_elements, self._max_elements)
+        sequence = bytearray()
+        for opcode in r.sample(_random_opcodes, count):
+            sequence.append(opcode)
+            for i in range(opcode & 3):
+                sequence.append(r.randint(0, 255))
+        return str(sequence)
+
+    def _mutate(self):
+        # sequence 0 is the default value
+        self._current_value = self.generate(self._current_index + 1)
+
+    def skip(self, count):
+        # the mutations don't depend on each other, no need to generate the skipped ones
+        self._initialize()
+        skipped = max(min(count, self._last_index() - self._current_index), 0)
+        if skipped:
+            self._current_index += skipped
+            self._mutate()
+        return skipped
+
+    def hash(self):
+        hashed = super(RandomHidReport, self).hash()
+        return khash(hashed, self._seed, self._num_mutations, self._min_elements, self._max_elements)
+
+
+def GenerateHidReport(report_str, name=None, seed=0):
     '''
     Generate an HID report Container from a HID report string
 
+    :type report_str: str, bytearray or memoryview
     :param report_str: HID report string
     :param name: name of generated Container (default: None)
+    :param seed: seed for the random sequences, see :class:`~katnip.legos.usb_hid.RandomHidReport` (default: 0)
     :raises: KittyException if not enough bytes are left for command
 
     :examples:
@@ -114,30 +154,32 @@ def GenerateHidReport(report_str, name=None):
             Template(
                 name='MyHidReport',
                 fields=GenerateHidReport(
-                    '05010906A101050719E029E7150025017501950881029501750881011900296515002565750895018100C0',
+                    '05010906A101050719E029E7150025017501950881029501750881011900296515002565750895018100C0'.decode('hex'),
                 )
             )
     '''
+    report = bytearray(report_str)
     fields = []
     index = 0
     namer = NameGen()
-    while index < len(report_str):
-        opcode = ord(report_str[index])
+    while index < len(report):
+        opcode = report[index]
         num_args = opcode & 3
-        if index + num_args >= len(report_str):
+        if index + num_args >= len(report):
             raise KittyException('Not enough bytes in hid report for last opcode')
         index += 1
         cur_name = namer.gen(opcode)
         if num_args == 0:
             fields.append(U8(opcode, name=cur_name))
         else:
-            args = report_str[index:index + num_args]
-            value = sum(ord(args[i]) << (i * 8) for i in range(len(args)))  # little endian...
+            value = 0
+            for i in range(num_args):
+                value |= report[index + i] << (i * 8)  # little endian...
             fields.append(Container(
                 name=cur_name,
                 fields=[
                     U8(opcode, name='opcode'),
-                    BitField(value, 8 * len(args), encoder=ENC_INT_LE, name='value')
+                    BitField(value, 8 * num_args, encoder=ENC_INT_LE, name='value')
                 ]
             ))
         index += num_args
@@ -150,9 +192,10 @@ def GenerateHidReport(report_str, name=None):
             ),
             MutableField(
                 name='mutation',
-                value=report_str
+                value=str(report)
             ),
             RandomHidReport(
-                name='random_sequences'
+                name='random_sequences',
+                seed=seed
             ),
         ])
@@ -19,10 +19,16 @@
 XML (tag/type-length-value) legos.
 Simplify template creation of XML-based protocol.
 '''
+from __future__ import absolute_import
+import re
+from fnmatch import fnmatch
 from types import StringTypes, ListType, IntType
-from kitty.model import Container, Template
+from xml.etree import cElementTree
+from xml.sax.saxutils import escape
+from kitty.model import BaseField, Container, Template
 from kitty.model import String, Static, SInt32, Clone
 from kitty.model import ENC_INT_DEC
+from katnip.legos._utils import coalesce_statics
 
 
 def _valuename(name):
@@ -67,7 +73,7 @@ class XmlAttribute(Container):
             value_field,
             Static('"')
         ]
-        super(XmlAttribute, self).__init__(fields, name=name)
+        super(XmlAttribute, self).__init__(coalesce_statics(fields), name=name)
 
 
 class XmlElement(Container):
@@ -82,7 +88,8 @@ class XmlElement(Container):
         :type attributes: list
         :param attributes: list of attributes of this element (default: [])
         :type content: str/unicode/int/[XmlElement]
-        :param content: content of this element (default=None)
+        :param content: content of this element (default=None),
+            a content list may also hold fields for the text between the elements
         :param fuzz_name: should we fuzz the element name
         :param fuzz_content: should we fuzz the content (n/a for XmlElement)
         '''
@@ -102,7 +109,7 @@ class XmlElement(Container):
             fields.append(attribute)
         fields.append(Static('>'))
         if content:
-            content_name = '%s_content' + name
+            content_name = '%s_content' % name
             if isinstance(content, StringTypes):
                 fields.append(String(content, fuzzable=fuzz_content, name=content_name))
             elif isinstance(content, IntType):
@@ -110,12 +117,173 @@ class XmlElement(Container):
             elif isinstance(content, ListType):
                 fields.append(Static(delimiter))
                 for elem in content:
-                    _check_type(elem, XmlElement, 'element inside the content list')
+                    _check_type(elem, BaseField, 'element inside the content list')
                     fields.append(elem)
         fields.append(Static('</'))
         fields.append(Clone(value_field))
         fields.append(Static('>' + delimiter))
-        super(XmlElement, self).__init__(fields, name=name)
+        super(XmlElement, self).__init__(coalesce_statics(fields), name=name)
+
+
+#
+# Internal class, should not be used from the outside
+#
+class _XmlContext(object):
+
+    def __init__(self, fuzz_attributes, fuzz_content, fuzz_names):
+        self.fuzz_attributes = fuzz_attributes
+        self.fuzz_content = fuzz_content
+        self.fuzz_names = fuzz_names
+        self.idx = 0
+        self._names = set([])
+        # namespace uri -> prefix
+        self.prefixes = {}
+        # namespace declarations of the next element
+        self.declarations = []
+
+    def uname(self, name):
+        name = re.sub(r'[^\w.-]', '_', name)
+        if name in self._names:
+            base = name
+            while name in self._names:
+                name = '%s_%d' % (base, self.idx)
+                self.idx += 1
+        self._names.add(name)
+        return name
+
+    def qname(self, tag):
+        '''
+        :return: the prefixed name of an ElementTree tag (``{uri}local``)
+        '''
+        if tag[0] == '{':
+            uri, local = tag[1:].split('}', 1)
+            prefix = self.prefixes.get(uri)
+            if prefix:
+                return '%s:%s' % (prefix, local)
+            return local
+        return tag
+
+
+def _utf8(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+def _escape(text, quote=False):
+    return escape(_utf8(text), {'"': '&quot;'} if quote else {})
+
+
+def _release(elem):
+    '''
+    Free the content of a processed element.
+    The tail is kept, as it is part of the content of the parent element.
+    '''
+    elem.text = None
+    elem.attrib.clear()
+    del elem[:]
+
+
+def _should_fuzz(option, path):
+    if option is True or option is False:
+        return option
+    return any(fnmatch(path, pattern) for pattern in option)
+
+
+def _build_element(ctx, elem, path, attributes, children):
+    tag = _utf8(ctx.qname(elem.tag))
+    name = ctx.uname(tag)
+    fields = list(attributes)
+    for attr_key, attr_value in sorted(elem.attrib.items()):
+        attr_name = _utf8(ctx.qname(attr_key))
+        fields.append(XmlAttribute(
+            name=ctx.uname('%s_%s' % (name, attr_name)),
+            attribute=attr_name,
+            value=_escape(attr_value, quote=True),
+            fuzz_value=_should_fuzz(ctx.fuzz_attributes, '%s/@%s' % (path, attr_name)),
+        ))
+    fuzz_content = _should_fuzz(ctx.fuzz_content, path)
+    text = _escape(elem.text or '')
+    if not children:
+        content = text or None
+    else:
+        # mixed content: the text before, between and after the child elements
+        content = []
+        texts = [text] + [_escape(child.tail or '') for child in elem]
+        for i, child_field in enumerate([None] + children):
+            if child_field is not None:
+                content.append(child_field)
+            if texts[i].strip():
+                content.append(String(texts[i], fuzzable=fuzz_content, name='%s_text_%d' % (name, i)))
+            elif texts[i]:
+                content.append(Static(texts[i]))
+    return XmlElement(
+        name=name, element_name=tag, attributes=fields, content=content,
+        fuzz_name=ctx.fuzz_names, fuzz_content=fuzz_content
+    )
+
+
+def xml_to_template(source, name=None, fuzz_attributes=True, fuzz_content=True, fuzz_names=False):
+    '''
+    Create a template from an XML document.
+
+    The document is parsed with ``iterparse``, and each element is cleared
+    once its field is built, so big documents are not held in memory twice.
+    The rendered document is the parsed document with normalized attribute order,
+    quoting and escaping, without the XML declaration, comments and
+    processing instructions.
+
+    Elements and attributes are selected for fuzzing by their path, in the form
+    ``/root/element`` and ``/root/element/@attribute``.
+
+    :param source: file name or file object of the XML document
+    :param name: name of the template (default: None - the name of the root element)
+    :type fuzz_attributes: bool or list of str
+    :param fuzz_attributes: should the attribute values be fuzzed, or a list of
+        fnmatch patterns of the attribute paths to fuzz (default: True)
+    :type fuzz_content: bool or list of str
+    :param fuzz_content: should the text content of the elements be fuzzed, or a list of
+        fnmatch patterns of the element paths whose content is fuzzed (default: True)
+    :param fuzz_names: should the element names be fuzzed (default: False)
+    :rtype: :class:`~kitty.model.high_level.template.Template`
+    :return: template of the XML document
+
+    :example:
+
+        ::
+
+            xml_to_template('config.xml', fuzz_attributes=['*/@id'], fuzz_content=['/config/user/*'])
+    '''
+    ctx = _XmlContext(fuzz_attributes, fuzz_content, fuzz_names)
+    # each entry is (element, path, namespace declarations, child fields)
+    stack = []
+    root_field = None
+    for event, item in cElementTree.iterparse(source, events=('start', 'end', 'start-ns')):
+        if event == 'start-ns':
+            prefix, uri = item
+            ctx.prefixes.setdefault(uri, prefix)
+            ctx.declarations.append((prefix, uri))
+        elif event == 'start':
+            parent_path = stack[-1][1] if stack else ''
+            path = '%s/%s' % (parent_path, ctx.qname(item.tag))
+            declarations = []
+            for prefix, uri in ctx.declarations:
+                attribute = 'xmlns:%s' % prefix if prefix else 'xmlns'
+                declarations.append(XmlAttribute(
+                    name=ctx.uname(attribute), attribute=attribute,
+                    value=_escape(uri, quote=True), fuzz_value=False
+                ))
+            ctx.declarations = []
+            stack.append((item, path, declarations, []))
+        else:
+            elem, path, declarations, children = stack.pop()
+            field = _build_element(ctx, elem, path, declarations, children)
+            _release(elem)
+            if stack:
+                stack[-1][3].append(field)
+            else:
+                root_field = field
+    return Template(name=name if name else root_field.get_name(), fields=root_field)
 
 
 if __name__ == '__main__':
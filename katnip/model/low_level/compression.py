@@ -0,0 +1,151 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Compression encoders.
+
+The compressed values are kept in a bounded cache, so sections that did not
+change between tests (e.g. compressed chunks of a template that are not
+mutated) are not compressed again.
+This module does not require pycrypto.
+
+External dependencies that are not installed by default:
+backports.lzma (for LzmaCompressEncoder on python 2)
+'''
+
+import bz2
+import hashlib
+import zlib
+from collections import OrderedDict
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+from bitstring import Bits
+from kitty.model.low_level.encoder import StrEncoder
+from kitty.core import KittyException
+
+
+class CompressEncoder(StrEncoder):
+    '''
+    Generic compression encoder.
+    The compressed values are kept in a bounded cache, keyed by the hash
+    of the input, so values that did not change between tests are not
+    compressed again.
+    '''
+    _default_level_ = None
+
+    def __init__(self, level=None, cache_size=64):
+        '''
+        :param level: compression level, if None - use the default level of the compressor
+        :param cache_size: max number of compressed values to cache, 0 to disable (default: 64)
+        '''
+        super(CompressEncoder, self).__init__()
+        self.level = self._default_level_ if level is None else level
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _compress(self, data):
+        raise NotImplementedError('should be implemented in subclass')
+
+    def encode(self, data):
+        if not self.cache_size:
+            return Bits(bytes=self._compress(data))
+        key = hashlib.sha1(data).digest()
+        encoded = self._cache.pop(key, None)
+        if encoded is None:
+            encoded = Bits(bytes=self._compress(data))
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[key] = encoded
+        return encoded
+
+    def encode_many(self, values):
+        '''
+        Compress a list of values, each distinct value is compressed once.
+
+        :param values: list of values to compress
+        :return: list of compressed values (Bits)
+        '''
+        encoded = {}
+        results = []
+        for value in values:
+            if value not in encoded:
+                encoded[value] = self.encode(value)
+            results.append(encoded[value])
+        return results
+
+
+class ZlibCompressEncoder(CompressEncoder):
+    '''
+    Compress the value with zlib (zlib header and checksum).
+    See :class:`~katnip.model.low_level.compression.CompressEncoder` for parameters.
+    '''
+    _default_level_ = zlib.Z_DEFAULT_COMPRESSION
+    _wbits_ = zlib.MAX_WBITS
+
+    def _compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self._wbits_)
+        return compressor.compress(data) + compressor.flush()
+
+
+class DeflateCompressEncoder(ZlibCompressEncoder):
+    '''
+    Compress the value to a raw deflate stream (no header or checksum).
+    See :class:`~katnip.model.low_level.compression.CompressEncoder` for parameters.
+    '''
+    _wbits_ = -zlib.MAX_WBITS
+
+
+class GzipCompressEncoder(ZlibCompressEncoder):
+    '''
+    Compress the value to a gzip stream.
+    The gzip header has no file name and a zero timestamp,
+    so the result is the same in every run.
+    See :class:`~katnip.model.low_level.compression.CompressEncoder` for parameters.
+    '''
+    _wbits_ = zlib.MAX_WBITS | 16
+
+
+class Bz2CompressEncoder(CompressEncoder):
+    '''
+    Compress the value with bzip2.
+    See :class:`~katnip.model.low_level.compression.CompressEncoder` for parameters.
+    '''
+    _default_level_ = 9
+
+    def _compress(self, data):
+        return bz2.compress(data, self.level)
+
+
+class LzmaCompressEncoder(CompressEncoder):
+    '''
+    Compress the value to an xz stream.
+    Requires lzma (backports.lzma on python 2).
+    See :class:`~katnip.model.low_level.compression.CompressEncoder` for parameters.
+    '''
+    _default_level_ = 6
+
+    def __init__(self, level=None, cache_size=64):
+        if lzma is None:
+            raise KittyException('LzmaCompressEncoder requires lzma (backports.lzma on python 2)')
+        super(LzmaCompressEncoder, self).__init__(level, cache_size)
+
+    def _compress(self, data):
+        return lzma.compress(data, preset=self.level)
@@ -0,0 +1,203 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Containers with a render cache, and an encrypting container.
+
+Kitty renders a container from its default buffer only when all its
+fields are default, and calculated fields (sizes, checksums) are never
+default. So every container that holds a calculated field is rendered
+on every test, even when nothing inside it changed.
+:class:`CachedContainer` keeps its last default render and reuses it
+until one of its fields is mutated, so a render walks only the path
+from the mutated field to the root and the siblings along it.
+
+:class:`NonceEncrypted` encrypts its rendered fields with a nonce that
+is derived from its mutation index.
+'''
+from __future__ import absolute_import
+from binascii import hexlify
+from kitty.core import KittyException
+from kitty.model import Container, Dynamic, Conditional, OneOf, ForEach
+from kitty.model import ENC_BITS_DEFAULT
+from kitty.model import AbsoluteOffset, Calculated
+
+
+def _descendants(field, skip_default=False):
+    '''
+    :param skip_default: do not go into containers that are in their default form,
+        as they are rendered without rendering their fields (default: False)
+    :return: generator of the field and all the fields it encloses
+    '''
+    yield field
+    if isinstance(field, Container):
+        if skip_default and field.is_default():
+            return
+        for child in field._fields:
+            for descendant in _descendants(child, skip_default):
+                yield descendant
+
+
+class CachedContainer(Container):
+    '''
+    Container that caches its rendered value while none of its fields
+    is mutated.
+    The cache is used only when the container is self-contained - all
+    calculated fields inside it depend on fields inside it, and it does
+    not hold fields whose value may change without being mutated.
+    Otherwise it renders like a regular container.
+    '''
+
+    # fields whose value may change while the container is not mutated
+    _uncacheable_types_ = (Dynamic, Conditional, OneOf, ForEach, AbsoluteOffset)
+
+    def __init__(self, fields=[], encoder=ENC_BITS_DEFAULT, fuzzable=True, name=None):
+        '''
+        See :class:`~kitty.model.low_level.container.Container` for parameters.
+        '''
+        super(CachedContainer, self).__init__(fields=fields, encoder=encoder, fuzzable=fuzzable, name=name)
+        self._clear_cache()
+
+    def _clear_cache(self):
+        self._self_contained = None
+        self._cached_rendered = None
+        self._cached_fields = None
+        # offset of the container when the state of the enclosed fields
+        # was last stored or restored, None if it was changed since then
+        self._synced_offset = None
+
+    def copy(self):
+        dup = super(CachedContainer, self).copy()
+        dup._clear_cache()
+        return dup
+
+    def push(self, field):
+        self._clear_cache()
+        return super(CachedContainer, self).push(field)
+
+    def reset(self):
+        self._synced_offset = None
+        super(CachedContainer, self).reset()
+
+    def _is_self_contained(self):
+        '''
+        :return: True if the default render of the container depends only on fields inside it
+        '''
+        if self._self_contained is None:
+            fields = list(_descendants(self))
+            field_ids = set(id(field) for field in fields)
+            self._self_contained = True
+            for field in fields:
+                if isinstance(field, self._uncacheable_types_):
+                    self._self_contained = False
+                elif isinstance(field, Calculated):
+                    field._initialize()
+                    if id(field._field) not in field_ids:
+                        self._self_contained = False
+                if not self._self_contained:
+                    break
+        return self._self_contained
+
+    def render(self, ctx=None):
+        if self._mutating() or self._controlled or not self._is_self_contained():
+            self._synced_offset = None
+            return super(CachedContainer, self).render(ctx)
+        if self._cached_rendered is None:
+            # start from the default values of the enclosed fields, and render twice,
+            # so sizes are calculated from the rendered values
+            offset = self.offset
+            self.reset()
+            self.offset = offset
+            super(CachedContainer, self).render(ctx)
+            self._cached_rendered = super(CachedContainer, self).render(ctx)
+            self._cached_fields = [
+                (field, None if field.offset is None else field.offset - self.offset, field._current_rendered)
+                for field in _descendants(self, skip_default=True) if field is not self
+            ]
+            self._synced_offset = self.offset
+        else:
+            # restore the state of the enclosed fields, as if they were rendered,
+            # unless it was not changed since the last render
+            if self.offset is None:
+                self.offset = 0
+            if self._synced_offset != self.offset:
+                for field, relative_offset, rendered in self._cached_fields:
+                    field._current_rendered = rendered
+                    if relative_offset is not None:
+                        field.set_offset(self.offset + relative_offset)
+                self._synced_offset = self.offset
+            self._current_rendered = self._cached_rendered
+        return self._current_rendered
+
+
+class NonceEncrypted(Container):
+    '''
+    Container whose rendered value is encrypted with a
+    :class:`~katnip.model.low_level.encoder.NonceCipherEncoder`.
+    The mutation index of the container (-1 for the default value) is
+    passed to the nonce provider of the cipher, so the nonce of each test
+    does not depend on the tests that were rendered before it,
+    and the nonce is added to the report.
+
+    :example:
+
+        ::
+
+            NonceEncrypted(
+                fields=[String('payload', name='payload')],
+                cipher=AesCtrEncoder(key='\\x01' * 16, nonce_provider=counter_nonce_provider()),
+                name='encrypted payload'
+            )
+    '''
+
+    def __init__(self, fields=[], cipher=None, fuzzable=True, name=None):
+        '''
+        :param fields: enclosed field(s) (default: [])
+        :type cipher: :class:`~katnip.model.low_level.encoder.NonceCipherEncoder`
+        :param cipher: the encoder to encrypt the rendered fields with
+        :param fuzzable: is container fuzzable (default: True)
+        :param name: (unique) name of the container (default: None)
+        '''
+        if cipher is None:
+            raise KittyException('NonceEncrypted requires a cipher')
+        self._cipher = cipher
+        self._current_nonce = None
+        self._default_nonce = None
+        # the base class encodes an empty default value before it sets the index
+        self._current_index = -1
+        super(NonceEncrypted, self).__init__(fields=fields, encoder=ENC_BITS_DEFAULT, fuzzable=fuzzable, name=name)
+
+    def _initialize_default_buffer(self):
+        rendered = super(NonceEncrypted, self)._initialize_default_buffer()
+        if self.is_default():
+            self._default_nonce = self._current_nonce
+        return rendered
+
+    def _encode_value(self, value):
+        encoded = self._cipher.encode(value.tobytes(), self._current_index)
+        self._current_nonce = self._cipher.current_nonce
+        return encoded
+
+    def reset(self):
+        super(NonceEncrypted, self).reset()
+        self._current_nonce = self._default_nonce
+
+    def get_info(self):
+        info = super(NonceEncrypted, self).get_info()
+        if self._current_nonce is not None:
+            info['nonce'] = hexlify(self._current_nonce)
+        return info
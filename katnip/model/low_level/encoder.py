@@ -22,50 +22,101 @@ because they are too esoteric or because they require external
 dependencies that might be harder to install on some platforms.
 
 External dependencies that are not installed by default:
-pycrypto
+pycrypto (pycryptodome for AES-GCM and ChaCha20)
+
+The module can be imported without pycrypto, the cipher encoders raise
+an exception when they are created.
+The compression encoders are in :mod:`katnip.model.low_level.compression`,
+which does not require pycrypto, they are imported here as well
+for backward compatibility.
 '''
 
-from Crypto.Cipher import AES, DES, DES3
+import random
+from binascii import hexlify
+from collections import OrderedDict
 from bitstring import Bits
 from kitty.model.low_level.encoder import StrEncoder
 from kitty.core import KittyException
+from katnip.model.low_level.compression import CompressEncoder, ZlibCompressEncoder, DeflateCompressEncoder
+from katnip.model.low_level.compression import GzipCompressEncoder, Bz2CompressEncoder, LzmaCompressEncoder
 
 
-class BlockCipherEncoder(StrEncoder):
+class _MissingCipher(object):
     '''
-    Generic block cipher encoder.
+    Stands for a Crypto cipher module when pycrypto is not installed,
+    it holds the mode constants that are used in class definitions
+    '''
+    MODE_ECB = 1
+    MODE_CBC = 2
+
+
+try:
+    from Crypto.Cipher import AES, DES, DES3
+    from Crypto.Util import Counter
+    _has_crypto = True
+except ImportError:
+    AES = DES = DES3 = _MissingCipher
+    Counter = None
+    _has_crypto = False
+try:
+    from Crypto.Cipher import ChaCha20
+except ImportError:
+    ChaCha20 = None
+
+
+def _view(data, offset, length):
+    '''
+    :return: read-only view of data[offset:offset + length], without copying it
+    '''
+    try:
+        return buffer(data, offset, length)
+    except NameError:
+        return memoryview(data)[offset:offset + length]
+
+
+def encode_many(encoder, values):
+    '''
+    Encode a list of values with an encoder.
+    Uses the encoder's own encode_many if it has one,
+    otherwise calls encode for each value.
+
+    :param encoder: the encoder to use
+    :param values: list of values to encode
+    :return: list of encoded values (Bits)
+    '''
+    if hasattr(encoder, 'encode_many'):
+        return encoder.encode_many(values)
+    return [encoder.encode(value) for value in values]
+
+
+class CipherEncoder(StrEncoder):
+    '''
+    Generic cipher encoder, handles the key and key provider.
     '''
     _key_sizes_ = None
-    _iv_size_ = None
-    _block_size_ = None
     _default_key_size_ = None
-    _default_mode_ = None
 
-    def __init__(self, key=None, iv=None, mode=None, key_size=None, key_provider=None, padder=None):
+    def __init__(self, key=None, key_size=None, key_provider=None, key_policy='always'):
         '''
-        All fields default to None.
         :type key: str
-        :param key: encryption key, must be 8 bytes
-        :param iv: iv, must be 8 bytes long, if None - use zeros
-        :param mode: encrytion mode
+        :param key: encryption key
         :param key_size: size of key, should be provided only when using key provider
         :type key_provider: function(key_size) -> str
         :param key_provider: function that returns key
-        :type padder: function(str, block_size) -> str
-        :param padder: function that pads the data, if None - will pad with zeros
+        :param key_policy: when to call key_provider - 'always' (each encode), 'once',
+            or a number of encodes to use each provided key for (default: 'always')
         '''
+        if not _has_crypto:
+            raise KittyException('%s requires pycrypto (or pycryptodome)' % type(self).__name__)
         self.key = key
-        self.iv = iv
-        self.mode = mode
         self.key_size = key_size
         self.key_provider = key_provider
-        self.padder = padder
-        self._check_args()
+        self.key_policy = key_policy
+        self.current_key = None
+        self._key_uses = 0
+        self._check_key_args()
 
-    def _check_args(self):
-        '''
-        This is a massive check. argh...
-        '''
+    def _check_key_args(self):
         if self.key:
             if len(self.key) not in self._key_sizes_:
                 raise KittyException('provided key size (%d) not in %s' % (len(self.key), self._key_sizes_))
@@ -83,6 +134,56 @@ class BlockCipherEncoder(StrEncoder):
                 raise KittyException('key size (%d) not a valid one (use %s)' % (self.key_size, self._key_sizes_))
         else:
             raise KittyException('You need to provide either key or key_provider')
+        if self.key_policy not in ('always', 'once'):
+            if not isinstance(self.key_policy, int) or self.key_policy < 1:
+                raise KittyException('key_policy should be \'always\', \'once\' or a positive number, got %s' % (self.key_policy,))
+
+    def _get_key(self):
+        '''
+        :return: the key for the current encode, calls key_provider according to key_policy
+        '''
+        if not self.key_provider:
+            return self.key
+        if self.current_key is None or self.key_policy == 'always' or self._key_uses == self.key_policy:
+            self.current_key = self.key_provider(self.key_size)
+            self._key_uses = 0
+        self._key_uses += 1
+        return self.current_key
+
+
+class BlockCipherEncoder(CipherEncoder):
+    '''
+    Generic block cipher encoder.
+    '''
+    _iv_size_ = None
+    _block_size_ = None
+    _default_mode_ = None
+    # number of cipher objects to keep for stateless modes
+    _cipher_cache_size_ = 16
+
+    def __init__(self, key=None, iv=None, mode=None, key_size=None, key_provider=None, padder=None, key_policy='always'):
+        '''
+        All fields default to None.
+        :type key: str
+        :param key: encryption key, must be 8 bytes
+        :param iv: iv, must be 8 bytes long, if None - use zeros
+        :param mode: encrytion mode
+        :param key_size: size of key, should be provided only when using key provider
+        :type key_provider: function(key_size) -> str
+        :param key_provider: function that returns key
+        :type padder: function(str, block_size) -> str
+        :param padder: function that pads the data, if None - will pad with zeros
+        :param key_policy: when to call key_provider - 'always' (each encode), 'once',
+            or a number of encodes to use each provided key for (default: 'always')
+        '''
+        self.iv = iv
+        self.mode = mode
+        self.padder = padder
+        self._ciphers = OrderedDict()
+        super(BlockCipherEncoder, self).__init__(key, key_size, key_provider, key_policy)
+        self._check_args()
+
+    def _check_args(self):
         if not self.iv:
             self.iv = '\x00' * self._iv_size_
         if len(self.iv) != self._iv_size_:
@@ -92,6 +193,75 @@ class BlockCipherEncoder(StrEncoder):
         if self.mode is None:
             self.mode = self._default_mode_
 
+    def _get_cipher(self, key):
+        '''
+        :return: a cipher object for the key.
+            In ECB mode, cipher objects are stateless, so they are cached per key
+            and the key schedule is computed once. In CBC mode the cipher object
+            keeps the chaining state, so the cached object gets its IV reset
+            before it is used. In the other chained modes a new one is created.
+        '''
+        mode = self.mode
+        if mode not in (self._cipher_class_.MODE_ECB, self._cipher_class_.MODE_CBC):
+            return self._cipher_class_.new(key=key, mode=mode, IV=self.iv)
+        cipher = self._ciphers.get(key)
+        if cipher is None:
+            if len(self._ciphers) >= self._cipher_cache_size_:
+                self._ciphers.popitem(last=False)
+            cipher = self._cipher_class_.new(key=key, mode=mode, IV=self.iv)
+            self._ciphers[key] = cipher
+        elif mode == self._cipher_class_.MODE_CBC:
+            try:
+                # pycrypto restarts the chain when the IV is set
+                cipher._cipher.IV = self.iv
+            except (AttributeError, TypeError):
+                cipher = self._cipher_class_.new(key=key, mode=mode, IV=self.iv)
+                self._ciphers[key] = cipher
+        return cipher
+
+    def _prepare(self, data):
+        '''
+        :return: the data that should be passed to the cipher
+        '''
+        raise NotImplementedError('should be implemented in subclass')
+
+    def _crypt(self, cipher, data):
+        raise NotImplementedError('should be implemented in subclass')
+
+    def encode(self, data):
+        cipher = self._get_cipher(self._get_key())
+        return Bits(bytes=self._crypt(cipher, self._prepare(data)))
+
+    def encode_many(self, values):
+        '''
+        Encode a list of values.
+        The key provider is called exactly as it would have been for
+        sequential encode calls. In ECB mode, consecutive values that use
+        the same key are processed by the cipher in a single call.
+
+        :param values: list of values to encode
+        :return: list of encoded values (Bits)
+        '''
+        prepared = [self._prepare(value) for value in values]
+        keys = [self._get_key() for _ in prepared]
+        if self.mode != self._cipher_class_.MODE_ECB:
+            return [Bits(bytes=self._crypt(self._get_cipher(key), data)) for key, data in zip(keys, prepared)]
+        results = []
+        start = 0
+        while start < len(prepared):
+            end = start + 1
+            while end < len(prepared) and keys[end] == keys[start]:
+                end += 1
+            crypted = self._crypt(self._get_cipher(keys[start]), ''.join(prepared[start:end]))
+            offset = 0
+            for data in prepared[start:end]:
+                # Bits copies the view into its own store, so the output
+                # of the cipher is not sliced into intermediate strings
+                results.append(Bits(bytes=_view(crypted, offset, len(data))))
+                offset += len(data)
+            start = end
+        return results
+
     def _zero_padder(self, data, blocksize):
         remainder = len(data) % self._block_size_
         if remainder:
@@ -104,13 +274,11 @@ class BlockEncryptEncoder(BlockCipherEncoder):
     Generic block cipher encryption encoder.
     '''
 
-    def encode(self, data):
-        self.current_key = self.key
-        if self.key_provider:
-            self.current_key = self.key_provider(self.key_size)
-        cipher = self._cipher_class_.new(key=self.current_key, mode=self.mode, IV=self.iv)
-        encrypted = cipher.encrypt(self.padder(data, 16))
-        return Bits(bytes=encrypted)
+    def _prepare(self, data):
+        return self.padder(data, self._block_size_)
+
+    def _crypt(self, cipher, data):
+        return cipher.encrypt(data)
 
 
 class AesEncryptEncoder(BlockEncryptEncoder):
@@ -158,20 +326,13 @@ class BlockDecryptEncoder(BlockCipherEncoder):
     See :class:`~katnip.model.low_level.encoders.BlockCipherEncoder` for parameters.
     '''
 
-    def encode(self, data):
+    def _prepare(self, data):
         if len(data) % self._block_size_:
             raise KittyException('data must be %d-bytse aligned' % self._block_size_)
-        self.current_key = self.key
-        if self.key_provider:
-            self.current_key = self.key_provider(self.key_size)
-        cipher = self._cipher_class_.new(key=self.current_key, mode=self.mode, IV=self.iv)
-        decrypted = cipher.decrypt(data)
-        # print 'data', data.encode('hex')
-        # print 'decrypted', decrypted.encode('hex')
-        # print 'current key', self.current_key.encode('hex')
-        # print 'IV', self.iv.encode('hex')
-        # print 'mode', self.mode
-        return Bits(bytes=decrypted)
+        return data
+
+    def _crypt(self, cipher, data):
+        return cipher.decrypt(data)
 
 
 class AesDecryptEncoder(BlockDecryptEncoder):
@@ -213,33 +374,217 @@ class Des3DecryptEncoder(BlockDecryptEncoder):
     _cipher_class_ = DES3
 
 
-def AesCbcEncryptEncoder(key=None, iv=None, key_size=16, key_provider=None, padder=None):
+def AesCbcEncryptEncoder(key=None, iv=None, key_size=16, key_provider=None, padder=None, key_policy='always'):
     '''
     AES CBC Encrypt encoder.
     See :class:`~katnip.model.low_level.encoder.AesEncryptEncoder` for parameter description.
     '''
-    return AesEncryptEncoder(key, iv, AES.MODE_CBC, key_size, key_provider, padder)
+    return AesEncryptEncoder(key, iv, AES.MODE_CBC, key_size, key_provider, padder, key_policy)
 
 
-def AesEcbEncryptEncoder(key=None, iv=None, key_size=16, key_provider=None, padder=None):
+def AesEcbEncryptEncoder(key=None, iv=None, key_size=16, key_provider=None, padder=None, key_policy='always'):
     '''
     AES ECB Encrypt encoder.
     See :class:`~katnip.model.low_level.encoder.AesEncryptEncoder` for parameter description.
     '''
-    return AesEncryptEncoder(key, iv, AES.MODE_ECB, key_size, key_provider, padder)
+    return AesEncryptEncoder(key, iv, AES.MODE_ECB, key_size, key_provider, padder, key_policy)
 
 
-def AesCbcDecryptEncoder(key=None, iv=None, key_size=16, key_provider=None):
+def AesCbcDecryptEncoder(key=None, iv=None, key_size=16, key_provider=None, key_policy='always'):
     '''
     AES CBC Decrypt encoder.
     See :class:`~katnip.model.low_level.encoder.AesDecryptEncoder` for parameter description.
     '''
-    return AesDecryptEncoder(key, iv, AES.MODE_CBC, key_size, key_provider)
+    return AesDecryptEncoder(key, iv, AES.MODE_CBC, key_size, key_provider, key_policy=key_policy)
 
 
-def AesEcbDecryptEncoder(key=None, iv=None, key_size=16, key_provider=None):
+def AesEcbDecryptEncoder(key=None, iv=None, key_size=16, key_provider=None, key_policy='always'):
     '''
     AES ECB Decrypt encoder.
     See :class:`~katnip.model.low_level.encoder.AesDecryptEncoder` for parameter description.
     '''
-    return AesDecryptEncoder(key, iv, AES.MODE_ECB, key_size, key_provider)
+    return AesDecryptEncoder(key, iv, AES.MODE_ECB, key_size, key_provider, key_policy=key_policy)
+
+
+def _nonce_bytes(value, nonce_size):
+    return ''.join(chr((value >> (8 * i)) & 0xff) for i in reversed(range(nonce_size)))
+
+
+def counter_nonce_provider(start=0):
+    '''
+    :param start: nonce of the default value (default: 0)
+    :return: nonce provider that returns a big endian counter,
+        start + index + 1 for the mutation at index
+    '''
+    def provider(nonce_size, index):
+        if index is None:
+            raise KittyException('counter_nonce_provider needs the mutation index, use the encoder in a NonceEncrypted container')
+        return _nonce_bytes(start + index + 1, nonce_size)
+    return provider
+
+
+def random_nonce_provider(seed=0):
+    '''
+    :param seed: seed for the random generator (default: 0)
+    :return: nonce provider that returns random nonces, the nonce of each
+        mutation index depends only on the seed and the index
+    '''
+    rand = random.Random(seed)
+
+    def provider(nonce_size, index):
+        if index is None:
+            # no mutation index, use the next value of the seeded sequence
+            return ''.join(chr(rand.randint(0, 0xff)) for _ in range(nonce_size))
+        return _nonce_bytes(random.Random(seed * 0x100000000 + index).getrandbits(nonce_size * 8), nonce_size)
+    return provider
+
+
+class NonceCipherEncoder(CipherEncoder):
+    '''
+    Generic encoder for stream and AEAD ciphers.
+    The data is not padded, and a new cipher state is used for each encode.
+    The key and nonce that were used in the last encode are kept in
+    current_key and current_nonce, and are reported by :meth:`get_info`.
+    To derive the nonce from the mutation index and add it to the report,
+    wrap the encrypted fields with
+    :class:`~katnip.model.low_level.container.NonceEncrypted`.
+    '''
+    _nonce_sizes_ = None
+    _default_nonce_size_ = None
+
+    def __init__(self, key=None, nonce=None, key_size=None, key_provider=None, nonce_size=None, nonce_provider=None, key_policy='always'):
+        '''
+        :type key: str
+        :param key: encryption key
+        :param nonce: nonce, if None and no nonce_provider - use zeros
+        :param key_size: size of key, should be provided only when using key provider
+        :type key_provider: function(key_size) -> str
+        :param key_provider: function that returns key
+        :param nonce_size: size of nonce, should be provided only when using nonce provider
+        :type nonce_provider: function(nonce_size, index) -> str
+        :param nonce_provider: function that returns a nonce, called for each encode with the
+            mutation index (-1 for the default value, None if not known)
+            (see :func:`counter_nonce_provider` and :func:`random_nonce_provider`)
+        :param key_policy: when to call key_provider - 'always' (each encode), 'once',
+            or a number of encodes to use each provided key for (default: 'always')
+        '''
+        self.nonce = nonce
+        self.nonce_size = nonce_size
+        self.nonce_provider = nonce_provider
+        self.current_nonce = None
+        super(NonceCipherEncoder, self).__init__(key, key_size, key_provider, key_policy)
+        self._check_nonce_args()
+
+    def _check_nonce_args(self):
+        if self.nonce_provider:
+            if self.nonce:
+                raise KittyException('You should not provide both nonce and nonce_provider.')
+            if not callable(self.nonce_provider):
+                raise KittyException('nonce_provider must be callable')
+            if not self.nonce_size:
+                self.nonce_size = self._default_nonce_size_
+        else:
+            if not self.nonce:
+                self.nonce = '\x00' * self._default_nonce_size_
+            self.nonce_size = len(self.nonce)
+        if self.nonce_size not in self._nonce_sizes_:
+            raise KittyException('nonce size (%d) not a valid one (use %s)' % (self.nonce_size, self._nonce_sizes_))
+
+    def _get_nonce(self, index):
+        '''
+        :param index: mutation index, None if not known
+        :return: the nonce for the current encode
+        '''
+        if self.nonce_provider:
+            self.current_nonce = self.nonce_provider(self.nonce_size, index)
+        else:
+            self.current_nonce = self.nonce
+        return self.current_nonce
+
+    def _encrypt(self, key, nonce, data):
+        raise NotImplementedError('should be implemented in subclass')
+
+    def encode(self, data, index=None):
+        '''
+        :param data: data to encrypt
+        :param index: mutation index of the encrypted value, passed to the nonce provider (default: None)
+        '''
+        return Bits(bytes=self._encrypt(self._get_key(), self._get_nonce(index), data))
+
+    def get_info(self):
+        '''
+        :return: the key and nonce that were used in the last encode, hex encoded
+        '''
+        info = {}
+        if self.current_key is not None:
+            info['key'] = hexlify(self.current_key)
+        if self.current_nonce is not None:
+            info['nonce'] = hexlify(self.current_nonce)
+        return info
+
+
+class AesCtrEncoder(NonceCipherEncoder):
+    '''
+    AES-CTR encryption encoder.
+    The nonce is the prefix of the counter block, the rest of the block
+    is a big endian block counter that starts from zero.
+    See :class:`~katnip.model.low_level.encoder.NonceCipherEncoder` for parameters.
+    '''
+    _key_sizes_ = [16, 24, 32]
+    _default_key_size_ = 16
+    _nonce_sizes_ = [4, 8, 12]
+    _default_nonce_size_ = 8
+
+    def _encrypt(self, key, nonce, data):
+        counter = Counter.new(128 - len(nonce) * 8, prefix=nonce, initial_value=0)
+        return AES.new(key=key, mode=AES.MODE_CTR, counter=counter).encrypt(data)
+
+
+class AesGcmEncoder(NonceCipherEncoder):
+    '''
+    AES-GCM encryption encoder, the tag is appended to the encrypted data.
+    Requires pycryptodome.
+    See :class:`~katnip.model.low_level.encoder.NonceCipherEncoder` for parameters.
+    '''
+    _key_sizes_ = [16, 24, 32]
+    _default_key_size_ = 16
+    _nonce_sizes_ = [12, 16]
+    _default_nonce_size_ = 12
+
+    def __init__(self, key=None, nonce=None, key_size=None, key_provider=None, nonce_size=None, nonce_provider=None, key_policy='always', aad=None):
+        '''
+        :param aad: additional authenticated data (default: None)
+
+        See :class:`~katnip.model.low_level.encoder.NonceCipherEncoder` for other parameters.
+        '''
+        if not hasattr(AES, 'MODE_GCM'):
+            raise KittyException('AES-GCM is not supported by the installed Crypto package, use pycryptodome')
+        self.aad = aad
+        super(AesGcmEncoder, self).__init__(key, nonce, key_size, key_provider, nonce_size, nonce_provider, key_policy)
+
+    def _encrypt(self, key, nonce, data):
+        cipher = AES.new(key=key, mode=AES.MODE_GCM, nonce=nonce)
+        if self.aad:
+            cipher.update(self.aad)
+        encrypted, tag = cipher.encrypt_and_digest(data)
+        return encrypted + tag
+
+
+class ChaCha20Encoder(NonceCipherEncoder):
+    '''
+    ChaCha20 encryption encoder.
+    Requires pycryptodome.
+    See :class:`~katnip.model.low_level.encoder.NonceCipherEncoder` for parameters.
+    '''
+    _key_sizes_ = [32]
+    _default_key_size_ = 32
+    _nonce_sizes_ = [8, 12]
+    _default_nonce_size_ = 12
+
+    def __init__(self, key=None, nonce=None, key_size=None, key_provider=None, nonce_size=None, nonce_provider=None, key_policy='always'):
+        if ChaCha20 is None:
+            raise KittyException('ChaCha20 is not supported by the installed Crypto package, use pycryptodome')
+        super(ChaCha20Encoder, self).__init__(key, nonce, key_size, key_provider, nonce_size, nonce_provider, key_policy)
+
+    def _encrypt(self, key, nonce, data):
+        return ChaCha20.new(key=key, nonce=nonce).encrypt(data)
@@ -3,13 +3,595 @@ FS iterators contains fields that are based on files.
 
 * :class:`katnip.templates.fs_iterators.FsNames` will return file names from the system based on its configuration.
 * :class:`katnip.templates.fs_iterators.FsContent` will return the content of files from the system.
+Both fields can also iterate over the members of a zip or tar (optionally compressed) archive.
 
+* :class:`katnip.templates.fs_iterators.FsPackContent` will return the content of files from a corpus pack,
+  that is built from a directory by :func:`katnip.templates.fs_iterators.build_corpus_pack`.
+
+FsNames and FsContent accept the following iteration options as keyword arguments:
+
+:manifest: path of a manifest file to cache the directory listing in (default: None)
+:shard_index: index of the shard of the files to iterate over (default: 0)
+:shard_count: number of shards to split the files into, so multiple processes
+    can cover the files exactly once (default: 1)
+:shard_by: split the files by 'hash' of their relative path or by index 'range' (default: 'hash')
+:dedup: drop files with the same content as a previous file (default: False)
+:max_size: drop files that are larger than this size in bytes (default: None)
+:dedup_cache: path of a file to cache the file hashes in between runs (default: None)
+:watch: append files that are added to the directory later, using inotify (Linux only).
+    The number of mutations grows accordingly, but containers count the
+    mutations of their fields once, when initialized (default: False)
+:order_by: None for path order, 'size' for smallest first, 'size_buckets' for round robin over
+    power of two size buckets, 'exec_time' for fastest first, based on timing_file (default: None)
+:timing_file: path of a file to record the time spent on each file in (default: None)
 '''
 import os
+import sys
+import atexit
+import ctypes
+import ctypes.util
+import errno
+import json
+import hashlib
+import mmap
+import shutil
+import struct
+import time
+import tarfile
+import tempfile
+import weakref
+import zipfile
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import closing
 from fnmatch import fnmatch
+from threading import Lock, Thread
+from bitstring import Bits
 from kitty.core import KittyObject, KittyException
 from kitty.model.low_level import BaseField
 from kitty.model.low_level import ENC_STR_DEFAULT, StrEncoder
+from Queue import Queue
+
+
+def _scan_dir(path, name_filter, files_only):
+    '''
+    :param path: directory to list
+    :param name_filter: string to filter filenames, same as shell, not regex
+    :param files_only: should subdirectories be left out of the file list
+    :return: tuple (subdirectories, list of (filename, size, mtime)),
+        subdirectories do not include symbolic links
+    '''
+    dirs = []
+    entries = []
+    for name in os.listdir(path):
+        full_path = os.path.join(path, name)
+        is_dir = os.path.isdir(full_path)
+        if is_dir and not os.path.islink(full_path):
+            dirs.append(name)
+        if (files_only and is_dir) or not fnmatch(name, name_filter):
+            continue
+        try:
+            st = os.stat(full_path)
+            entries.append((name, st.st_size, st.st_mtime))
+        except OSError:
+            entries.append((name, 0, 0.0))
+    return dirs, entries
+
+
+class _FsManifest(object):
+    '''
+    Sorted, on-disk listing of the files that match a filter in a directory,
+    it is memory-mapped for lookups.
+
+    The manifest is reused as long as the directories that were scanned to
+    build it have not changed (based on their mtime), so changes to the
+    content of existing files are not detected.
+
+    File structure::
+
+        magic | header length (uint32) | json header | records | names
+
+    The header holds the scan parameters and the scanned directories,
+    the records are fixed size (offset of the name in the names of its
+    directory, name length, file size, file mtime) and sorted in
+    iteration order.
+    '''
+
+    _magic_ = 'KATNIP-FSM\x01'
+    _header_len_ = struct.Struct('<I')
+    _record_ = struct.Struct('<IIQd')
+    _header_padding_ = 64
+
+    def __init__(self, manifest_path, path, name_filter, recurse):
+        '''
+        :param manifest_path: path of the manifest file
+        :param path: base path to iterate over files
+        :param name_filter: string to filter filenames, same as shell, not regex
+        :param recurse: should iterate inner directories
+        '''
+        self._manifest_path = manifest_path
+        self._params = {'path': path, 'name_filter': name_filter, 'recurse': recurse}
+        self._file = None
+        self._mmap = None
+        if not self._load():
+            self._build()
+            if not self._load():
+                raise KittyException('Failed to load manifest %s' % manifest_path)
+
+    def _load(self):
+        '''
+        :return: True if the manifest exists and is up to date
+        '''
+        if not os.path.exists(self._manifest_path):
+            return False
+        with open(self._manifest_path, 'rb') as f:
+            if f.read(len(self._magic_)) != self._magic_:
+                return False
+            header_len, = self._header_len_.unpack(f.read(self._header_len_.size))
+            try:
+                header = json.loads(f.read(header_len))
+            except ValueError:
+                return False
+        # compare through json, as the loaded strings are unicode in python 2
+        if header['params'] != json.loads(json.dumps(self._params)):
+            return False
+        for dirpath, mtime in header['scanned']:
+            try:
+                if os.stat(dirpath).st_mtime != mtime:
+                    return False
+            except OSError:
+                return False
+        self.close()
+        self._file = open(self._manifest_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._records_offset = len(self._magic_) + self._header_len_.size + header_len
+        self._names_offset = self._records_offset + header['count'] * self._record_.size
+        self.path_list = [self._native_str(d[0]) for d in header['dirs']]
+        self.offsets = [d[1] for d in header['dirs']]
+        self._names_bases = [self._names_offset + d[2] for d in header['dirs']]
+        self.count = header['count']
+        return True
+
+    def _native_str(self, s):
+        if not isinstance(s, str):
+            s = s.encode('utf-8')
+        return s
+
+    def _build(self):
+        '''
+        Scan the directory and write the manifest.
+        Records and names are written directory by directory to temporary
+        files, so only the listing of a single directory is kept in memory.
+        '''
+        path = self._params['path']
+        name_filter = self._params['name_filter']
+        recurse = self._params['recurse']
+        manifest_dir, manifest_name = os.path.split(os.path.abspath(self._manifest_path))
+        scanned = []
+        chunks = {}
+        records_tmp = tempfile.TemporaryFile()
+        names_tmp = tempfile.TemporaryFile()
+        try:
+            pending = [path]
+            while pending:
+                dirpath = pending.pop()
+                scanned.append([dirpath, os.stat(dirpath).st_mtime])
+                dirs, entries = _scan_dir(dirpath, name_filter, recurse)
+                if recurse:
+                    pending.extend(os.path.join(dirpath, d) for d in dirs)
+                if os.path.abspath(dirpath) == manifest_dir:
+                    entries = [e for e in entries if e[0] != manifest_name]
+                if not entries and recurse:
+                    continue
+                entries.sort()
+                records_start = records_tmp.tell()
+                names_start = names_tmp.tell()
+                name_offset = 0
+                for name, size, mtime in entries:
+                    records_tmp.write(self._record_.pack(name_offset, len(name), size, mtime))
+                    names_tmp.write(name)
+                    name_offset += len(name)
+                chunks[dirpath] = (records_start, len(entries), names_start, name_offset)
+            dir_list = []
+            count = 0
+            names_len = 0
+            for dirpath in sorted(chunks):
+                _, num_entries, _, dir_names_len = chunks[dirpath]
+                dir_list.append([dirpath, count, names_len])
+                count += num_entries
+                names_len += dir_names_len
+            header = {
+                'params': self._params,
+                'scanned': scanned,
+                'dirs': dir_list,
+                'count': count,
+            }
+            # the header is padded, so it can be updated in place
+            header_data = self._dump_header(header)
+            header_data += ' ' * self._header_padding_
+            tmp_path = '%s.tmp%d' % (self._manifest_path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(self._magic_)
+                f.write(self._header_len_.pack(len(header_data)))
+                f.write(header_data)
+                for dirpath in sorted(chunks):
+                    records_start, num_entries, _, _ = chunks[dirpath]
+                    self._copy_chunk(records_tmp, f, records_start, num_entries * self._record_.size)
+                for dirpath in sorted(chunks):
+                    _, _, names_start, dir_names_len = chunks[dirpath]
+                    self._copy_chunk(names_tmp, f, names_start, dir_names_len)
+            shutil.move(tmp_path, self._manifest_path)
+            # placing the manifest in a scanned directory changes its mtime
+            for item in scanned:
+                if os.path.abspath(item[0]) == manifest_dir:
+                    item[1] = os.stat(item[0]).st_mtime
+                    updated = self._dump_header(header)
+                    if len(updated) <= len(header_data):
+                        with open(self._manifest_path, 'r+') as f:
+                            f.seek(len(self._magic_) + self._header_len_.size)
+                            f.write(updated.ljust(len(header_data)))
+        finally:
+            records_tmp.close()
+            names_tmp.close()
+
+    def _dump_header(self, header):
+        return json.dumps(header)
+
+    def _copy_chunk(self, src, dst, offset, length):
+        src.seek(offset)
+        while length:
+            data = src.read(min(length, 1 << 20))
+            dst.write(data)
+            length -= len(data)
+
+    def _record(self, index):
+        return self._record_.unpack_from(self._mmap, self._records_offset + index * self._record_.size)
+
+    def filename(self, index, path_index):
+        '''
+        :param index: index of the file in the iteration order
+        :param path_index: index of the directory of the file
+        :return: name of the file
+        '''
+        name_offset, name_len, _, _ = self._record(index)
+        start = self._names_bases[path_index] + name_offset
+        return self._mmap[start:start + name_len]
+
+    def stat(self, index):
+        '''
+        :param index: index of the file in the iteration order
+        :return: tuple (size, mtime) of the file, as recorded in the manifest
+        '''
+        return self._record(index)[2:]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _file_digest(f):
+    '''
+    :param f: file object to read
+    :return: hex digest of the file content
+    '''
+    digest = hashlib.sha1()
+    with closing(f):
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def _zip_mtime(info):
+    '''
+    :return: modification time of a zip member, in seconds since the epoch
+    '''
+    return time.mktime(info.date_time + (0, 0, -1))
+
+
+class _ZipReader(object):
+    '''
+    Reads members of a zip archive, members are located through the
+    central directory, so any member can be read without reading the others.
+    '''
+
+    def __init__(self, archive_path):
+        self._zip = zipfile.ZipFile(archive_path, 'r')
+        self._infos = dict((i.filename, i) for i in self._zip.infolist() if not i.filename.endswith('/'))
+
+    def names(self):
+        return list(self._infos.keys())
+
+    def stat(self, member):
+        info = self._infos[member]
+        return info.file_size, _zip_mtime(info)
+
+    def open(self, member):
+        return self._zip.open(self._infos[member])
+
+    def close(self):
+        self._zip.close()
+
+
+def _normalize_member(name):
+    '''
+    :return: tar member name without leading ./
+    '''
+    while name.startswith('./'):
+        name = name[2:].lstrip('/')
+    return name
+
+
+class _TarReader(object):
+    '''
+    Reads members of a (possibly compressed) tar archive.
+    The members are indexed in a single pass, when reading, the archive is
+    decompressed as a stream from the current position and only rewound
+    when going back, so iterating in archive order does not decompress
+    anything twice.
+    '''
+
+    def __init__(self, archive_path):
+        try:
+            self._tar = tarfile.open(archive_path, 'r:*')
+        except tarfile.TarError as ex:
+            raise KittyException('Failed to open %s: %s' % (archive_path, ex))
+        # member name without leading ./ (as in archives created with tar -C dir .) -> member
+        self._infos = dict((_normalize_member(i.name), i) for i in self._tar.getmembers() if i.isfile())
+
+    def names(self):
+        return list(self._infos.keys())
+
+    def stat(self, member):
+        info = self._infos[member]
+        return info.size, float(info.mtime)
+
+    def open(self, member):
+        return self._tar.extractfile(self._infos[member])
+
+    def close(self):
+        self._tar.close()
+
+
+def _open_archive(path):
+    '''
+    :return: archive reader if path is a zip or tar archive, None otherwise
+    '''
+    if not os.path.isfile(path):
+        return None
+    if zipfile.is_zipfile(path):
+        return _ZipReader(path)
+    if path.endswith(('.tar.xz', '.txz')):
+        raise KittyException('%s: xz compressed tar archives are not supported' % path)
+    if tarfile.is_tarfile(path):
+        return _TarReader(path)
+    return None
+
+
+class _InotifyWatcher(object):
+    '''
+    Minimal inotify (Linux) wrapper, that reports files that were written
+    or moved into the watched directories, and directories that were
+    created in them.
+    '''
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _event_ = struct.Struct('iIII')
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise KittyException('watching a directory requires inotify (Linux)')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise KittyException('inotify_init1 failed: %s' % os.strerror(ctypes.get_errno()))
+        self._watches = {}
+
+    def add(self, path):
+        '''
+        :param path: directory to watch
+        '''
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = self._libc.inotify_add_watch(self._fd, path.encode('utf-8') if isinstance(path, unicode) else path, mask)
+        if wd < 0:
+            raise KittyException('failed to watch %s: %s' % (path, os.strerror(ctypes.get_errno())))
+        self._watches[wd] = path
+
+    def read_events(self):
+        '''
+        :return: list of (directory, name, is_dir) of the pending events, without blocking
+        '''
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except OSError as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = self._event_.unpack_from(data, offset)
+                offset += self._event_.size
+                name = data[offset:offset + name_len].rstrip('\x00')
+                offset += name_len
+                if wd not in self._watches or not name:
+                    continue
+                is_dir = bool(mask & self.IN_ISDIR)
+                if is_dir and not mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    continue
+                if not is_dir and mask & self.IN_CREATE:
+                    # wait for the file to be closed
+                    continue
+                events.append((self._watches[wd], name, is_dir))
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _MappedFileCache(object):
+    '''
+    LRU cache of memory-mapped files, bounded by the total size of the
+    mapped files.
+    Evicted maps are closed, except for the one that was last handed out by
+    :meth:`view`, which is pinned until another file is viewed, since its
+    content is still in use.
+    '''
+
+    def __init__(self, max_bytes):
+        '''
+        :param max_bytes: maximal total size of the cached files
+        '''
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._maps = OrderedDict()
+        self._pinned = None
+        self._lock = Lock()
+
+    def get(self, full_path, pin=False):
+        '''
+        :param full_path: path of the file
+        :param pin: should the map be pinned (default: False)
+        :return: read-only mmap of the file (empty string if the file is empty)
+        '''
+        with self._lock:
+            mapped = self._maps.pop(full_path, None)
+            if mapped is not None:
+                self._maps[full_path] = mapped
+                unpinned = self._pin(mapped) if pin else None
+        if mapped is None:
+            with open(full_path, 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    return ''
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mapped, unpinned = self._put(full_path, mapped, pin)
+        if unpinned is not None:
+            unpinned.close()
+        return mapped
+
+    def view(self, full_path):
+        '''
+        :param full_path: path of the file
+        :return: zero-copy read-only view of the file content,
+            valid until another file is viewed
+        '''
+        return buffer(self.get(full_path, pin=True))
+
+    def _pin(self, mapped):
+        '''
+        Pin a map, must be called with the lock held
+
+        :return: the previously pinned map if it should be closed, None otherwise
+        '''
+        unpinned, self._pinned = self._pinned, mapped
+        if unpinned is None or unpinned is mapped or any(m is unpinned for m in self._maps.values()):
+            return None
+        # evicted (or never cached) while it was pinned
+        return unpinned
+
+    def _put(self, full_path, mapped, pin):
+        '''
+        :return: tuple (the cached map of the file, previously pinned map to close or None)
+        '''
+        size = len(mapped)
+        evicted = []
+        with self._lock:
+            if full_path in self._maps:
+                # mapped concurrently, serve the cached map
+                evicted.append(mapped)
+                mapped = self._maps.pop(full_path)
+                self._maps[full_path] = mapped
+            elif size <= self._max_bytes:
+                while self._size + size > self._max_bytes:
+                    _, old = self._maps.popitem(last=False)
+                    self._size -= len(old)
+                    if old is not self._pinned:
+                        evicted.append(old)
+                self._maps[full_path] = mapped
+                self._size += size
+            unpinned = self._pin(mapped) if pin else None
+        for old in evicted:
+            old.close()
+        return mapped, unpinned
+
+    def warm(self, full_path):
+        '''
+        Map a file and fault its pages in, so the next get is served from memory
+        '''
+        mapped = self.get(full_path)
+        for offset in range(0, len(mapped), mmap.PAGESIZE):
+            mapped[offset]
+
+    def clear(self):
+        '''
+        Close all the maps, the views that were handed out become invalid
+        '''
+        with self._lock:
+            maps = list(self._maps.values())
+            if self._pinned is not None and not any(m is self._pinned for m in maps):
+                maps.append(self._pinned)
+            self._maps.clear()
+            self._pinned = None
+            self._size = 0
+        for mapped in maps:
+            mapped.close()
+
+
+def _encode_content(encoder, value):
+    '''
+    Encode file content, that might be a read-only view
+
+    :param encoder: the encoder of the field
+    :param value: file content, string or view
+    :return: encoded value
+    '''
+    if isinstance(value, str):
+        return encoder.encode(value)
+    if encoder is ENC_STR_DEFAULT:
+        # Bits copies the view once, into its own store
+        return Bits(bytes=value)
+    return encoder.encode(str(value))
+
+
+# iterators that record timings, their timings are written at exit
+_timed_iterators = weakref.WeakSet()
+
+
+@atexit.register
+def _save_all_timings():
+    for fsi in list(_timed_iterators):
+        fsi.save_timings()
+
+
+def _read_ahead_worker(cache, queue):
+    '''
+    Map the files that are put in the queue, until None is put in it
+    '''
+    while True:
+        full_path = queue.get()
+        if full_path is None:
+            break
+        try:
+            cache.warm(full_path)
+        except (IOError, OSError, ValueError):
+            # the file will be read (and the error reported) when served
+            pass
 
 
 class _FsIterator(KittyObject):
@@ -19,12 +601,16 @@ class _FsIterator(KittyObject):
     this module.
     '''
 
-    def __init__(self, path, name_filter, recurse=False):
+    def __init__(self, path, name_filter, recurse=False, manifest=None, shard_index=0, shard_count=1, shard_by='hash',
+                 dedup=False, max_size=None, dedup_cache=None, watch=False, order_by=None, timing_file=None):
         '''
         :param path: base path to iterate over files
         :param name_filter: string to filter filenames, same as shell, not regex
         :param recurse: should iterate inner directories (default: False)
 
+        The other parameters are the iteration options that are described in the module documentation.
+        If path is a zip or tar archive, the iteration is over its members.
+
         :example:
 
             Iterate all log files in current directory
@@ -36,16 +622,60 @@ class _FsIterator(KittyObject):
         self._recurse = recurse
         self._path_list = []
         self._filename_dict = {}
+        # _offsets[i] is the index of the first file in _path_list[i]
+        self._offsets = []
+        # _total is the number of enumerated files, _count is the number of
+        # files to iterate over, if they differ, _order maps iteration index
+        # to enumeration index
+        self._total = 0
         self._count = 0
+        self._order = None
         self._index = -1
-        self._path_index = 0
-        self._file_index = 0
-        self._enumerate()
+        self._removed = {}
+        self._dirs = []
+        # files that were added after the enumeration (watch mode),
+        # their enumeration index starts at _total
+        self._appended = []
+        self._appended_set = set()
+        self._max_size = max_size
+        self._shard_params = (shard_index, shard_count)
+        self._watcher = None
+        self._timing_file = timing_file
+        self._timings = self._load_timings()
+        self._unsaved_timings = 0
+        self._last_seek = None
+        if timing_file:
+            _timed_iterators.add(self)
+        self._manifest = None
+        self._archive = _open_archive(path)
+        if self._archive:
+            if manifest:
+                raise KittyException('manifest is not supported for archives')
+            self._enumerate_archive()
+            self._update_offsets()
+        elif manifest:
+            self._manifest = _FsManifest(manifest, path, name_filter, recurse)
+            self._path_list = self._manifest.path_list
+            self._offsets = self._manifest.offsets
+            self._total = self._count = self._manifest.count
+        else:
+            self._enumerate()
+            self._update_offsets()
+        self._minimize(dedup, max_size, dedup_cache)
+        self._shard(shard_index, shard_count, shard_by)
+        self._sort(order_by)
+        if watch:
+            if self._manifest or self._archive or dedup or (shard_count > 1 and shard_by != 'hash'):
+                raise KittyException('watch is only supported for directories, without manifest, dedup or range shards')
+            self._watcher = _InotifyWatcher()
+            for dirpath in self._dirs:
+                self._watcher.add(dirpath)
 
     def _enumerate(self):
         self._count = 0
         if self._recurse:
             for path, _, files in os.walk(self._path):
+                self._dirs.append(path)
                 current = sorted(self._filter_filenames(files))
                 if len(current):
                     self._path_list.append(path)
@@ -54,11 +684,322 @@ class _FsIterator(KittyObject):
             self._path_list = sorted(self._path_list)
         else:
             files = os.listdir(self._path)
+            self._dirs.append(self._path)
             self._path_list = [self._path]
             current = sorted(self._filter_filenames(files))
             self._filename_dict[self._path] = current
             self._count += len(current)
 
+    def _enumerate_archive(self):
+        for member in self._archive.names():
+            dirname, filename = member.rsplit('/', 1) if '/' in member else ('', member)
+            if dirname and not self._recurse:
+                continue
+            if not self._matches(filename):
+                continue
+            path = os.path.join(self._path, dirname) if dirname else self._path
+            self._filename_dict.setdefault(path, []).append(filename)
+        for files in self._filename_dict.values():
+            files.sort()
+        self._path_list = sorted(self._filename_dict)
+        if not self._recurse and not self._path_list:
+            self._path_list = [self._path]
+            self._filename_dict[self._path] = []
+
+    def is_archive(self):
+        return self._archive is not None
+
+    def _relpath(self, index):
+        '''
+        :return: path of a file relative to the base path, with / as separator
+        '''
+        full_path = os.path.join(*self.get(index))
+        return os.path.relpath(full_path, self._path).replace(os.sep, '/')
+
+    def open(self, index):
+        '''
+        :param index: index of a file in the iteration order
+        :return: file object to read the file from
+        '''
+        if self._archive:
+            return self._archive.open(self._relpath(index))
+        return open(os.path.join(*self.get(index)), 'rb')
+
+    def read(self, index):
+        '''
+        :param index: index of a file in the iteration order
+        :return: content of the file
+        '''
+        with closing(self.open(index)) as f:
+            return f.read()
+
+    def _update_offsets(self):
+        self._offsets = []
+        offset = 0
+        for path in self._path_list:
+            self._offsets.append(offset)
+            offset += len(self._filename_dict[path])
+        self._total = self._count = offset
+
+    def _minimize(self, dedup, max_size, dedup_cache):
+        '''
+        Drop files that are larger than max_size, and (if dedup is set) files
+        with the same content as a previous file in the enumeration order.
+        Only files with the same size as another file are hashed, the hashes
+        are cached by path, size and mtime in dedup_cache.
+        '''
+        if not dedup and max_size is None:
+            return
+        candidates = []
+        oversized = 0
+        for index in xrange(self._count):
+            size, mtime = self.stat(index)
+            if max_size is not None and size > max_size:
+                oversized += 1
+                continue
+            candidates.append((index, size, mtime))
+        size_counts = {}
+        if dedup:
+            for _, size, _ in candidates:
+                size_counts[size] = size_counts.get(size, 0) + 1
+        cache = self._load_dedup_cache(dedup_cache)
+        new_cache = {}
+        seen = {}
+        duplicates = 0
+        order = array('L')
+        for index, size, mtime in candidates:
+            if size_counts.get(size, 0) > 1:
+                full_path = os.path.join(*self.get(index))
+                relpath = os.path.relpath(full_path, self._path)
+                cached = cache.get(relpath)
+                if cached and cached[0] == size and cached[1] == mtime:
+                    digest = cached[2]
+                else:
+                    digest = _file_digest(self.open(index))
+                new_cache[relpath] = [size, mtime, digest]
+                if digest in seen:
+                    self.logger.debug('dropping %s, duplicate of %s', full_path, seen[digest])
+                    duplicates += 1
+                    continue
+                seen[digest] = full_path
+            order.append(self._base_index(index))
+        if dedup_cache:
+            self._save_dedup_cache(dedup_cache, new_cache)
+        self._removed = {'duplicates': duplicates, 'oversized': oversized}
+        self.logger.info('dropped %d duplicate and %d oversized files out of %d', duplicates, oversized, self._count)
+        self._set_order(order)
+
+    def _load_dedup_cache(self, dedup_cache):
+        if not dedup_cache or not os.path.exists(dedup_cache):
+            return {}
+        try:
+            with open(dedup_cache, 'rb') as f:
+                return json.loads(f.read())
+        except ValueError:
+            self.logger.warning('ignoring invalid dedup cache %s', dedup_cache)
+            return {}
+
+    def _save_dedup_cache(self, dedup_cache, cache):
+        tmp_path = '%s.tmp%d' % (dedup_cache, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(cache))
+        shutil.move(tmp_path, dedup_cache)
+
+    def removed(self):
+        '''
+        :return: dictionary with the number of files that were dropped as duplicates or as oversized
+        '''
+        return dict(self._removed)
+
+    def _shard(self, shard_index, shard_count, shard_by):
+        '''
+        Select the files of a single shard.
+        Shards depend only on the enumerated files, so processes with the
+        same parameters (and different shard_index) cover all files exactly once.
+        '''
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise KittyException('Invalid shard %s of %s' % (shard_index, shard_count))
+        if shard_count == 1:
+            return
+        if shard_by == 'range':
+            start = self._count * shard_index // shard_count
+            end = self._count * (shard_index + 1) // shard_count
+            if self._order is None:
+                self._set_order(xrange(start, end))
+            else:
+                self._set_order(self._order[start:end])
+        elif shard_by == 'hash':
+            order = array('L')
+            for index in xrange(self._count):
+                if self._path_hash(index) % shard_count == shard_index:
+                    order.append(self._base_index(index))
+            self._set_order(order)
+        else:
+            raise KittyException('Invalid shard_by value: %s' % shard_by)
+
+    def _sort(self, order_by):
+        '''
+        Order the files by their (estimated) cost, so cheap files come first.
+        Ties are kept in path order.
+        '''
+        if order_by is None:
+            return
+        indices = xrange(self._count)
+        if order_by == 'size':
+            sizes = [self.stat(i)[0] for i in indices]
+            order = sorted(indices, key=lambda i: sizes[i])
+        elif order_by == 'size_buckets':
+            buckets = {}
+            for i in indices:
+                buckets.setdefault(self.stat(i)[0].bit_length(), []).append(i)
+            order = []
+            rounds = [buckets[k] for k in sorted(buckets)]
+            for round_index in xrange(max(len(b) for b in rounds) if rounds else 0):
+                order.extend(b[round_index] for b in rounds if round_index < len(b))
+        elif order_by == 'exec_time':
+            if not self._timing_file:
+                raise KittyException('ordering by exec_time requires timing_file')
+            # files that were not measured yet come last, smallest first
+            keys = []
+            for i in indices:
+                measured = self._timings.get(self._relpath(i))
+                keys.append((0, measured) if measured is not None else (1, self.stat(i)[0]))
+            order = sorted(indices, key=lambda i: keys[i])
+        else:
+            raise KittyException('Invalid order_by value: %s' % order_by)
+        self._set_order(array('L', (self._base_index(i) for i in order)))
+
+    def _load_timings(self):
+        if not self._timing_file or not os.path.exists(self._timing_file):
+            return {}
+        try:
+            with open(self._timing_file, 'rb') as f:
+                return json.loads(f.read())
+        except ValueError:
+            self.logger.warning('ignoring invalid timing file %s', self._timing_file)
+            return {}
+
+    def save_timings(self):
+        '''
+        Write the recorded time of each file to the timing file
+        '''
+        if not self._timing_file or not self._unsaved_timings:
+            return
+        tmp_path = '%s.tmp%d' % (self._timing_file, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(self._timings))
+        shutil.move(tmp_path, self._timing_file)
+        self._unsaved_timings = 0
+
+    def _record_timing(self, index):
+        '''
+        The time of a file is the time between moving to it and moving to
+        the next file (or reaching the end), which includes the test that used it.
+        '''
+        now = time.time()
+        if self._last_seek and self._last_seek[0] == index - 1:
+            self._store_timing(index - 1, now - self._last_seek[1])
+        self._last_seek = (index, now)
+
+    def _store_timing(self, index, elapsed):
+        self._timings[self._relpath(index)] = elapsed
+        self._unsaved_timings += 1
+        if self._unsaved_timings >= 1000:
+            self.save_timings()
+
+    def flush_timings(self):
+        '''
+        Record the time of the current file, as the iteration ended,
+        and write the timings to the timing file
+        '''
+        if self._last_seek:
+            index, start = self._last_seek
+            self._store_timing(index, time.time() - start)
+            self._last_seek = None
+        self.save_timings()
+
+    def _path_hash(self, index):
+        '''
+        :return: stable hash of the path of a file, relative to the base path
+        '''
+        return self._relpath_hash(os.path.join(*self.get(index)))
+
+    def _relpath_hash(self, full_path):
+        relpath = os.path.relpath(full_path, self._path)
+        return zlib.crc32(relpath.replace(os.sep, '/')) & 0xffffffff
+
+    def poll(self):
+        '''
+        Append files that were added since the last poll (watch mode).
+        Files are appended in the order they were reported, so the order
+        of the files that were already iterated is kept.
+
+        :return: number of appended files
+        '''
+        if self._watcher is None:
+            return 0
+        added = 0
+        for dirpath, name, is_dir in self._watcher.read_events():
+            full_path = os.path.join(dirpath, name)
+            if is_dir:
+                if self._recurse:
+                    added += self._watch_tree(full_path)
+            else:
+                added += self._append(dirpath, name)
+        return added
+
+    def _watch_tree(self, path):
+        '''
+        Watch a new directory tree, and append the files that were
+        created in it before it was watched.
+        '''
+        added = 0
+        for dirpath, _, files in os.walk(path):
+            self._watcher.add(dirpath)
+            for name in sorted(files):
+                added += self._append(dirpath, name)
+        return added
+
+    def _is_known(self, dirpath, name):
+        if os.path.join(dirpath, name) in self._appended_set:
+            return True
+        files = self._filename_dict.get(dirpath, [])
+        i = bisect_right(files, name)
+        return i > 0 and files[i - 1] == name
+
+    def _append(self, dirpath, name):
+        if not self._matches(name) or self._is_known(dirpath, name):
+            return 0
+        full_path = os.path.join(dirpath, name)
+        shard_index, shard_count = self._shard_params
+        if shard_count > 1 and self._relpath_hash(full_path) % shard_count != shard_index:
+            return 0
+        if self._max_size is not None:
+            try:
+                if os.stat(full_path).st_size > self._max_size:
+                    return 0
+            except OSError:
+                return 0
+        self._appended.append((dirpath, name))
+        self._appended_set.add(full_path)
+        base_index = self._total + len(self._appended) - 1
+        if self._order is None:
+            self._count += 1
+        else:
+            self._order.append(base_index)
+            self._count = len(self._order)
+        return 1
+
+    def _set_order(self, order):
+        '''
+        :param order: sequence of enumeration indices to iterate over
+        '''
+        self._order = order
+        self._count = len(order)
+
+    def _base_index(self, index):
+        return index if self._order is None else self._order[index]
+
     def _matches(self, filename):
         return fnmatch(filename, self._name_filter)
 
@@ -70,42 +1011,88 @@ class _FsIterator(KittyObject):
 
     def reset(self):
         self._index = -1
-        self._path_index = 0
-        self._file_index = 0
+        if self._timing_file:
+            self.flush_timings()
+
+    def _locate(self, index):
+        '''
+        :param index: index of a file in the iteration order
+        :return: tuple (path index, file index) of the file
+        '''
+        path_index = bisect_right(self._offsets, index) - 1
+        return path_index, index - self._offsets[path_index]
+
+    def _entry(self, base_index):
+        '''
+        :param base_index: index of a file in the enumeration order
+        :return: tuple (path, filename) of the file
+        '''
+        if base_index >= self._total:
+            return self._appended[base_index - self._total]
+        path_index, file_index = self._locate(base_index)
+        path = self._path_list[path_index]
+        if self._manifest:
+            return path, self._manifest.filename(base_index, path_index)
+        return path, self._filename_dict[path][file_index]
+
+    def get(self, index):
+        '''
+        :param index: index of a file in the iteration order
+        :return: tuple (path, filename) of the file
+        '''
+        if not 0 <= index < self._count:
+            raise KittyException('Index %d is out of range (%d files)' % (index, self._count))
+        return self._entry(self._base_index(index))
+
+    def stat(self, index):
+        '''
+        :param index: index of a file in the iteration order
+        :return: tuple (size, mtime) of the file
+        '''
+        if self._manifest:
+            return self._manifest.stat(self._base_index(index))
+        if self._archive:
+            return self._archive.stat(self._relpath(index))
+        st = os.stat(os.path.join(*self.get(index)))
+        return st.st_size, st.st_mtime
 
     def current(self):
         '''
         :return: tuple (path, filename) of current case
         '''
         if self._index == -1:
-            path = self._path_list[0]
-            return path, self._filename_dict[path][0]
+            # the default is the same for all shards
+            return self._entry(0)
         elif self._index < self._count:
-            path = self._path_list[self._path_index]
-            files = self._filename_dict[path]
-            return path, files[self._file_index]
+            return self.get(self._index)
         else:
             raise KittyException('Current is invalid!')
 
+    def seek(self, index):
+        '''
+        Move to a given case
+
+        :param index: index of the case, -1 for the default (pre-mutation) state
+        '''
+        if index == -1:
+            self.reset()
+        elif 0 <= index < self._count:
+            if self._timing_file:
+                self._record_timing(index)
+            self._index = index
+        else:
+            raise KittyException('Index %d is out of range (%d files)' % (index, self._count))
+
     def next(self):
         '''
         Move to next case
 
         :return: True if there's another case, False otherwise
         '''
-        if self._index == self._count - 1:
+        if self._index >= self._count - 1:
             return False
-        else:
-            self._index += 1
-            if self._index > 0:
-                path = self._path_list[self._path_index]
-                files = self._filename_dict[path]
-                if self._file_index < len(files) - 1:
-                    self._file_index += 1
-                else:
-                    self._file_index = 0
-                    self._path_index += 1
-            return True
+        self.seek(self._index + 1)
+        return True
 
     def skip(self, count):
         '''
@@ -115,43 +1102,148 @@ class _FsIterator(KittyObject):
         :rtype: int
         :return: number of cases skipped
         '''
-        left = self.count - self._index - 1
-        if count > left:
-            return left
+        skipped = max(min(count, self._count - self._index - 1), 0)
+        if skipped:
+            self.seek(self._index + skipped)
+        return skipped
+
+    def close(self):
+        self.save_timings()
+        if self._manifest:
+            self._manifest.close()
+        if self._archive:
+            self._archive.close()
+        if self._watcher:
+            self._watcher.close()
+
+
+class _FsField(BaseField):
+    '''
+    Base class of the fields whose mutations are files, mutation i is
+    file i of a reproducible order, so any mutation can be moved to directly.
+    '''
+
+    _encoder_type_ = StrEncoder
+
+    def _mutate(self):
+        self._load_current()
+
+    def _load_current(self):
+        '''
+        Set the current value from the file of the current mutation
+        '''
+        raise NotImplementedError('_load_current')
+
+    def _encode_value(self, value):
+        return _encode_content(self._encoder, value)
+
+    def seek(self, index):
+        '''
+        Move the field to a given mutation, without going over the previous ones
+
+        :param index: mutation index, -1 to reset the field
+        '''
+        self._initialize()
+        if index == -1:
+            self.reset()
         else:
-            # progress here
-            to_skip = count
-            while to_skip:
-                path = self._path_list[self._path_index]
-                files = self._filename_dict[path]
-                len_files = len(files[self._file_index:])
-                if len_files > to_skip:
-                    self._path_index += 1
-                    self._file_index = 0
-                    self._index += len_files
-                    to_skip -= len_files
-                else:
-                    self._file_index += to_skip
-                    self._index += to_skip
-                    to_skip = 0
-            return count
+            self._current_index = index
+            self._load_current()
+
+    def skip(self, count):
+        self._initialize()
+        skipped = max(min(count, self._last_index() - self._current_index), 0)
+        if skipped:
+            self.seek(self._current_index + skipped)
+        return skipped
+
+    def get_info(self):
+        info = super(_FsField, self).get_info()
+        if not isinstance(self._current_value, basestring):
+            info['value']['raw'] = repr(str(self._current_value))
+        return info
 
 
-class FsNames(BaseField):
+class _FsIteratorField(_FsField):
+    '''
+    Base class of the fields that iterate over the files of a directory
+    or the members of an archive, see the module documentation for the
+    iteration options.
+    '''
+
+    def __init__(self, path, name_filter, recurse, encoder, fuzzable, name, options):
+        '''
+        :param path: base path to iterate over files, or path of a zip/tar archive
+        :param name_filter: string to filter filenames, same as shell, not regex
+        :param recurse: should iterate inner directories
+        :param encoder: encoder for the field
+        :param fuzzable: is field fuzzable
+        :param name: name of the object
+        :param options: dictionary of iteration options
+        '''
+        self._fsi = _FsIterator(path, name_filter, recurse, **options)
+        super(_FsIteratorField, self).__init__(self._get_default_value(), encoder, fuzzable, name)
+        self._num_mutations = self._fsi.count()
+
+    def _get_default_value(self):
+        raise NotImplementedError('_get_default_value')
+
+    def _load_current(self):
+        self._fsi.seek(self._current_index)
+        self._load_file()
+
+    def mutate(self):
+        if super(_FsIteratorField, self).mutate():
+            return True
+        # the last file was used, record its time
+        self._fsi.flush_timings()
+        return False
+
+    def _load_file(self):
+        '''
+        Set the current value from the current file of the iterator
+        '''
+        raise NotImplementedError('_load_file')
+
+    def num_mutations(self):
+        if self._fsi.poll():
+            self._num_mutations = self._fsi.count()
+        return super(_FsIteratorField, self).num_mutations()
+
+    def reset(self):
+        super(_FsIteratorField, self).reset()
+        self._fsi.reset()
+
+    def close(self):
+        '''
+        Release the resources of the field
+        '''
+        self._fsi.close()
+
+    def get_info(self):
+        info = super(_FsIteratorField, self).get_info()
+        info['filepath'], info['filename'] = self._fsi.current()
+        removed = self._fsi.removed()
+        if removed:
+            info['removed_files'] = removed
+        return info
+
+
+class FsNames(_FsIteratorField):
     '''
     This field mutations are the file names in a given directory.
     It is pretty useful if you have files that were generated by a different
     fuzzer, and you only need to pass their name to your target.
     You can filter the files based on the file name (name_filter),
     you can recurse into subdirectories (recurse) and
-    you can pass full path or only the file name (full_path),
+    you can pass full path or only the file name (full_path).
+    If path is a zip or tar archive, the names are the paths of its
+    members, under the archive path.
     '''
 
-    _encoder_type_ = StrEncoder
-
-    def __init__(self, path, name_filter, recurse=False, full_path=True, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None):
+    def __init__(self, path, name_filter, recurse=False, full_path=True, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None, **options):
         '''
-        :param path: base path to iterate over files
+        :param path: base path to iterate over files, or path of a zip/tar archive
         :param name_filter: string to filter filenames, same as shell, not regex
         :param recurse: should iterate inner directories (default: False)
         :param full_path: should include full path rather than only file name (default: True)
@@ -159,79 +1251,259 @@ class FsNames(BaseField):
         :param encoder: encoder for the field
         :param fuzzable: is field fuzzable (default: True)
         :param name: name of the object (default: None)
+        :param options: iteration options (manifest, sharding, dedup, watch, order), see the module documentation
         '''
-        self._fsi = _FsIterator(path, name_filter, recurse)
         self._full_path = full_path
-        if self._full_path:
-            default_value = os.path.join(*self._fsi.current())
-        else:
-            default_value = self._fsi.current()[1]
-        super(FsNames, self).__init__(default_value, encoder, fuzzable, name)
-        self._num_mutations = self._fsi.count()
+        super(FsNames, self).__init__(path, name_filter, recurse, encoder, fuzzable, name, options)
 
-    def _mutate(self):
-        if self._fsi.next():
-            path, name = self._fsi.current()
-            if self._full_path:
-                name = os.path.join(path, name)
-            self._current_value = name
-
-    def reset(self):
-        super(FsNames, self).reset()
-        self._fsi.reset()
+    def _get_default_value(self):
+        return self._file_name(*self._fsi.current())
 
-    def skip(self, count):
-        skipped = self._fsi.skip(count)
-        self._current_index += skipped
-        return skipped
+    def _file_name(self, path, name):
+        return os.path.join(path, name) if self._full_path else name
 
-    def get_info(self):
-        info = super(FsNames, self).get_info()
-        info['filepath'], info['filename'] = self._fsi.current()
-        return info
+    def _load_file(self):
+        self._current_value = self._file_name(*self._fsi.current())
 
 
-class FsContent(BaseField):
+class FsContent(_FsIteratorField):
     '''
     This field mutations are the contents of files in a given directory.
     It is pretty useful if you have files that were generated by a different
     fuzzer.
     You can filter the files based on the file name (name_filter),
-    you can recurse into subdirectories (recurse) and
-    you can pass full path or only the file name (full_path),
+    you can recurse into subdirectories (recurse),
+    and you can serve the files through a cache of memory-mapped files
+    (cache_size), that is filled ahead of the iteration by a background
+    thread (read_ahead).
+    With the cache, the current value is a read-only view of the map,
+    that is rendered without copying it to a string first.
+    If path is a zip or tar archive, the members are read from it
+    directly, without extracting it.
     '''
 
-    _encoder_type_ = StrEncoder
-
-    def __init__(self, path, name_filter, recurse=False, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None):
+    def __init__(self, path, name_filter, recurse=False, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None,
+                 cache_size=0, read_ahead=0, **options):
         '''
-        :param path: base path to iterate over files
+        :param path: base path to iterate over files, or path of a zip/tar archive
         :param name_filter: string to filter filenames, same as shell, not regex
         :param recurse: should iterate inner directories (default: False)
         :type encoder: :class:`~kitty.model.low_level.encoder.StrEncoder`
         :param encoder: encoder for the field
         :param fuzzable: is field fuzzable (default: True)
         :param name: name of the object (default: None)
+        :param cache_size: maximal size (in bytes) of the memory-mapped files to cache, 0 to read files directly (default: 0)
+        :param read_ahead: number of files to map in the background ahead of the current one, requires cache_size (default: 0)
+        :param options: iteration options (manifest, sharding, dedup, watch, order), see the module documentation
         '''
-        self._fsi = _FsIterator(path, name_filter, recurse)
-        super(FsContent, self).__init__(b'', encoder, fuzzable, name)
-        self._num_mutations = self._fsi.count()
+        if read_ahead and not cache_size:
+            raise KittyException('read_ahead requires cache_size')
+        self._cache = _MappedFileCache(cache_size) if cache_size else None
+        self._read_ahead = read_ahead
+        self._read_ahead_next = 0
+        self._read_ahead_queue = None
+        self._read_ahead_thread = None
+        self._read_ahead_ref = None
+        super(FsContent, self).__init__(path, name_filter, recurse, encoder, fuzzable, name, options)
+        if cache_size and self._fsi.is_archive():
+            raise KittyException('cache_size is not supported for archives')
 
-    def _mutate(self):
-        if self._fsi.next():
+    def _get_default_value(self):
+        return ''
+
+    def _load_file(self):
+        if self._cache is None:
+            self._current_value = self._fsi.read(self._current_index)
+        else:
             full_path = os.path.join(*self._fsi.current())
-            self._current_value = open(full_path, 'rb').read()
+            self._current_value = self._cache.view(full_path)
+            if self._read_ahead:
+                self._schedule_read_ahead()
+
+    def _schedule_read_ahead(self):
+        last = min(self._current_index + self._read_ahead, self._fsi.count() - 1)
+        first = max(self._read_ahead_next, self._current_index + 1)
+        if first > last:
+            return
+        if self._read_ahead_thread is None:
+            queue = Queue()
+            self._read_ahead_queue = queue
+            # the thread does not reference the field,
+            # so it can be stopped when the field is collected
+            self._read_ahead_thread = Thread(target=_read_ahead_worker, args=(self._cache, queue))
+            self._read_ahead_thread.daemon = True
+            self._read_ahead_thread.start()
+            self._read_ahead_ref = weakref.ref(self, lambda _: queue.put(None))
+        for index in range(first, last + 1):
+            self._read_ahead_queue.put(os.path.join(*self._fsi.get(index)))
+        self._read_ahead_next = last + 1
 
     def reset(self):
         super(FsContent, self).reset()
-        self._fsi.reset()
+        self._read_ahead_next = 0
 
-    def skip(self, count):
-        skipped = self._fsi.skip(count)
-        self._current_index += skipped
-        return skipped
+    def seek(self, index):
+        # files before the index may not have been read ahead
+        self._read_ahead_next = index + 1
+        super(FsContent, self).seek(index)
+
+    def close(self):
+        '''
+        Stop the read-ahead thread and release the resources of the field
+        '''
+        if self._read_ahead_thread is not None:
+            self._read_ahead_queue.put(None)
+            self._read_ahead_thread.join()
+            self._read_ahead_thread = None
+            self._read_ahead_queue = None
+            self._read_ahead_ref = None
+        if self._cache is not None:
+            self._cache.clear()
+        super(FsContent, self).close()
+
+
+class _CorpusPack(object):
+    '''
+    Read-only access to a corpus pack, the pack is memory-mapped.
+
+    File structure::
+
+        magic | count, index offset, names offset (uint64) | data | index | names
+
+    The index holds a fixed size record (data offset, data length,
+    name offset, name length) per file, in iteration order.
+    The names are the paths of the files, relative to the packed directory.
+    '''
+
+    _magic_ = 'KATNIP-PACK\x01'
+    _header_ = struct.Struct('<QQQ')
+    _record_ = struct.Struct('<QQQQ')
+
+    def __init__(self, pack_path):
+        '''
+        :param pack_path: path of the pack file
+        '''
+        self._file = open(pack_path, 'rb')
+        if self._file.read(len(self._magic_)) != self._magic_:
+            self._file.close()
+            raise KittyException('%s is not a corpus pack' % pack_path)
+        self.count, self._index_offset, self._names_offset = self._header_.unpack(self._file.read(self._header_.size))
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _record(self, index):
+        if not 0 <= index < self.count:
+            raise KittyException('Index %d is out of range (%d files)' % (index, self.count))
+        return self._record_.unpack_from(self._mmap, self._index_offset + index * self._record_.size)
+
+    def name(self, index):
+        '''
+        :return: path of the file, relative to the packed directory
+        '''
+        _, _, name_offset, name_len = self._record(index)
+        start = self._names_offset + name_offset
+        return self._mmap[start:start + name_len]
+
+    def view(self, index):
+        '''
+        :return: zero-copy view of the file content
+        '''
+        offset, length, _, _ = self._record(index)
+        return buffer(self._mmap, offset, length)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def build_corpus_pack(pack_path, path, name_filter, recurse=False):
+    '''
+    Pack the files of a directory, in the order they are iterated by
+    :class:`~katnip.model.low_level.fs_iterators.FsContent`, into a single file.
+
+    :param pack_path: path of the pack file to write
+    :param path: base path to iterate over files
+    :param name_filter: string to filter filenames, same as shell, not regex
+    :param recurse: should iterate inner directories (default: False)
+    :return: number of packed files
+
+    :example:
+
+        ::
+
+            build_corpus_pack('/tmp/corpus.kpack', '/path/to/corpus', '*', recurse=True)
+            field = FsPackContent('/tmp/corpus.kpack', name='corpus')
+    '''
+    fsi = _FsIterator(path, name_filter, recurse)
+    header_size = len(_CorpusPack._magic_) + _CorpusPack._header_.size
+    index = []
+    names = []
+    names_len = 0
+    tmp_path = '%s.tmp%d' % (pack_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write('\x00' * header_size)
+        offset = header_size
+        for i in range(fsi.count()):
+            full_path = os.path.join(*fsi.get(i))
+            with closing(fsi.open(i)) as src:
+                shutil.copyfileobj(src, f)
+            length = f.tell() - offset
+            name = os.path.relpath(full_path, path)
+            index.append(_CorpusPack._record_.pack(offset, length, names_len, len(name)))
+            names.append(name)
+            names_len += len(name)
+            offset += length
+        index_offset = offset
+        f.write(''.join(index))
+        names_offset = f.tell()
+        f.write(''.join(names))
+        f.seek(0)
+        f.write(_CorpusPack._magic_)
+        f.write(_CorpusPack._header_.pack(fsi.count(), index_offset, names_offset))
+    shutil.move(tmp_path, pack_path)
+    return fsi.count()
+
+
+class FsPackContent(_FsField):
+    '''
+    This field mutations are the contents of the files in a corpus pack,
+    in the same order as :class:`~katnip.model.low_level.fs_iterators.FsContent`
+    iterates them in the packed directory.
+    Files are served from a memory-mapped pack, so there is no file system
+    access per mutation and seeking to any mutation is O(1).
+    The current value is a read-only view of the pack, with the default
+    encoder it is copied only once, when it is rendered.
+    '''
+
+    def __init__(self, pack_path, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None):
+        '''
+        :param pack_path: path of a pack, built by :func:`~katnip.model.low_level.fs_iterators.build_corpus_pack`
+        :type encoder: :class:`~kitty.model.low_level.encoder.StrEncoder`
+        :param encoder: encoder for the field
+        :param fuzzable: is field fuzzable (default: True)
+        :param name: name of the object (default: None)
+        '''
+        self._pack = _CorpusPack(pack_path)
+        super(FsPackContent, self).__init__('', encoder, fuzzable, name)
+        self._num_mutations = self._pack.count
+
+    def _load_current(self):
+        self._current_value = self._pack.view(self._current_index)
+
+    def current_view(self):
+        '''
+        :return: zero-copy view of the content of the current file
+        '''
+        return self._pack.view(max(self._current_index, 0))
+
+    def close(self):
+        '''
+        Release the pack
+        '''
+        # drop the view, so the pack can be closed
+        self.reset()
+        self._pack.close()
 
     def get_info(self):
-        info = super(FsContent, self).get_info()
-        info['filepath'], info['filename'] = self._fsi.current()
+        info = super(FsPackContent, self).get_info()
+        info['filename'] = self._pack.name(max(self._current_index, 0))
         return info
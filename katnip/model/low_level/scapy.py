@@ -17,18 +17,88 @@
 # You should have received a copy of the GNU General Public License
 # along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
+import atexit
+import weakref
+from array import array
+from multiprocessing import Pool
 from kitty.model import BaseField
 from kitty.model.low_level.encoder import ENC_STR_DEFAULT, StrEncoder
+from kitty.core import KittyException
 import random
 from scapy.all import *
 
 
+# packet used by the worker processes, it is inherited on fork since
+# pickling a scapy packet freezes its volatile (fuzzed) values
+_worker_packet = None
+
+
+def _init_worker(packet):
+    global _worker_packet
+    _worker_packet = packet
+
+
+# weak reference to a field -> its worker pool, the pool is terminated
+# when the field is collected or when the interpreter exits
+_pools = {}
+
+
+def _release_pool(ref):
+    pool = _pools.pop(ref, None)
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+
+
+@atexit.register
+def _release_all_pools():
+    for ref in list(_pools):
+        _release_pool(ref)
+
+
+def _block_seed(seed, start):
+    '''
+    :return: random seed for the mutation block that starts at index [start]
+    '''
+    return (seed << 32) ^ start
+
+
+def _render_block(seed, start, count, packet=None):
+    '''
+    Render [count] mutations of the packet, starting at index [start].
+
+    :return: tuple (data, offsets) - concatenated rendered packets and
+        an array of count + 1 offsets into data
+    '''
+    if packet is None:
+        packet = _worker_packet
+    random.seed(_block_seed(seed, start))
+    chunks = []
+    offsets = array('L', [0])
+    for _ in range(count):
+        chunk = str(packet)
+        chunks.append(chunk)
+        offsets.append(offsets[-1] + len(chunk))
+    return ''.join(chunks), offsets
+
+
 class ScapyField(BaseField):
     '''
     Wrap a fuzzed scapy.packet.Packet object as a kitty field.
     Since the fuzzing parameters can be configured by the fuzz function of Scapy,
     this field assumes that the fuzz function was already called on the given field
 
+    When batch_size is set, the mutations are pre-generated in blocks of
+    batch_size packets, each block is seeded by (seed, first index) so it can
+    be generated independently of the others, and the next block is
+    generated in a pool of worker processes while the current one is served,
+    with a block in flight for each worker.
+    Note that the mutations in batch mode differ from the ones that are
+    generated in the default mode, and that the worker processes rely on fork
+    to inherit the packet.
+    The worker processes are started when the field is created, and are
+    stopped by :meth:`close`, when the field is collected or at exit.
+
     :example:
 
         ::
@@ -36,12 +106,13 @@ class ScapyField(BaseField):
             from scapy.all import *
             tcp_packet = IP()/TCP()
             field = ScapyField(value=fuzz(tcp_packet), name='tcp packet', fuzz_count=50, seed=1000)
+            batched = ScapyField(value=fuzz(tcp_packet), name='tcp packet', fuzz_count=50000, batch_size=1000, workers=4)
 
     '''
 
     _encoder_type_ = StrEncoder
 
-    def __init__(self, value, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None, fuzz_count=1000, seed=1024):
+    def __init__(self, value, encoder=ENC_STR_DEFAULT, fuzzable=True, name=None, fuzz_count=1000, seed=1024, batch_size=None, workers=0):
         '''
         :param value: scapy_packet_class
         :type encoder: :class:`~kitty.model.low_levele.encoder.ENC_STR_DEFAULT`
@@ -50,8 +121,22 @@ class ScapyField(BaseField):
         :param name: name of the object (default: None)
         :param fuzz_count: fuzz count (default: 1000)
         :param seed: random seed (default: 1024)
+        :param batch_size: number of mutations to pre-generate in each block, None to disable (default: None)
+        :param workers: number of worker processes that generate blocks, 0 to generate in process (default: 0)
         '''
+        if batch_size is not None and batch_size < 1:
+            raise KittyException('batch_size must be positive, got %s' % batch_size)
+        if workers < 0:
+            raise KittyException('workers must not be negative, got %s' % workers)
         self._seed = seed
+        self._batch_size = batch_size
+        self._workers = workers
+        self._pool = None
+        self._pool_ref = None
+        # block index -> (data, offsets)
+        self._blocks = {}
+        # block index -> pending result from the worker pool
+        self._pending = {}
         # set the random seed
         random.seed(self._seed)
         # set the fuzz count
@@ -61,6 +146,16 @@ class ScapyField(BaseField):
         super(ScapyField, self).__init__(value=str(value), encoder=encoder, fuzzable=fuzzable, name=name)
         # reset random count
         random.seed(self._seed)
+        self._start_pool()
+
+    def _start_pool(self):
+        '''
+        Start the worker processes, if the field is configured to use them
+        '''
+        if self._batch_size and self._workers and self._pool is None:
+            self._pool = Pool(self._workers, _init_worker, (self._fuzz_packet,))
+            self._pool_ref = weakref.ref(self, _release_pool)
+            _pools[self._pool_ref] = self._pool
 
     def num_mutations(self):
         '''
@@ -72,20 +167,103 @@ class ScapyField(BaseField):
             return 0
 
     def _mutate(self):
-        # during mutation, all we really do is call str(self.fuzz_packet)
-        # as scapy performs mutation each time str() is called...
-        self._current_value = str(self._fuzz_packet)
+        if self._batch_size:
+            self._current_value = self._get_batched(self._current_index)
+        else:
+            # during mutation, all we really do is call str(self.fuzz_packet)
+            # as scapy performs mutation each time str() is called...
+            self._current_value = str(self._fuzz_packet)
+
+    def _get_batched(self, index):
+        block_index, offset = divmod(index, self._batch_size)
+        data, offsets = self._get_block(block_index)
+        # keep one block per worker in flight while serving the current one
+        for ahead in range(1, self._workers + 1):
+            self._request_block(block_index + ahead)
+        return data[offsets[offset]:offsets[offset + 1]]
+
+    def _block_range(self, block_index):
+        start = block_index * self._batch_size
+        return start, min(self._batch_size, self._fuzz_count - start)
+
+    def _request_block(self, block_index):
+        if not self._workers:
+            return
+        if block_index in self._blocks or block_index in self._pending:
+            return
+        start, count = self._block_range(block_index)
+        if count <= 0:
+            return
+        # the pool is stopped by close, restart it if the field is used again
+        self._start_pool()
+        self._pending[block_index] = self._pool.apply_async(_render_block, (self._seed, start, count))
+
+    def _get_block(self, block_index):
+        if block_index not in self._blocks:
+            # only keep the blocks that might still be served
+            for stale in [i for i in self._blocks if i < block_index]:
+                del self._blocks[stale]
+            for stale in [i for i in self._pending if i < block_index]:
+                del self._pending[stale]
+            if self._workers:
+                self._request_block(block_index)
+                self._blocks[block_index] = self._pending.pop(block_index).get()
+            else:
+                start, count = self._block_range(block_index)
+                self._blocks[block_index] = _render_block(self._seed, start, count, self._fuzz_packet)
+        return self._blocks[block_index]
+
+    def skip(self, count):
+        if not self._batch_size:
+            return super(ScapyField, self).skip(count)
+        # in batch mode each mutation is addressable by its index,
+        # so there is no need to render the skipped ones
+        self._initialize()
+        skipped = max(min(count, self._last_index() - self._current_index), 0)
+        if skipped:
+            self._current_index += skipped
+            self._mutate()
+        return skipped
 
     def reset(self):
         super(ScapyField, self).reset()
         # reset fuzz_packet to default status
         random.seed(self._seed)
 
+    def close(self):
+        '''
+        Stop the worker processes (if any) and drop the pre-generated blocks
+        '''
+        if self._pool is not None:
+            _release_pool(self._pool_ref)
+            self._pool = None
+            self._pool_ref = None
+        self._pending = {}
+        self._blocks = {}
+
+    def copy(self):
+        '''
+        :return: a copy of the field, with its own worker processes
+        '''
+        dup = super(ScapyField, self).copy()
+        dup._pool = None
+        dup._pool_ref = None
+        dup._pending = {}
+        dup._blocks = {}
+        dup._start_pool()
+        return dup
 
     def get_info(self):
         info = super(ScapyField, self).get_info()
         # add seed to report
         info['seed'] = self._seed
+        if self._batch_size and self._current_index >= 0:
+            start = self._current_index - self._current_index % self._batch_size
+            info['batch'] = {
+                'size': self._batch_size,
+                'start': start,
+                'seed': _block_seed(self._seed, start),
+            }
         if isinstance(self._fuzz_packet, Packet):
             info['scapy/command'] = self._fuzz_packet.command()
         return info
@@ -1,6 +1,7 @@
 from kitty.model import Template, Container, Static, OneOf, Repeat
 from kitty.model import BE8, BE16, BE32, SizeInBytes, String, BaseField, RandomBytes
 from kitty.model import BitFieldBinEncoder, ENC_INT_BE, StrNullTerminatedEncoder
+from katnip.model.low_level.container import CachedContainer
 from bitstring import Bits
 import struct
 
@@ -17,7 +18,7 @@ class id3v23_size_encoder(BitFieldBinEncoder):
         return Bits(bytes=bs)
 
 
-class id3v23_frame(Container):
+class id3v23_frame(CachedContainer):
     def __init__(self, frameid, fields, flags=0, fuzzable=True,
                  fuzz_frame_id=False):
         content = Container(name="content", fields=fields)
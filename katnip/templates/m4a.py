@@ -1,12 +1,13 @@
 from kitty.model import Template, Container, Static, SizeInBytes, ElementCount, List
 from kitty.model import String, BE16, BE8, BE32, BitField
 from kitty.model import AbsoluteOffset
+from katnip.model.low_level.container import CachedContainer
 from kitty.model import ENC_INT_BE, StrNullTerminatedEncoder
 
 
 STR_ENC_NULLTERM = StrNullTerminatedEncoder()
 
-class Mp4Box(Container):
+class Mp4Box(CachedContainer):
     def __init__(self, name, fields, fuzzable=True):
         header = Container(name="header", fields=[
             SizeInBytes(name="length", sized_field=self, length=32, encoder=ENC_INT_BE),
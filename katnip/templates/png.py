@@ -19,21 +19,19 @@
 PNG Templates - There's still work to be done
 '''
 from kitty.model import *
-import zlib
+from katnip.model.low_level.container import CachedContainer
+from katnip.model.low_level.compression import ZlibCompressEncoder
 
 
-def compression_func(s):
-    compressor = zlib.compressobj()
-    compressed = compressor.compress(s)
-    compressed += compressor.flush()
-    return compressed
+ZLIB_COMPRESS = ZlibCompressEncoder()
 
-ZLIB_COMPRESS = StrFuncEncoder(compression_func)
 
-
-class Chunk(Container):
+class Chunk(CachedContainer):
     '''
     PNG Chunk
+
+    The chunk caches its rendered value (including the CRC),
+    so only the chunk that is being mutated is rendered and checksummed again.
     '''
 
     def __init__(self, chunk_type, data_fields=None, fuzzable=True, name=None):
@@ -134,12 +132,8 @@ class iTXt(Chunk):
             Static('\x00'),
             String(name='%s translated keyword' % keyword, value='s'),
             Static('\x00'),
+            # the text itself is not added to the chunk yet
         ]
-        if compressed:
-            Container(fields=String(name='%s txt' % keyword, value=data, encoder=ENC_STR_UTF8),
-                      encoder=BitsFuncEncoder(lambda x: Bits(bytes=compression_func(x.tobytes()))))
-        else:
-            String(name='%s txt' % keyword, value=data, encoder=ENC_STR_UTF8)
         super(iTXt, self).__init__('iTXt', data_fields=data_fields, fuzzable=fuzzable, name='%s_%s' % (name, keyword))
 
 
@@ -24,6 +24,7 @@ http://www.usb.org/developers/docs/usb20_docs/usb_20_042814.zip
 '''
 
 from kitty.model import *
+from katnip.model.low_level.container import CachedContainer
 from katnip.legos.dynamic import DynamicInt
 from katnip.legos.usb_hid import GenerateHidReport
 
@@ -86,7 +87,7 @@ class Descriptor(Template):
         super(Descriptor, self).__init__(name=name, fields=fields)
 
 
-class SubDescriptor(Container):
+class SubDescriptor(CachedContainer):
     def __init__(self, name, descriptor_type, fields, fuzz_type=True):
         if isinstance(fields, BaseField):
             fields = [fields]
@@ -95,7 +96,7 @@ class SubDescriptor(Container):
         super(SubDescriptor, self).__init__(name=name, fields=fields)
 
 
-class SizedPt(Container):
+class SizedPt(CachedContainer):
     '''
     Sized part of a descriptor.
     It receives all fields excepts of the size field and adds it.
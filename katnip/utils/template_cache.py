@@ -0,0 +1,362 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+On-disk cache of built templates.
+
+Building a template from a big input (e.g. a JSON document with
+:func:`~katnip.legos.json.dict_to_JsonObject`) is done again in every
+process that uses it. :class:`TemplateCache` builds it once, stores it
+in a cache directory, and loads it in the other processes.
+
+The cache entries are keyed by the builder, its arguments, a hash of the
+katnip and kitty sources, the python version and the cache format version,
+so a change in any of them (including an edit in a source checkout)
+results in a new build.
+
+::
+
+    from katnip.legos.json import dict_to_JsonObject
+    from katnip.utils.template_cache import TemplateCache
+
+    cache = TemplateCache()
+    json_obj = cache.get(dict_to_JsonObject, big_dict, 'big_dict')
+
+Loading a template from the cache unpickles it, which may run any code
+that is stored in the cache file.
+Only the user that runs the fuzzer is trusted to write to the cache:
+the cache directory (by default ``~/.cache/katnip/templates``)
+is created with mode 0700, and :class:`TemplateCache` refuses to use a
+directory, or load a file, that is not owned by that user or that other
+users can write to. Never point it at a directory that is shared with
+other users (e.g. ``/tmp``), and never copy cache files from other hosts.
+On platforms without ``os.getuid`` (Windows) the ownership checks are not
+done, and the cache is as safe as the directory it is in.
+
+Objects that are defined at module level in kitty and katnip (encoders,
+functions) and loggers are stored by name, so the loaded template uses the
+same objects as a template that was built in the process.
+Other functions (e.g. the ``calc_func`` lambda of a
+:class:`~kitty.model.low_level.calculated.Size`) are stored by their code,
+so the python version is part of the key as well.
+The mutation libraries of the fields are not stored,
+they are rebuilt when the field is first mutated.
+'''
+import os
+import sys
+import types
+import hashlib
+import logging
+import tempfile
+import cPickle
+import marshal
+import stat
+from cStringIO import StringIO
+from kitty.core import KittyException
+from kitty.core.kitty_object import KittyObject
+from kitty.model import BaseField, Container
+from kitty.model.low_level.field import _LibraryField
+
+
+#: version of the cache format, bump it when the stored data changes
+CACHE_FORMAT_VERSION = 1
+
+_PID_LOGGER = 'logger'
+_PID_GLOBAL = 'global'
+_PID_FUNCTION = 'function'
+_PID_METHOD = 'method'
+
+
+_source_digests = {}
+
+
+def _source_digest(path):
+    '''
+    :param path: directory of a package
+    :return: hash of the python sources under the directory
+    '''
+    path = os.path.abspath(path)
+    if path not in _source_digests:
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fname in sorted(files):
+                if fname.endswith('.py'):
+                    fpath = os.path.join(root, fname)
+                    digest.update(os.path.relpath(fpath, path).encode('utf-8'))
+                    with open(fpath, 'rb') as f:
+                        digest.update(f.read())
+        _source_digests[path] = digest.hexdigest()[:16]
+    return _source_digests[path]
+
+
+def _default_cache_dir():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'katnip', 'templates')
+
+
+def _is_trusted(st):
+    '''
+    :param st: stat result of a cache file or directory
+    :return: True if it is owned by the current user and no other user can write to it
+    '''
+    if not hasattr(os, 'getuid'):
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _is_cached_module(name):
+    return name.split('.')[0] in ('kitty', 'katnip')
+
+
+def _module_globals():
+    '''
+    :return: dictionary of id(object) -> (module name, attribute name) for the objects
+        that are defined at module level in the loaded kitty and katnip modules
+    '''
+    skip_types = (
+        types.ModuleType, type, types.ClassType, BaseField,
+        int, long, float, bool, str, unicode, tuple, type(None)
+    )
+    objects = {}
+    for module_name, module in sys.modules.items():
+        if module is None or not _is_cached_module(module_name):
+            continue
+        for attr_name, value in vars(module).items():
+            if not isinstance(value, skip_types):
+                objects.setdefault(id(value), (module_name, attr_name))
+    return objects
+
+
+def _make_cell(value):
+    return (lambda: value).func_closure[0]
+
+
+def _function_id(func):
+    closure = None
+    if func.func_closure is not None:
+        closure = tuple(cell.cell_contents for cell in func.func_closure)
+    return (_PID_FUNCTION, marshal.dumps(func.func_code), func.__module__, func.func_name, func.func_defaults, closure)
+
+
+def _load_function(code, module_name, name, defaults, closure):
+    __import__(module_name)
+    if closure is not None:
+        closure = tuple(_make_cell(value) for value in closure)
+    return types.FunctionType(marshal.loads(code), vars(sys.modules[module_name]), name, defaults, closure)
+
+
+def _fields(field):
+    yield field
+    if isinstance(field, Container):
+        for child in field._fields:
+            for descendant in _fields(child):
+                yield descendant
+
+
+def dump_template(template, f):
+    '''
+    Serialize a template (or any other field) to a file
+
+    :param template: the template to serialize
+    :param f: file object to write to
+    '''
+    module_globals = _module_globals()
+
+    def persistent_id(obj):
+        if isinstance(obj, logging.Logger):
+            return (_PID_LOGGER, obj.name)
+        names = module_globals.get(id(obj))
+        if names is not None:
+            return (_PID_GLOBAL,) + names
+        if isinstance(obj, types.FunctionType):
+            return _function_id(obj)
+        if isinstance(obj, types.MethodType) and obj.im_self is not None:
+            return (_PID_METHOD, obj.im_self, obj.im_func.__name__)
+        return None
+
+    # the libraries may hold functions, and are rebuilt on the first mutation
+    libraries = []
+    for field in _fields(template):
+        if isinstance(field, _LibraryField) and field._lib is not None:
+            libraries.append((field, field._lib, field._initialized))
+            field._lib = None
+            field._initialized = False
+    try:
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(template)
+    finally:
+        for field, lib, initialized in libraries:
+            field._lib = lib
+            field._initialized = initialized
+
+
+def load_template(f):
+    '''
+    Load a template that was serialized with :func:`dump_template`.
+    Like any unpickling, this may run code that is stored in the file,
+    so only load files that were written by a trusted user.
+
+    :param f: file object to read from
+    :return: the loaded template
+    '''
+    # every field refers to a logger and an encoder, look each name up once
+    named = {}
+
+    def persistent_load(pid):
+        if pid[0] in (_PID_LOGGER, _PID_GLOBAL):
+            obj = named.get(pid)
+            if obj is None:
+                if pid[0] == _PID_LOGGER:
+                    obj = logging.getLogger(pid[1])
+                else:
+                    module_name, attr_name = pid[1:]
+                    __import__(module_name)
+                    obj = getattr(sys.modules[module_name], attr_name)
+                named[pid] = obj
+            return obj
+        elif pid[0] == _PID_FUNCTION:
+            return _load_function(*pid[1:])
+        elif pid[0] == _PID_METHOD:
+            return getattr(pid[1], pid[2])
+        raise cPickle.UnpicklingError('unknown persistent id: %s' % (pid,))
+
+    unpickler = cPickle.Unpickler(f)
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def dumps_template(template):
+    '''
+    :param template: the template to serialize
+    :return: the serialized template
+    '''
+    f = StringIO()
+    dump_template(template, f)
+    return f.getvalue()
+
+
+def loads_template(data):
+    '''
+    :param data: template that was serialized with :func:`dumps_template`
+    :return: the loaded template
+    '''
+    return load_template(StringIO(data))
+
+
+class TemplateCache(KittyObject):
+    '''
+    Directory of built templates, keyed by the input they were built from
+    '''
+
+    def __init__(self, cache_dir=None, version=None, logger=None):
+        '''
+        :param cache_dir: directory to store the templates in, created (with mode 0700) if it does not exist.
+            It must be owned by the current user, and other users must not be able to write to it
+            (default: ~/.cache/katnip/templates)
+        :param version: version string that is added to the key of all entries
+            (default: hashes of the katnip and kitty sources, and the python version)
+        :param logger: logger for the cache (default: None)
+        :raises: KittyException if other users can write to the cache directory
+        '''
+        super(TemplateCache, self).__init__('TemplateCache', logger)
+        if cache_dir is None:
+            cache_dir = _default_cache_dir()
+        self.cache_dir = cache_dir
+        if version is None:
+            import katnip
+            import kitty
+            version = 'katnip-%s/kitty-%s/python-%s' % (
+                _source_digest(os.path.dirname(katnip.__file__)),
+                _source_digest(os.path.dirname(kitty.__file__)),
+                sys.version.split()[0]
+            )
+        self.version = version
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        if not _is_trusted(os.stat(cache_dir)):
+            raise KittyException('cache directory %s is not private to the current user' % cache_dir)
+
+    def get_key(self, builder, *args, **kwargs):
+        '''
+        :param builder: the function that builds the template
+        :param args: positional arguments for the builder
+        :param kwargs: keyword arguments for the builder
+        :return: the cache key of the template
+        '''
+        builder_name = '%s.%s' % (builder.__module__, builder.__name__)
+        key_data = repr((CACHE_FORMAT_VERSION, self.version, builder_name, args, sorted(kwargs.items())))
+        return hashlib.sha1(key_data).hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, '%s.template' % key)
+
+    def load(self, key):
+        '''
+        :param key: the cache key of the template
+        :return: the cached template, or None if it is not in the cache
+            (or if the file is not owned by the current user, or other users can write to it)
+        '''
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                if not _is_trusted(os.fstat(f.fileno())):
+                    self.logger.warning('not loading template from %s, it is not private to the current user', path)
+                    return None
+                return load_template(f)
+        except Exception as ex:
+            self.logger.warning('failed to load template from %s: %s', path, ex)
+            return None
+
+    def save(self, key, template):
+        '''
+        Store a template in the cache.
+        The file is written under a temporary name and then renamed,
+        so processes that load it concurrently never see a partial file.
+
+        :param key: the cache key of the template
+        :param template: the template to store
+        :return: True if the template was stored
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dump_template(template, f)
+            os.rename(tmp_path, self._get_path(key))
+        except Exception as ex:
+            self.logger.warning('failed to store template %s: %s', key, ex)
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def get(self, builder, *args, **kwargs):
+        '''
+        Load a template from the cache, or build and store it if it is not there
+
+        :param builder: the function that builds the template
+        :param args: positional arguments for the builder
+        :param kwargs: keyword arguments for the builder
+        :return: the template
+        '''
+        key = self.get_key(builder, *args, **kwargs)
+        template = self.load(key)
+        if template is None:
+            template = builder(*args, **kwargs)
+            self.save(key, template)
+        return template
@@ -0,0 +1,170 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Micro benchmarks for the katnip encoders.
+
+Runs each encoder (for each supported key size) over payloads from 16 bytes
+to 16 MB and prints the per-call time and throughput.
+The per-call overhead of an encoder is its time per call on the smallest payload.
+The payloads are random bytes (the worst case for the compression encoders),
+or words of text, which compress like typical text fields.
+
+Usage:
+    python bench_encoders.py [--max-size SIZE] [--min-time SECONDS] [--filter NAME] [--payload random|text]
+'''
+import os
+import sys
+import inspect
+import time
+import random
+import argparse
+
+currentdir = os.path.dirname(
+    os.path.abspath(
+        inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from Crypto.Cipher import AES, DES, DES3
+from katnip.model.low_level.encoder import AesEncryptEncoder, AesDecryptEncoder
+from katnip.model.low_level.encoder import DesEncryptEncoder, DesDecryptEncoder
+from katnip.model.low_level.encoder import Des3EncryptEncoder, Des3DecryptEncoder
+from katnip.model.low_level.encoder import AesCtrEncoder, AesGcmEncoder, ChaCha20Encoder
+from katnip.model.low_level.compression import ZlibCompressEncoder, DeflateCompressEncoder, GzipCompressEncoder
+from katnip.model.low_level.compression import Bz2CompressEncoder, LzmaCompressEncoder
+
+
+PAYLOAD_SIZES = [16, 256, 4 * 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+
+
+def _block_cipher_encoders(name, encrypt_class, decrypt_class, modes, key_sizes):
+    encoders = []
+    for mode_name, mode in modes:
+        for key_size in key_sizes:
+            key = '\x01' * key_size
+            encoders.append(('%s-%s encrypt' % (name, mode_name), key_size, lambda k=key, m=mode: encrypt_class(key=k, mode=m)))
+            encoders.append(('%s-%s decrypt' % (name, mode_name), key_size, lambda k=key, m=mode: decrypt_class(key=k, mode=m)))
+    return encoders
+
+
+def _png_compress_encoder():
+    from katnip.templates.png import ZLIB_COMPRESS
+    # the encoder that the png template uses, with its cache, the repeated
+    # payload is served from the cache like the default renders of the template.
+    # the zlib row is the same configuration without the cache
+    return ZLIB_COMPRESS
+
+
+WORDS = [
+    'kitty', 'katnip', 'fuzz', 'field', 'template', 'mutation', 'encoder', 'payload',
+    'the', 'of', 'and', 'a', 'to', 'in', 'is', 'value', 'length', 'data', '0', '1', '42',
+]
+
+
+def make_payload(size, kind):
+    '''
+    :param size: payload size in bytes
+    :param kind: 'random' for random bytes, 'text' for random words
+    :return: the payload
+    '''
+    if kind == 'random':
+        return os.urandom(size)
+    r = random.Random(size)
+    words = []
+    length = 0
+    while length < size:
+        word = r.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def get_encoders():
+    '''
+    :return: list of (name, key size, encoder factory)
+    '''
+    encoders = []
+    encoders += _block_cipher_encoders('AES', AesEncryptEncoder, AesDecryptEncoder, [('CBC', AES.MODE_CBC), ('ECB', AES.MODE_ECB)], [16, 24, 32])
+    encoders += _block_cipher_encoders('DES', DesEncryptEncoder, DesDecryptEncoder, [('CBC', DES.MODE_CBC), ('ECB', DES.MODE_ECB)], [8])
+    encoders += _block_cipher_encoders('3DES', Des3EncryptEncoder, Des3DecryptEncoder, [('CBC', DES3.MODE_CBC), ('ECB', DES3.MODE_ECB)], [16, 24])
+    for key_size in [16, 24, 32]:
+        key = '\x01' * key_size
+        encoders.append(('AES-CTR', key_size, lambda k=key: AesCtrEncoder(key=k)))
+        encoders.append(('AES-GCM', key_size, lambda k=key: AesGcmEncoder(key=k)))
+    encoders.append(('ChaCha20', 32, lambda: ChaCha20Encoder(key='\x01' * 32)))
+    for name, encoder_class in [
+        ('zlib', ZlibCompressEncoder),
+        ('deflate', DeflateCompressEncoder),
+        ('gzip', GzipCompressEncoder),
+        ('bz2', Bz2CompressEncoder),
+        ('lzma', LzmaCompressEncoder),
+    ]:
+        # no cache, otherwise only the first call compresses
+        encoders.append((name, 0, lambda c=encoder_class: c(cache_size=0)))
+    encoders.append(('png ZLIB_COMPRESS', 0, _png_compress_encoder))
+    return encoders
+
+
+def bench(encoder, payload, min_time):
+    '''
+    :return: (number of calls, seconds per call)
+    '''
+    calls = 0
+    start = time.time()
+    elapsed = 0
+    while elapsed < min_time:
+        encoder.encode(payload)
+        calls += 1
+        elapsed = time.time() - start
+    return calls, elapsed / calls
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024 or unit == 'MB':
+            return '%d%s' % (size, unit)
+        size /= 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='katnip encoder micro benchmarks')
+    parser.add_argument('--max-size', type=int, default=PAYLOAD_SIZES[-1], help='largest payload size in bytes (default: 16MB)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimal run time per measurement in seconds (default: 0.2)')
+    parser.add_argument('--filter', default=None, help='only run encoders that contain this string')
+    parser.add_argument('--payload', choices=['random', 'text'], default='random', help='payload content (default: random)')
+    args = parser.parse_args()
+    sizes = [size for size in PAYLOAD_SIZES if size <= args.max_size]
+    payloads = dict((size, make_payload(size, args.payload)) for size in sizes)
+    print '%-22s %8s %8s %10s %12s %10s' % ('encoder', 'key size', 'payload', 'calls', 'us/call', 'MB/s')
+    for name, key_size, factory in get_encoders():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            encoder = factory()
+        except Exception as ex:
+            print '%-22s %8s skipped: %s' % (name, key_size or '-', ex)
+            continue
+        for size in sizes:
+            calls, per_call = bench(encoder, payloads[size], args.min_time)
+            print '%-22s %8s %8s %10d %12.2f %10.2f' % (
+                name, key_size or '-', format_size(size), calls, per_call * 1e6, size / per_call / (1024 * 1024)
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import threading
+
+from kitty.model import Template, Static, TakeFrom
+from kitty.core import KittyException
+from katnip.legos import bittorrent as kbt
+from common import BaseTestCase
+
+
+def bencode(value):
+    '''
+    :param value: int, str, list or list of (key, value) tuples for a dictionary
+    '''
+    if isinstance(value, int):
+        return 'i%de' % value
+    if isinstance(value, str):
+        return '%d:%s' % (len(value), value)
+    if value and isinstance(value[0], tuple):
+        return 'd' + ''.join(bencode(k) + bencode(v) for k, v in value) + 'e'
+    return 'l' + ''.join(bencode(v) for v in value) + 'e'
+
+
+class NamingContextTests(BaseTestCase):
+
+    def test_unique_names(self):
+        ctx = kbt.NamingContext()
+        self.assertEqual([ctx.unique_name('a'), ctx.unique_name('a'), ctx.unique_name('b')], ['a-1', 'a-2', 'b-1'])
+
+    def test_contexts_independent(self):
+        first = kbt.TString('x', ctx=kbt.NamingContext())
+        second = kbt.TString('x', ctx=kbt.NamingContext())
+        self.assertEqual(first.get_name(), 'TString-1')
+        self.assertEqual(second.get_name(), 'TString-1')
+
+    def test_threads(self):
+        ctx = kbt.NamingContext()
+        names = []
+
+        def generate():
+            names.extend(ctx.unique_name('a') for i in range(1000))
+        threads = [threading.Thread(target=generate) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(names)), 4000)
+
+
+class LegoFromBencodeTests(BaseTestCase):
+
+    def setUp(self):
+        super(LegoFromBencodeTests, self).setUp()
+        self.pieces = ''.join(hashlib.sha1(str(i)).digest() for i in range(10))
+        self.data = bencode([
+            ('announce', 'http://tracker.example.com/announce'),
+            ('creation date', 1466000000),
+            ('info', [
+                ('files', [
+                    [('length', 100), ('path', ['dir', 'a.bin'])],
+                    [('length', -1), ('path', ['b.bin'])],
+                ]),
+                ('name', 'the name'),
+                ('piece length', 262144),
+                ('pieces', self.pieces),
+            ]),
+            ('empty', []),
+        ])
+
+    def test_default_render(self):
+        uut = kbt.lego_from_bencode(self.data, name='torrent')
+        self.assertEqual(type(uut), kbt.TDict)
+        self.assertEqual(Template(name='uut', fields=uut).render().bytes, self.data)
+
+    def test_types(self):
+        for data, lego_type in [('i-5e', kbt.TInteger), ('3:abc', kbt.TString), ('li1ee', kbt.TList), ('de', kbt.TDict)]:
+            uut = kbt.lego_from_bencode(data)
+            self.assertEqual(type(uut), lego_type)
+            self.assertEqual(Template(name='uut', fields=uut).render().bytes, data)
+
+    def test_same_names_per_template(self):
+        first = kbt.lego_from_bencode(self.data)
+        second = kbt.lego_from_bencode(self.data)
+        self.assertEqual(first.get_name(), second.get_name())
+        self.assertEqual(first.hash(), second.hash())
+
+    def test_shared_context(self):
+        ctx = kbt.NamingContext()
+        first = kbt.lego_from_bencode('1:a', ctx=ctx)
+        second = kbt.lego_from_bencode('1:a', ctx=ctx)
+        self.assertNotEqual(first.get_name(), second.get_name())
+
+    def test_pieces_single_field(self):
+        uut = kbt.lego_from_bencode(self.data, name='torrent', fuzz_keys=False, fuzz_delims=False)
+        pieces = [f for f in self._fields(uut) if isinstance(f, Static) and f._default_value == self.pieces]
+        self.assertEqual(len(pieces), 1)
+        t = Template(name='uut', fields=uut)
+        while t.mutate():
+            rendered = t.render().bytes
+            # the pieces may only be removed by a length mutation
+            self.assertTrue(self.pieces in rendered or t.get_info()['field']['path'].endswith('length'))
+
+    def test_blob_size(self):
+        value = 'x' * 100
+        self.assertEqual(type(kbt.lego_from_bencode(bencode(value), name='s', blob_size=99).scan_for_field('s-value')), Static)
+        self.assertNotEqual(type(kbt.lego_from_bencode(bencode(value), name='s', blob_size=100).scan_for_field('s-value')), Static)
+
+    def test_take_subsets(self):
+        uut = kbt.lego_from_bencode(self.data, name='torrent', take_subsets=True)
+        self.assertEqual(type(uut.scan_for_field('torrent-fields')), TakeFrom)
+        uut = kbt.lego_from_bencode(self.data, name='torrent')
+        self.assertNotEqual(type(uut.scan_for_field('torrent-fields')), TakeFrom)
+
+    def test_invalid(self):
+        for data in ['', 'x', 'i12', 'ixe', '5:abc', 'l1:a', 'd1:ae', '1:ab', 'i%de' % 2 ** 64]:
+            with self.assertRaises(KittyException):
+                kbt.lego_from_bencode(data)
+
+    def _fields(self, field):
+        yield field
+        for child in getattr(field, '_fields', []):
+            for descendant in self._fields(child):
+                yield descendant
@@ -18,8 +18,9 @@
 import json
 
 from katnip.legos import json as kjson
+from katnip.legos._utils import coalesce_statics
 from kitty.model import Template
-from kitty.model import String, UInt32
+from kitty.model import String, UInt32, Static
 from kitty.model import ENC_INT_DEC
 
 from common import BaseTestCase, get_mutation_set, warp_with_template
@@ -392,6 +393,74 @@ class JsonArrayTests(BaseTestCase):
             self.assertEqual(i, j)
 
 
+class CoalesceStaticsTests(BaseTestCase):
+
+    def test_adjacent_statics_merged(self):
+        '''
+        Verify that adjacent unnamed statics are merged and other fields are kept
+        '''
+        value = String('a', name='a')
+        fields = coalesce_statics([Static('{'), Static('"'), value, Static(''), Static('"'), Static('}')])
+        self.assertEqual(len(fields), 3)
+        self.assertIs(fields[1], value)
+        self.assertEqual(warp_with_template(fields).render().bytes, '{"a"}')
+
+    def test_named_statics_kept(self):
+        '''
+        Verify that named statics are not merged
+        '''
+        fields = coalesce_statics([Static('{', name='open'), Static('"'), Static('}', name='close')])
+        self.assertEqual([f.get_name() for f in fields], ['open', None, 'close'])
+
+    def test_empty_array_single_static(self):
+        '''
+        Verify that an empty JsonArray renders from a single static field
+        '''
+        array = kjson.JsonArray(name='test', values=[])
+        self.assertEqual(len(array._fields), 1)
+        self.assertEqual(warp_with_template(array).render().bytes, '[]')
+
+    def test_mutations_unchanged(self):
+        '''
+        Verify that a generated object has the same mutations as the uncoalesced one
+        '''
+        the_dict = {'a': [1, 'x', {'b': None, 'c': True}, []], 'd': {}}
+        t = warp_with_template(kjson.dict_to_JsonObject(the_dict, 'obj'))
+        mutations = get_mutation_set(t)
+        original = kjson.coalesce_statics
+        kjson.coalesce_statics = lambda fields: fields
+        try:
+            reference = warp_with_template(kjson.dict_to_JsonObject(the_dict, 'obj'))
+        finally:
+            kjson.coalesce_statics = original
+        self.assertEqual(t.num_mutations(), reference.num_mutations())
+        self.assertEqual(mutations, get_mutation_set(reference))
+
+    def _field_names(self, field):
+        names = [field.get_name()]
+        for child in getattr(field, '_fields', []):
+            names.extend(self._field_names(child))
+        return [name for name in names if name is not None]
+
+    def test_field_names_kept(self):
+        '''
+        Verify that coalescing the statics keeps the named fields,
+        including the key of each member
+        '''
+        inner = kjson.JsonObject(name='inner', member_dict={'id': UInt32(value=7, encoder=ENC_INT_DEC, name='id')})
+        outer = kjson.JsonObject(name='outer', member_dict={
+            'name': kjson.JsonString(name='name', value='kitty'),
+            'inner': inner,
+        })
+        self.assertEqual(self._field_names(outer), [
+            'outer',
+            'outer_name_key', 'outer_name_key_value', 'name', 'name_value',
+            'outer_inner_key', 'outer_inner_key_value', 'inner', 'inner_id_key', 'inner_id_key_value', 'id',
+        ])
+        self.assertEqual(warp_with_template(outer).num_mutations(), 126)
+        self.assertIsNotNone(outer.resolve_field('outer_name_key'))
+
+
 class ListToJsonArrayTests(BaseTestCase):
     '''
     test the generated json list from :func:`~katnip.legos.json.list_to_JsonArray`
@@ -561,3 +630,64 @@ class StrToJson(BaseTestCase):
 
     def test_list_of_various(self):
         self._compare_to_ref('[1, null, true, "blah"]')
+
+
+class StrToJsonSampling(BaseTestCase):
+    '''
+    test the mutation budget and sampling options of :func:`~katnip.legos.json.str_to_json`
+    '''
+
+    json_str = '''{
+        "user": {"name": "baum", "id": 123, "tags": ["a", "b"]},
+        "enabled": true,
+        "items": [{"value": "x"}, {"value": "y"}]
+    }'''
+
+    def _fuzzed_values(self, uut):
+        '''
+        :return: set of names of the fuzzed value fields
+        '''
+        t = warp_with_template(uut)
+        names = set()
+        while t.mutate():
+            names.add(t.get_info()['field']['path'].split('/')[-1])
+        return names
+
+    def test_default_fuzzes_all(self):
+        uut = kjson.str_to_json(self.json_str, name='uut')
+        reference = kjson.str_to_json(self.json_str, name='uut', max_mutations=10 ** 9)
+        self.assertEqual(uut.num_mutations(), reference.num_mutations())
+
+    def test_max_mutations(self):
+        full = kjson.str_to_json(self.json_str, name='uut').num_mutations()
+        for budget in [0, 10, 100, full // 2]:
+            uut = kjson.str_to_json(self.json_str, name='uut', max_mutations=budget)
+            self.assertLessEqual(uut.num_mutations(), budget)
+            self.assertEqual(json.loads(uut.render().bytes), json.loads(self.json_str))
+
+    def test_same_seed_same_selection(self):
+        first = kjson.str_to_json(self.json_str, name='uut', max_mutations=300, seed=5)
+        second = kjson.str_to_json(self.json_str, name='uut', max_mutations=300, seed=5)
+        self.assertEqual(self._fuzzed_values(first), self._fuzzed_values(second))
+
+    def test_paths(self):
+        uut = kjson.str_to_json(self.json_str, name='uut', paths=['$.user.*'])
+        fuzzed = self._fuzzed_values(uut)
+        self.assertTrue(fuzzed)
+        for name in fuzzed:
+            self.assertTrue(name.startswith('name') or name.startswith('id') or name.startswith('string'), name)
+
+    def test_max_depth(self):
+        uut = kjson.str_to_json(self.json_str, name='uut', max_depth=1)
+        self.assertEqual(set(n.split('_')[0] for n in self._fuzzed_values(uut)), set(['enabled']))
+
+    def test_unselected_values_hash(self):
+        '''
+        Values that are left out of the budget are built non-fuzzable,
+        so they hash like values that were never selected
+        '''
+        no_budget = warp_with_template(kjson.str_to_json(self.json_str, name='uut', max_mutations=0))
+        no_paths = warp_with_template(kjson.str_to_json(self.json_str, name='uut', paths=[]))
+        self.assertEqual(no_budget.num_mutations(), 0)
+        self.assertEqual(no_paths.num_mutations(), 0)
+        self.assertEqual(no_budget.hash(), no_paths.hash())
@@ -0,0 +1,118 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+
+from kitty.model import Template, String
+from kitty.model import ENC_INT_LE, ENC_INT_DEC
+from kitty.core import KittyException
+from katnip.legos.tlv import TLV, TLVFactory
+from common import BaseTestCase
+
+
+def _tlv(tag, value):
+    return struct.pack('>BH', tag, len(value)) + value
+
+
+class TLVFactoryTests(BaseTestCase):
+
+    def test_element(self):
+        uut = TLVFactory().element('version', 0x1, fields=String(name='version-string', value='1.2.3'))
+        self.assertEqual(type(uut), TLV)
+        self.assertEqual(uut.render().bytes, '\x00\x00\x00\x01\x00\x00\x00\x05' + '1.2.3')
+
+
+class TLVParseTests(BaseTestCase):
+
+    def setUp(self):
+        super(TLVParseTests, self).setUp()
+        self.factory = TLVFactory(tag_size=8, length_size=16)
+        self.nested = _tlv(0x30, _tlv(1, 'abc') + _tlv(0x30, _tlv(2, 'de') + _tlv(3, '')) + _tlv(4, 'f'))
+        self.data = _tlv(5, 'first') + self.nested + _tlv(6, 'last')
+
+    def _all_renders(self, template):
+        renders = [template.render().bytes]
+        while template.mutate():
+            renders.append(template.render().bytes)
+        template.reset()
+        renders.append(template.render().bytes)
+        return renders
+
+    def test_flat(self):
+        uut = self.factory.parse(self.data, 'capture')
+        self.assertEqual(len(uut._fields), 3)
+        self.assertEqual(Template(name='uut', fields=uut).render().bytes, self.data)
+        self.assertEqual(uut.scan_for_field('capture-1-data')._default_value, self.nested[3:])
+
+    def test_nested(self):
+        uut = self.factory.parse(self.data, 'capture', nested_tags=[0x30])
+        self.assertEqual(Template(name='uut', fields=uut).render().bytes, self.data)
+        self.assertEqual(uut.scan_for_field('capture-4-data')._default_value, 'de')
+        self.assertEqual(uut.scan_for_field('capture-5-data')._default_value, '')
+
+    def test_nested_tags_function(self):
+        uut = self.factory.parse(self.data, 'capture', nested_tags=lambda tag: tag & 0x20)
+        self.assertEqual(uut.scan_for_field('capture-4-data')._default_value, 'de')
+
+    def test_other_sizes_little_endian(self):
+        factory = TLVFactory(tag_size=16, length_size=24, encoder=ENC_INT_LE)
+        data = '\x01\x00' + '\x03\x00\x00' + 'abc' + '\x02\x01' + '\x00\x00\x00'
+        uut = factory.parse(data, 'capture')
+        self.assertEqual(Template(name='uut', fields=uut).render().bytes, data)
+        self.assertEqual(uut.scan_for_field('capture-1-tag')._default_value, 0x102)
+
+    def test_memoryview(self):
+        uut = self.factory.parse(memoryview(bytearray(self.data)), 'capture', nested_tags=[0x30])
+        self.assertEqual(Template(name='uut', fields=uut).render().bytes, self.data)
+
+    def test_fuzz_options(self):
+        uut = self.factory.parse(self.data, 'capture', nested_tags=[0x30], fuzz_values=False, fuzz_length=False)
+        self.assertEqual(uut.num_mutations(), 0)
+        uut = self.factory.parse(self.data, 'capture', nested_tags=[0x30], fuzz_values=False, fuzz_length=True)
+        self.assertGreater(uut.num_mutations(), 0)
+
+    def test_mutations_same_as_uncached(self):
+        uut = Template(name='uut', fields=self.factory.parse(self.data, 'capture', nested_tags=[0x30]))
+        reference = Template(name='uut', fields=self.factory.parse(self.data, 'capture', nested_tags=[0x30]))
+        for field in reference.get_field_by_name('capture')._fields:
+            self._disable_cache(field)
+        self.assertEqual(self._all_renders(uut), self._all_renders(reference))
+
+    def _disable_cache(self, field):
+        if isinstance(field, TLV):
+            field._self_contained = False
+        for child in getattr(field, '_fields', []):
+            self._disable_cache(child)
+
+    def test_truncated_header(self):
+        with self.assertRaises(KittyException):
+            self.factory.parse(self.data + '\x01\x00', 'capture')
+
+    def test_value_exceeds_data(self):
+        with self.assertRaises(KittyException):
+            self.factory.parse(self.data[:-1], 'capture')
+
+    def test_value_exceeds_enclosing(self):
+        data = _tlv(0x30, _tlv(1, 'abc')[:-1]) + 'c'
+        with self.assertRaises(KittyException):
+            self.factory.parse(data, 'capture', nested_tags=[0x30])
+
+    def test_unsupported_encoder(self):
+        with self.assertRaises(KittyException):
+            TLVFactory(encoder=ENC_INT_DEC).parse(self.data, 'capture')
+        with self.assertRaises(KittyException):
+            TLVFactory(tag_size=12).parse(self.data, 'capture')
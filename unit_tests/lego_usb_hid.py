@@ -0,0 +1,152 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+from kitty.model import Template
+from kitty.core import KittyException
+from katnip.legos.usb_hid import GenerateHidReport, RandomHidReport, opcodes
+from katnip.templates import usb
+from common import BaseTestCase
+
+
+REPORT = '05010906A101050719E029E7150025017501950881029501750881011900296515002565750895018100C0'.decode('hex')
+
+
+class RandomHidReportTests(BaseTestCase):
+
+    def _opcodes(self, sequence):
+        '''
+        :return: list of opcodes in the sequence
+        '''
+        sequence = bytearray(sequence)
+        index = 0
+        result = []
+        while index < len(sequence):
+            result.append(sequence[index])
+            index += 1 + (sequence[index] & 3)
+        self.assertEqual(index, len(sequence))
+        return result
+
+    def test_valid_sequences(self):
+        uut = RandomHidReport(min_elements=5, max_elements=20)
+        for i in range(100):
+            sequence = self._opcodes(uut.generate(i))
+            self.assertTrue(5 <= len(sequence) <= 20)
+            for opcode in sequence:
+                self.assertIn(opcode & 0xfc, opcodes)
+
+    def test_same_seed_same_sequences(self):
+        first = RandomHidReport(seed=7)
+        second = RandomHidReport(seed=7)
+        self.assertEqual([first.generate(i) for i in range(50)], [second.generate(i) for i in range(50)])
+        self.assertEqual(first.hash(), second.hash())
+
+    def test_different_seed_different_sequences(self):
+        first = RandomHidReport(seed=7)
+        second = RandomHidReport(seed=8)
+        self.assertNotEqual([first.generate(i) for i in range(50)], [second.generate(i) for i in range(50)])
+        self.assertNotEqual(first.hash(), second.hash())
+
+    def test_mutations(self):
+        uut = RandomHidReport(seed=1, num_mutations=20)
+        self.assertEqual(uut.num_mutations(), 20)
+        mutations = []
+        while uut.mutate():
+            mutations.append(uut.render().bytes)
+        self.assertEqual(mutations, [uut.generate(i) for i in range(1, 21)])
+
+    def test_first_mutation_not_default(self):
+        uut = RandomHidReport(seed=1)
+        default = uut.render().bytes
+        self.assertEqual(default, uut.generate(0))
+        uut.mutate()
+        self.assertNotEqual(uut.render().bytes, default)
+
+    def test_skip(self):
+        uut = RandomHidReport(seed=1, num_mutations=20)
+        mutations = []
+        while uut.mutate():
+            mutations.append(uut.render().bytes)
+        for count in [1, 5, 19]:
+            uut.reset()
+            self.assertEqual(uut.skip(count), count)
+            self.assertEqual(uut.render().bytes, mutations[count - 1])
+        uut.reset()
+        uut.skip(5)
+        self.assertEqual(uut.skip(100), 15)
+        self.assertEqual(uut.render().bytes, mutations[-1])
+        self.assertFalse(uut.mutate())
+
+    def test_skip_does_not_generate(self):
+        uut = RandomHidReport(num_mutations=100000)
+        generated = []
+        original = uut.generate
+        uut.generate = lambda index: generated.append(index) or original(index)
+        self.assertEqual(uut.skip(100000), 100000)
+        self.assertEqual(generated, [100000])
+
+    def test_not_fuzzable(self):
+        self.assertEqual(RandomHidReport(fuzzable=False).num_mutations(), 0)
+
+    def test_not_fuzzable_skip(self):
+        uut = RandomHidReport(fuzzable=False)
+        default = uut.render().bytes
+        self.assertEqual(uut.skip(10), 0)
+        self.assertEqual(uut.render().bytes, default)
+
+    def test_default_num_mutations(self):
+        self.assertEqual(RandomHidReport().num_mutations(), 496)
+
+
+class GenerateHidReportTests(BaseTestCase):
+
+    def _all_renders(self, template):
+        renders = [template.render().bytes]
+        while template.mutate():
+            renders.append(template.render().bytes)
+        return renders
+
+    def test_default_render(self):
+        for report in [REPORT, bytearray(REPORT), memoryview(REPORT)]:
+            t = Template(name='uut', fields=GenerateHidReport(report, name='report'))
+            self.assertEqual(t.render().bytes, REPORT)
+
+    def test_reproducible(self):
+        first = Template(name='uut', fields=GenerateHidReport(REPORT, name='report', seed=3))
+        second = Template(name='uut', fields=GenerateHidReport(REPORT, name='report', seed=3))
+        self.assertEqual(self._all_renders(first), self._all_renders(second))
+
+    def test_skip(self):
+        full = Template(name='uut', fields=GenerateHidReport(REPORT, name='report'))
+        renders = self._all_renders(full)
+        count = len(renders) - 1
+        for index in [0, 10, count // 2, count - 1]:
+            t = Template(name='uut', fields=GenerateHidReport(REPORT, name='report'))
+            t.skip(index)
+            t.mutate()
+            self.assertEqual(t.render().bytes, renders[index + 1])
+
+    def test_usb_template_mutations(self):
+        '''
+        The mutation counts of the USB report descriptor templates
+        are the same as with the TakeFrom based RandomHidReport
+        '''
+        self.assertEqual(usb.hid_report_descriptor.num_mutations(), 3680)
+        self.assertEqual(usb.audio_report_descriptor.num_mutations(), 4967)
+
+    def test_not_enough_bytes(self):
+        with self.assertRaises(KittyException):
+            GenerateHidReport(REPORT + '\x06\x01')
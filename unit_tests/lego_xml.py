@@ -0,0 +1,132 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+from StringIO import StringIO
+from xml.etree import ElementTree
+
+from kitty.model import String, Static
+from katnip.legos import xml as kxml
+from common import BaseTestCase, warp_with_template
+
+
+class XmlElementTests(BaseTestCase):
+
+    def test_content_name(self):
+        uut = kxml.XmlElement(name='elem', element_name='a', content='value', fuzz_content=True)
+        t = warp_with_template(uut)
+        self.assertEqual(t.render().bytes, '<a>value</a>')
+        self.assertIsNotNone(uut.get_field_by_name('elem_content'))
+
+    def test_content_list_with_text_fields(self):
+        inner = kxml.XmlElement(name='inner', element_name='b', content='x')
+        uut = kxml.XmlElement(name='elem', element_name='a', content=[Static('before '), inner, String(' after', name='after')])
+        self.assertEqual(warp_with_template(uut).render().bytes, '<a>before <b>x</b> after</a>')
+
+
+class XmlToTemplateTests(BaseTestCase):
+
+    xml_str = '''<config version="2" mode="fast">
+  <user id="1" role="admin"><name>baum</name><mail>a@b.c</mail></user>
+  <user id="2" role="guest"><name>kitty</name><mail>d@e.f</mail></user>
+  <note>a &lt; b &amp; c <b>bold</b> tail</note>
+  <empty/>
+</config>'''
+
+    def _build(self, **kwargs):
+        return kxml.xml_to_template(StringIO(self.xml_str), **kwargs)
+
+    def _fuzzed_fields(self, t):
+        '''
+        :return: set of names of the fuzzed fields
+        '''
+        names = set()
+        while t.mutate():
+            names.add(t.get_info()['field']['path'].split('/')[-1])
+        t.reset()
+        return names
+
+    def _tree_signature(self, elem):
+        return (elem.tag, sorted(elem.attrib.items()), elem.text, elem.tail, [self._tree_signature(child) for child in elem])
+
+    def test_default_render(self):
+        t = self._build()
+        self.assertEqual(t.get_name(), 'config')
+        expected = ElementTree.fromstring(self.xml_str)
+        actual = ElementTree.fromstring(t.render().bytes)
+        self.assertEqual(self._tree_signature(actual), self._tree_signature(expected))
+
+    def test_exact_render(self):
+        xml_str = '<a x="1" y="&quot;q&quot;">text<b>in</b>tail &amp; more</a>'
+        t = kxml.xml_to_template(StringIO(xml_str), name='uut')
+        self.assertEqual(t.get_name(), 'uut')
+        self.assertEqual(t.render().bytes, xml_str)
+
+    def test_empty_element(self):
+        t = kxml.xml_to_template(StringIO('<a><b/></a>'))
+        self.assertEqual(t.render().bytes, '<a><b></b></a>')
+
+    def test_namespaces(self):
+        xml_str = '<r xmlns="urn:a" xmlns:p="urn:p"><p:e p:k="v">x</p:e></r>'
+        t = kxml.xml_to_template(StringIO(xml_str))
+        rendered = t.render().bytes
+        self.assertIn('<p:e p:k="v">x</p:e>', rendered)
+        expected = ElementTree.fromstring(xml_str)
+        actual = ElementTree.fromstring(rendered)
+        self.assertEqual(self._tree_signature(actual), self._tree_signature(expected))
+
+    def test_nothing_fuzzed(self):
+        t = self._build(fuzz_attributes=False, fuzz_content=False)
+        self.assertEqual(t.num_mutations(), 0)
+
+    def test_fuzz_names(self):
+        t = self._build(fuzz_attributes=False, fuzz_content=False, fuzz_names=True)
+        fuzzed = self._fuzzed_fields(t)
+        self.assertTrue(fuzzed)
+        for name in fuzzed:
+            self.assertTrue(name.endswith('_element'), name)
+
+    def test_fuzz_attributes_by_path(self):
+        t = self._build(fuzz_attributes=['/config/user/@id'], fuzz_content=False)
+        fuzzed = self._fuzzed_fields(t)
+        self.assertEqual(len(fuzzed), 2)
+        for name in fuzzed:
+            self.assertTrue(name.startswith('user') and name.endswith('_id_value'), name)
+
+    def test_fuzz_content_by_path(self):
+        t = self._build(fuzz_attributes=False, fuzz_content=['*/name'])
+        fuzzed = self._fuzzed_fields(t)
+        self.assertEqual(len(fuzzed), 2)
+        for name in fuzzed:
+            self.assertTrue(name.startswith('name') and name.endswith('_content'), name)
+
+    def test_fuzz_mixed_content(self):
+        t = self._build(fuzz_attributes=False, fuzz_content=['/config/note'])
+        fuzzed = self._fuzzed_fields(t)
+        self.assertEqual(fuzzed, set(['note_text_0', 'note_text_1']))
+
+    def test_unique_names_do_not_collide(self):
+        ctx = kxml._XmlContext(False, False, False)
+        names = [ctx.uname(name) for name in ['a', 'a_0', 'a', 'a']]
+        self.assertEqual(names, ['a', 'a_0', 'a_1', 'a_2'])
+        xml_str = '<r><a></a><a_0></a_0><a></a></r>'
+        t = kxml.xml_to_template(StringIO(xml_str))
+        self.assertEqual(t.render().bytes, xml_str)
+
+    def test_big_document(self):
+        xml_str = '<root>%s</root>' % ''.join('<item id="%d">%d</item>' % (i, i) for i in range(200))
+        t = kxml.xml_to_template(StringIO(xml_str), fuzz_attributes=False, fuzz_content=False)
+        self.assertEqual(t.render().bytes, xml_str)
@@ -24,6 +24,17 @@ from katnip.model.low_level.encoder import AesCbcEncryptEncoder, AesEcbEncryptEn
 from katnip.model.low_level.encoder import AesCbcDecryptEncoder, AesEcbDecryptEncoder
 from katnip.model.low_level.encoder import DesEncryptEncoder, DesDecryptEncoder
 from katnip.model.low_level.encoder import Des3EncryptEncoder, Des3DecryptEncoder
+from katnip.model.low_level.encoder import encode_many
+from katnip.model.low_level.encoder import AesCtrEncoder, AesGcmEncoder, ChaCha20Encoder
+from katnip.model.low_level.encoder import counter_nonce_provider, random_nonce_provider
+from katnip.model.low_level.compression import ZlibCompressEncoder, DeflateCompressEncoder, GzipCompressEncoder
+from katnip.model.low_level.compression import Bz2CompressEncoder, LzmaCompressEncoder
+from Crypto.Util import Counter
+import bz2
+import gzip
+import zlib
+from StringIO import StringIO
+from kitty.model.low_level.encoder import ENC_STR_HEX
 from kitty.model.low_level.encoder import ENC_STR_DEFAULT
 from kitty.model.low_level import RandomBytes
 from kitty.core import KittyException
@@ -151,6 +162,31 @@ class CryptorEncoderTestCase(BaseTestCase):
         self.crypto.key_provider = self.dummy_provider
         self._test_exception()
 
+    def _test_encode_many_base(self):
+        values = [m.bytes for m in self.get_all_mutations(self.get_default_field(True))]
+        self.i = 0
+        expected = [self.get_encoder().encode(value).bytes for value in values]
+        self.i = 0
+        encoded = [m.bytes for m in encode_many(self.get_encoder(), values)]
+        self.assertEqual(encoded, expected)
+
+    @metaTest
+    def test_encode_many_CBC(self):
+        self.crypto.mode = AES.MODE_CBC
+        self._test_encode_many_base()
+
+    @metaTest
+    def test_encode_many_ECB(self):
+        self.crypto.mode = AES.MODE_ECB
+        self._test_encode_many_base()
+
+    @metaTest
+    def test_encode_many_key_provider(self):
+        self.crypto.mode = AES.MODE_ECB
+        self.crypto.key = None
+        self.crypto.key_provider = self.dummy_provider
+        self._test_encode_many_base()
+
     def _test_generators_base(self, encoder):
         clear_field = self.get_default_field(True)
         encoded_field = self.get_default_field_with_encoder(encoder)
@@ -431,3 +467,344 @@ class Des3DecryptEncoderTestCase(CryptorEncoderTestCase):
         des3 = DES3.new(key=key, IV=iv, mode=self.crypto.mode)
         decrypted = des3.decrypt(data)
         return decrypted
+
+
+class BlockCipherKeyPolicyTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(BlockCipherKeyPolicyTestCase, self).setUp()
+        self.i = 0
+
+    def dummy_provider(self, key_size):
+        self.i += 1
+        return chr(self.i % 256) * key_size
+
+    def _expected(self, keys, data):
+        return [AES.new(key=key, IV='\x00' * 16, mode=AES.MODE_ECB).encrypt(data) for key in keys]
+
+    def _encode_all(self, encoder, count, data):
+        return [encoder.encode(data).bytes for _ in range(count)]
+
+    def test_always(self):
+        encoder = AesEcbEncryptEncoder(key_provider=self.dummy_provider)
+        data = '\x01' * 16
+        encoded = self._encode_all(encoder, 4, data)
+        self.assertEqual(self.i, 4)
+        self.assertEqual(encoded, self._expected(['\x01' * 16, '\x02' * 16, '\x03' * 16, '\x04' * 16], data))
+
+    def test_once(self):
+        encoder = AesEcbEncryptEncoder(key_provider=self.dummy_provider, key_policy='once')
+        data = '\x01' * 16
+        encoded = self._encode_all(encoder, 4, data)
+        self.assertEqual(self.i, 1)
+        self.assertEqual(encoded, self._expected(['\x01' * 16] * 4, data))
+
+    def test_every_n(self):
+        encoder = AesEcbDecryptEncoder(key_provider=self.dummy_provider, key_policy=3)
+        data = '\x01' * 16
+        encoded = self._encode_all(encoder, 7, data)
+        self.assertEqual(self.i, 3)
+        keys = ['\x01' * 16] * 3 + ['\x02' * 16] * 3 + ['\x03' * 16]
+        expected = [AES.new(key=key, IV='\x00' * 16, mode=AES.MODE_ECB).decrypt(data) for key in keys]
+        self.assertEqual(encoded, expected)
+
+    def test_ecb_cipher_reused(self):
+        encoder = AesEcbEncryptEncoder(key='\x01' * 16)
+        encoder.encode('\x01' * 16)
+        cipher = encoder._get_cipher('\x01' * 16)
+        encoder.encode('\x02' * 16)
+        self.assertIs(encoder._get_cipher('\x01' * 16), cipher)
+
+    def test_cbc_not_chained_between_encodes(self):
+        encoder = AesCbcEncryptEncoder(key='\x01' * 16, key_policy='once')
+        data = '\x01' * 32
+        self.assertEqual(encoder.encode(data).bytes, encoder.encode(data).bytes)
+
+    def test_cbc_cipher_reused(self):
+        encoder = AesCbcEncryptEncoder(key='\x01' * 16, iv='\x02' * 16)
+        encoder.encode('\x01' * 16)
+        cipher = encoder._get_cipher('\x01' * 16)
+        encoder.encode('\x02' * 16)
+        self.assertIs(encoder._get_cipher('\x01' * 16), cipher)
+
+    def test_cbc_cached_same_as_new_cipher(self):
+        key = '\x01' * 16
+        iv = '\x02' * 16
+        data = ''.join(chr(i) for i in range(80))
+        encryptor = AesCbcEncryptEncoder(key=key, iv=iv)
+        decryptor = AesCbcDecryptEncoder(key=key, iv=iv)
+        encrypted = AES.new(key=key, IV=iv, mode=AES.MODE_CBC).encrypt(data)
+        for _ in range(3):
+            self.assertEqual(encryptor.encode(data).bytes, encrypted)
+            self.assertEqual(decryptor.encode(encrypted).bytes, data)
+        self.assertEqual([v.bytes for v in encryptor.encode_many([data, data[:16]])],
+                         [encrypted, encrypted[:16]])
+
+    def test_exception_bad_policy(self):
+        for policy in ['never', 0, -1, 1.5]:
+            with self.assertRaises(KittyException):
+                AesEcbEncryptEncoder(key='\x01' * 16, key_policy=policy)
+
+
+class BlockCipherPaddingTestCase(BaseTestCase):
+
+    def _test_padder_block_size(self, encoder_class, block_size):
+        sizes = []
+
+        def padder(data, size):
+            sizes.append(size)
+            return data + '\x11' * (size - len(data) % size)
+        encoder = encoder_class(key='\x01' * encoder_class._key_sizes_[0], padder=padder)
+        encoded = encoder.encode('\x01' * 3).bytes
+        self.assertEqual(sizes, [block_size])
+        self.assertEqual(len(encoded), block_size)
+        cipher = encoder_class._cipher_class_.new(key='\x01' * encoder_class._key_sizes_[0], mode=encoder.mode, IV=encoder.iv)
+        self.assertEqual(encoded, cipher.encrypt('\x01' * 3 + '\x11' * (block_size - 3)))
+
+    def test_des_padder_gets_block_size(self):
+        self._test_padder_block_size(DesEncryptEncoder, 8)
+
+    def test_des3_padder_gets_block_size(self):
+        self._test_padder_block_size(Des3EncryptEncoder, 8)
+
+    def test_aes_padder_gets_block_size(self):
+        self._test_padder_block_size(AesEncryptEncoder, 16)
+
+
+class EncodeManyTestCase(BaseTestCase):
+
+    def test_fallback_to_encode(self):
+        values = ['', 'a', '\x00\x01']
+        self.assertEqual(encode_many(ENC_STR_HEX, values), [ENC_STR_HEX.encode(value) for value in values])
+
+    def test_empty(self):
+        self.assertEqual(encode_many(AesEcbEncryptEncoder(key='\x01' * 16), []), [])
+
+
+class NonceCipherEncoderTestCase(BaseTestCase):
+
+    __meta__ = True
+
+    def setUp(self, encoder_class=None, key_size=None):
+        super(NonceCipherEncoderTestCase, self).setUp()
+        self.encoder_class = encoder_class
+        self.key = '\x01' * key_size if key_size else None
+
+    def get_encoder(self, **kwargs):
+        try:
+            return self.encoder_class(**kwargs)
+        except KittyException:
+            self.skipTest('cipher not supported by the installed Crypto package')
+
+    def encrypt(self, key, nonce, data):
+        raise NotImplementedError()
+
+    def _test_nonce_provider_base(self, provider, expected_provider):
+        encoder = self.get_encoder(key=self.key, nonce_provider=provider)
+        for index, data in [(-1, ''), (0, 'a'), (7, '\x02' * 100), (1, 'a')]:
+            encoded = encoder.encode(data, index).bytes
+            nonce = expected_provider(encoder.nonce_size, index)
+            self.assertEqual(encoder.current_nonce, nonce)
+            self.assertEqual(encoder.get_info()['nonce'], nonce.encode('hex'))
+            self.assertEqual(encoded, self.encrypt(self.key, nonce, data))
+
+    @metaTest
+    def test_fixed_nonce(self):
+        encoder = self.get_encoder(key=self.key)
+        nonce = '\x00' * encoder.nonce_size
+        self.assertEqual(encoder.encode('\x02' * 33).bytes, self.encrypt(self.key, nonce, '\x02' * 33))
+        self.assertEqual(encoder.encode('\x02' * 33).bytes, self.encrypt(self.key, nonce, '\x02' * 33))
+
+    @metaTest
+    def test_counter_nonce_provider(self):
+        self._test_nonce_provider_base(counter_nonce_provider(3), counter_nonce_provider(3))
+
+    @metaTest
+    def test_counter_nonce_from_index(self):
+        encoder = self.get_encoder(key=self.key, nonce_provider=counter_nonce_provider(3))
+        encoder.encode('a', 5)
+        self.assertEqual(encoder.current_nonce, '\x00' * (encoder.nonce_size - 1) + '\x09')
+        encoder.encode('a', 5)
+        self.assertEqual(encoder.current_nonce, '\x00' * (encoder.nonce_size - 1) + '\x09')
+
+    @metaTest
+    def test_counter_nonce_requires_index(self):
+        encoder = self.get_encoder(key=self.key, nonce_provider=counter_nonce_provider())
+        with self.assertRaises(KittyException):
+            encoder.encode('a')
+
+    @metaTest
+    def test_random_nonce_provider(self):
+        self._test_nonce_provider_base(random_nonce_provider(1234), random_nonce_provider(1234))
+
+    @metaTest
+    def test_random_nonce_provider_default_seed(self):
+        first = random_nonce_provider()
+        second = random_nonce_provider()
+        self.assertEqual(first(12, 3), second(12, 3))
+        self.assertNotEqual(first(12, 3), first(12, 4))
+        self.assertEqual(first(12, None), second(12, None))
+
+    @metaTest
+    def test_exception_nonce_and_provider(self):
+        with self.assertRaises(KittyException):
+            self.encoder_class(key=self.key, nonce='\x00' * 12, nonce_provider=counter_nonce_provider())
+
+    @metaTest
+    def test_exception_bad_nonce_size(self):
+        with self.assertRaises(KittyException):
+            self.encoder_class(key=self.key, nonce='\x00' * 3)
+
+
+class AesCtrEncoderTestCase(NonceCipherEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(AesCtrEncoderTestCase, self).setUp(AesCtrEncoder, 16)
+
+    def encrypt(self, key, nonce, data):
+        counter = Counter.new(128 - len(nonce) * 8, prefix=nonce, initial_value=0)
+        return AES.new(key=key, mode=AES.MODE_CTR, counter=counter).encrypt(data)
+
+
+class AesGcmEncoderTestCase(NonceCipherEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(AesGcmEncoderTestCase, self).setUp(AesGcmEncoder, 16)
+
+    def encrypt(self, key, nonce, data):
+        encrypted, tag = AES.new(key=key, mode=AES.MODE_GCM, nonce=nonce).encrypt_and_digest(data)
+        return encrypted + tag
+
+
+class ChaCha20EncoderTestCase(NonceCipherEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(ChaCha20EncoderTestCase, self).setUp(ChaCha20Encoder, 32)
+
+    def encrypt(self, key, nonce, data):
+        from Crypto.Cipher import ChaCha20
+        return ChaCha20.new(key=key, nonce=nonce).encrypt(data)
+
+
+class CompressEncoderTestCase(BaseTestCase):
+
+    __meta__ = True
+
+    def setUp(self, encoder_class=None):
+        super(CompressEncoderTestCase, self).setUp()
+        self.encoder_class = encoder_class
+
+    def get_encoder(self, **kwargs):
+        try:
+            return self.encoder_class(**kwargs)
+        except KittyException:
+            self.skipTest('compressor is not installed')
+
+    def decompress(self, data):
+        raise NotImplementedError()
+
+    @metaTest
+    def test_round_trip(self):
+        encoder = self.get_encoder()
+        for data in ['', 'a', 'abc' * 1000, ''.join(chr(i) for i in range(256))]:
+            self.assertEqual(self.decompress(encoder.encode(data).bytes), data)
+
+    @metaTest
+    def test_level(self):
+        data = ''.join(chr(i % 7 + i % 13) for i in range(10000))
+        encoded = self.get_encoder(level=1).encode(data).bytes
+        self.assertEqual(self.decompress(encoded), data)
+
+    @metaTest
+    def test_cache_reused(self):
+        encoder = self.get_encoder()
+        first = encoder.encode('abc' * 100)
+        self.assertIs(encoder.encode('abc' * 100), first)
+
+    @metaTest
+    def test_cache_bounded(self):
+        encoder = self.get_encoder(cache_size=2)
+        first = encoder.encode('a')
+        encoder.encode('b')
+        encoder.encode('c')
+        self.assertEqual(len(encoder._cache), 2)
+        self.assertIsNot(encoder.encode('a'), first)
+
+    @metaTest
+    def test_cache_disabled(self):
+        encoder = self.get_encoder(cache_size=0)
+        self.assertEqual(encoder.encode('abc'), encoder.encode('abc'))
+        self.assertEqual(len(encoder._cache), 0)
+
+    @metaTest
+    def test_encode_many(self):
+        encoder = self.get_encoder()
+        values = ['a', 'b', 'a', '']
+        self.assertEqual(encode_many(encoder, values), [encoder.encode(value) for value in values])
+
+
+class ZlibCompressEncoderTestCase(CompressEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(ZlibCompressEncoderTestCase, self).setUp(ZlibCompressEncoder)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+    def test_same_as_compressobj(self):
+        compressor = zlib.compressobj()
+        data = 'abc' * 100
+        self.assertEqual(ZlibCompressEncoder().encode(data).bytes, compressor.compress(data) + compressor.flush())
+
+
+class DeflateCompressEncoderTestCase(CompressEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(DeflateCompressEncoderTestCase, self).setUp(DeflateCompressEncoder)
+
+    def decompress(self, data):
+        return zlib.decompress(data, -zlib.MAX_WBITS)
+
+
+class GzipCompressEncoderTestCase(CompressEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(GzipCompressEncoderTestCase, self).setUp(GzipCompressEncoder)
+
+    def decompress(self, data):
+        return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+
+class Bz2CompressEncoderTestCase(CompressEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(Bz2CompressEncoderTestCase, self).setUp(Bz2CompressEncoder)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+
+class LzmaCompressEncoderTestCase(CompressEncoderTestCase):
+
+    __meta__ = False
+
+    def setUp(self):
+        super(LzmaCompressEncoderTestCase, self).setUp(LzmaCompressEncoder)
+
+    def decompress(self, data):
+        from katnip.model.low_level.encoder import lzma
+        return lzma.decompress(data)
@@ -31,9 +31,17 @@ sys.path.insert(0, parentdir)
 # Test files to use
 from lego_json import *
 from lego_url import *
+from lego_xml import *
+from lego_tlv import *
+from lego_bittorrent import *
+from lego_usb_hid import *
 from lego_dynamic import *
+from template_png import *
 from model_low_level_encoders import *
 from test_model_low_level_scapy_field import *
+from test_model_low_level_fs_iterators import *
+from test_model_low_level_container import *
+from test_utils_template_cache import *
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+'''
+Tests for the PNG templates:
+'''
+from kitty.model import Template, Container, Static, RandomBytes, U32, U8
+from katnip.templates import png
+from common import BaseTestCase
+
+
+class PngChunkTests(BaseTestCase):
+
+    def _chunks(self):
+        return [
+            png.Chunk('IHDR', [
+                U32(name='width', value=3),
+                U32(name='height', value=3),
+                U8(name='bit depth', value=8),
+            ]),
+            png.tEXt('Title', 'kitty title'),
+            png.zTXt('Author', 'kitty author'),
+            png.iTXt('Comment', 'kitty comment'),
+            png.Chunk('IDAT', name='idat', data_fields=[
+                RandomBytes(name='data', value='\x00' * 18, min_length=5, max_length=100, encoder=png.ZLIB_COMPRESS)
+            ]),
+            png.Chunk('IEND'),
+        ]
+
+    def _build(self, plain=False):
+        chunks = self._chunks()
+        if plain:
+            # the same fields, in a container without a render cache
+            chunks = [Container(name=chunk.get_name(), fields=[field.copy() for field in chunk._fields]) for chunk in chunks]
+        return Template(name='png', fields=[Static(name='magic', value='\x89PNG\r\n\x1a\n')] + chunks)
+
+    def _all_renders(self, template):
+        # a plain container has a zero length before its first render
+        template.render()
+        template.reset()
+        renders = [template.render().bytes]
+        while template.mutate():
+            renders.append(template.render().bytes)
+        template.reset()
+        renders.append(template.render().bytes)
+        return renders
+
+    def test_same_renders_as_container(self):
+        cached = self._build()
+        plain = self._build(plain=True)
+        self.assertEqual(cached.num_mutations(), plain.num_mutations())
+        self.assertEqual(self._all_renders(cached), self._all_renders(plain))
+
+    def test_default_render_after_reset(self):
+        template = self._build()
+        default = template.render().bytes
+        for _ in range(template.num_mutations() // 2):
+            template.mutate()
+            template.render()
+        template.reset()
+        self.assertEqual(template.render().bytes, default)
+
+    def test_same_render_after_reset_and_skip(self):
+        template = self._build()
+        index = template.num_mutations() // 2
+        for _ in range(index + 1):
+            template.mutate()
+        expected = template.render().bytes
+        template.reset()
+        template.skip(index)
+        template.mutate()
+        self.assertEqual(template.render().bytes, expected)
+
+    def test_length_set_before_mutation(self):
+        template = self._build()
+        rendered = template.render().bytes
+        # IHDR length is 9 (two U32 and a U8), right after the magic
+        self.assertEqual(rendered[8:16], '\x00\x00\x00\x09IHDR')
+
+    def test_png_template_default_render_after_reset(self):
+        template = png.png_template
+        template.reset()
+        default = template.render().bytes
+        for _ in range(200):
+            template.mutate()
+            template.render()
+        template.reset()
+        self.assertEqual(template.render().bytes, default)
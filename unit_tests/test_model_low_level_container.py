@@ -0,0 +1,243 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Tests for the cached container:
+'''
+from kitty.model import Template, Container, Static, String, UInt8, UInt32, Size, Checksum, Clone, AbsoluteOffset
+from katnip.model.low_level.container import CachedContainer, NonceEncrypted
+from katnip.model.low_level.encoder import AesCtrEncoder, counter_nonce_provider, random_nonce_provider
+from Crypto.Cipher import AES
+from Crypto.Util import Counter
+import struct
+from common import BaseTestCase
+from kitty.core import KittyException
+
+
+class CachedContainerTests(BaseTestCase):
+
+    def _build(self, container_class, external=False):
+        def box(name, fields):
+            return container_class(name=name, fields=[
+                Size('%s_data' % name, length=32, name='%s_length' % name),
+                container_class(name='%s_crced' % name, fields=[
+                    Static(name),
+                    Container(name='%s_data' % name, fields=fields),
+                ]),
+                Checksum('%s_crced' % name, 32, 'crc32', name='%s_crc' % name),
+            ])
+        outer_fields = [
+            box('a', [String(name='a_str', value='aaa'), UInt8(name='a_int', value=1)]),
+            box('b', [UInt32(name='b_int', value=2)]),
+        ]
+        if external:
+            outer_fields.append(box('c', [Size('a_data', length=8, name='c_size_of_a')]))
+        return Template(name='uut', fields=[
+            Static('header'),
+            container_class(name='outer', fields=outer_fields),
+            box('d', [String(name='d_str', value='dddd')]),
+        ])
+
+    def _all_renders(self, template):
+        template.render()
+        template.reset()
+        renders = [template.render().bytes]
+        while template.mutate():
+            renders.append(template.render().bytes)
+        template.reset()
+        renders.append(template.render().bytes)
+        return renders
+
+    def test_same_renders_as_container(self):
+        cached = self._build(CachedContainer)
+        plain = self._build(Container)
+        self.assertEqual(cached.num_mutations(), plain.num_mutations())
+        self.assertEqual(self._all_renders(cached), self._all_renders(plain))
+
+    def test_same_renders_with_external_dependency(self):
+        cached = self._build(CachedContainer, external=True)
+        plain = self._build(Container, external=True)
+        self.assertEqual(self._all_renders(cached), self._all_renders(plain))
+        # c depends on a field of a, but both are inside outer
+        self.assertFalse(cached.scan_for_field('c')._is_self_contained())
+        self.assertTrue(cached.scan_for_field('outer')._is_self_contained())
+
+    def test_cached_render_reused(self):
+        template = self._build(CachedContainer)
+        template.render()
+        box = template.get_field_by_name('d')
+        rendered = box._cached_rendered
+        self.assertIsNotNone(rendered)
+        template.render()
+        self.assertIs(box._cached_rendered, rendered)
+
+    def test_field_state_restored(self):
+        template = self._build(CachedContainer)
+        template.render()
+        a_str = template.scan_for_field('a_str')
+        d_str = template.scan_for_field('d_str')
+        a_offset, d_offset = a_str.offset, d_str.offset
+        a_rendered = a_str._current_rendered
+        # mutate a field before a_str and d_str to move them
+        header_len = len(Static('header').render())
+        while template.mutate():
+            if template.scan_for_field('a_length')._mutating():
+                template.render()
+                break
+        template.reset()
+        template.render()
+        self.assertEqual(a_str.offset, a_offset)
+        self.assertEqual(d_str.offset, d_offset)
+        self.assertEqual(a_str._current_rendered, a_rendered)
+        self.assertEqual(a_offset, header_len + 32 + 8)
+
+    def test_copy_clears_cache(self):
+        box = CachedContainer(name='box', fields=[
+            Size('box_data', length=8, name='box_length'),
+            Container(name='box_data', fields=[String(name='str', value='abc')]),
+        ])
+        template = Template(name='uut', fields=[box])
+        template.render()
+        self.assertIsNotNone(box._cached_rendered)
+        dup = box.copy()
+        self.assertIsNone(dup._cached_rendered)
+        self.assertIsNone(dup._cached_fields)
+
+
+    def _build_clone(self, container_class, external=False):
+        box = container_class(name='box', fields=[
+            Size('box_data', length=8, name='box_length'),
+            Container(name='box_data', fields=[String(name='box_str', value='abc'), Static('-')]),
+            Clone('header_str' if external else 'box_str', name='box_clone'),
+        ])
+        return Template(name='uut', fields=[String(name='header_str', value='hdr'), box])
+
+    def test_clone_in_cached_container(self):
+        for external in [False, True]:
+            cached = self._build_clone(CachedContainer, external)
+            plain = self._build_clone(Container, external)
+            self.assertEqual(self._all_renders(cached), self._all_renders(plain))
+            # a clone of a field outside the container is a dependency the cache can not follow
+            self.assertEqual(cached.scan_for_field('box')._is_self_contained(), not external)
+        # the clone follows the mutated field inside the container
+        template = self._build_clone(CachedContainer)
+        box_str = template.scan_for_field('box_str')
+        while template.mutate():
+            if box_str._mutating():
+                rendered = template.render().bytes
+                self.assertTrue(rendered.endswith('-' + box_str.render().bytes))
+                break
+
+    def _build_moving(self, container_class):
+        box = container_class(name='box', fields=[
+            Size('box_data', length=8, name='box_length'),
+            Container(name='box_data', fields=[String(name='box_str', value='abc')]),
+            Checksum('box_data', 32, 'crc32', name='box_crc'),
+        ])
+        return Template(name='uut', fields=[
+            String(name='header_str', value='hdr'),
+            box,
+            AbsoluteOffset('box_str', length=16, name='box_str_offset', fuzzable=False),
+        ])
+
+    def test_offset_moves_between_renders(self):
+        '''
+        The header before the cached container changes its length on each
+        mutation, so the container is served from the cache at a different
+        offset, and the enclosed fields must be moved with it
+        '''
+        cached = self._build_moving(CachedContainer)
+        plain = self._build_moving(Container)
+        self.assertEqual(self._all_renders(cached), self._all_renders(plain))
+        cached.reset()
+        header_str = cached.scan_for_field('header_str')
+        box = cached.scan_for_field('box')
+        box_str = cached.scan_for_field('box_str')
+        offsets = set()
+        while cached.mutate() and header_str._mutating():
+            rendered = cached.render().bytes
+            self.assertIsNotNone(box._cached_rendered)
+            header_len = len(header_str.render().bytes)
+            self.assertEqual(box.offset, header_len * 8)
+            self.assertEqual(box_str.offset, box.offset + 8)
+            self.assertEqual(rendered[-2:], struct.pack('>H', header_len + 1))
+            offsets.add(box.offset)
+        self.assertGreater(len(offsets), 10)
+
+
+class NonceEncryptedTests(BaseTestCase):
+
+    def setUp(self):
+        super(NonceEncryptedTests, self).setUp()
+        self.key = '\x01' * 16
+
+    def _encrypt(self, nonce, data):
+        counter = Counter.new(128 - len(nonce) * 8, prefix=nonce, initial_value=0)
+        return AES.new(key=self.key, mode=AES.MODE_CTR, counter=counter).encrypt(data)
+
+    def _nonce(self, index):
+        return counter_nonce_provider()(8, index)
+
+    def get_default_container(self, nonce_provider=None):
+        cipher = AesCtrEncoder(key=self.key, nonce_provider=nonce_provider or counter_nonce_provider())
+        return NonceEncrypted(
+            name='encrypted',
+            cipher=cipher,
+            fields=[String('abc', name='str'), UInt8(1, name='byte')],
+        )
+
+    def _clear(self, container):
+        return ''.join(field.render().tobytes() for field in container._fields)
+
+    def testDefault(self):
+        container = self.get_default_container()
+        self.assertEqual(container.render().tobytes(), self._encrypt(self._nonce(-1), 'abc\x01'))
+        self.assertEqual(container.get_info()['nonce'], self._nonce(-1).encode('hex'))
+
+    def testNonceFromMutationIndex(self):
+        container = self.get_default_container()
+        index = 0
+        while container.mutate():
+            expected = self._encrypt(self._nonce(index), self._clear(container))
+            self.assertEqual(container.render().tobytes(), expected)
+            self.assertEqual(container.get_info()['nonce'], self._nonce(index).encode('hex'))
+            index += 1
+        container.reset()
+        self.assertEqual(container.get_info()['nonce'], self._nonce(-1).encode('hex'))
+
+    def testSkipSameAsMutate(self):
+        for provider in [counter_nonce_provider, random_nonce_provider]:
+            container = self.get_default_container(provider())
+            for _ in range(11):
+                container.mutate()
+            expected = container.render().tobytes()
+            info = container.get_info()
+            container = self.get_default_container(provider())
+            container.skip(10)
+            container.mutate()
+            self.assertEqual(container.render().tobytes(), expected)
+            self.assertEqual(container.get_info()['nonce'], info['nonce'])
+
+    def testNonceInTemplateReport(self):
+        container = self.get_default_container()
+        template = Template(name='template', fields=[Static('header'), container])
+        template.mutate()
+        self.assertEqual(template.get_info()['field']['nonce'], self._nonce(0).encode('hex'))
+
+    def testCipherRequired(self):
+        with self.assertRaises(KittyException):
+            NonceEncrypted(fields=[String('abc')])
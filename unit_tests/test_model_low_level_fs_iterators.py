@@ -0,0 +1,523 @@
+# Copyright (C) 2016 Cisco Systems, Inc. and/or its affiliates. All rights reserved.
+#
+# This file is part of Katnip.
+#
+# Katnip is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Katnip is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Katnip.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Tests for FS iterator fields:
+'''
+import gc
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from contextlib import closing
+from common import metaTest
+from test_model_low_level_field import ValueTestCase
+from bitstring import Bits
+from kitty.core import KittyException
+from katnip.model.low_level.fs_iterators import FsNames, FsContent, FsPackContent, build_corpus_pack
+
+
+class FsFieldTestCase(ValueTestCase):
+
+    __meta__ = True
+
+    def setUp(self, cls=None):
+        super(FsFieldTestCase, self).setUp(cls)
+        self.base_dir = tempfile.mkdtemp()
+        self.files = []
+        for dirname in ['a', 'b', 'c']:
+            dirpath = os.path.join(self.base_dir, dirname)
+            os.mkdir(dirpath)
+            for i in range(5):
+                filepath = os.path.join(dirpath, 'file_%d.bin' % i)
+                with open(filepath, 'wb') as f:
+                    f.write('content of %s/%d' % (dirname, i))
+                self.files.append(filepath)
+            with open(os.path.join(dirpath, 'ignored.txt'), 'wb') as f:
+                f.write('ignored')
+        self.uut_name = 'uut'
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def get_field_kwargs(self):
+        return {'path': self.base_dir, 'name_filter': '*.bin', 'recurse': True}
+
+    def get_default_field(self, fuzzable=True):
+        return self.cls(fuzzable=fuzzable, name=self.uut_name, **self.get_field_kwargs())
+
+    def get_expected_values(self):
+        raise NotImplementedError()
+
+    @metaTest
+    def testMutationsInOrder(self):
+        field = self.get_default_field()
+        mutations = [m.bytes for m in self._get_all_mutations(field)]
+        self.assertListEqual(mutations, self.get_expected_values())
+
+    @metaTest
+    def testSeek(self):
+        field = self.get_default_field()
+        expected = self.get_expected_values()
+        for index in [len(expected) // 2, 0, len(expected) - 1, 1]:
+            field.seek(index)
+            self.assertEqual(field.render().bytes, expected[index])
+            if index < len(expected) - 1:
+                self.assertTrue(field.mutate())
+                self.assertEqual(field.render().bytes, expected[index + 1])
+
+    @metaTest
+    def testSkipThenMutate(self):
+        field = self.get_default_field()
+        expected = self.get_expected_values()
+        to_skip = len(expected) // 2
+        self.assertEqual(field.skip(to_skip), to_skip)
+        self.assertTrue(field.mutate())
+        self.assertEqual(field.render().bytes, expected[to_skip])
+
+
+class FsNamesTests(FsFieldTestCase):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsNames):
+        super(FsNamesTests, self).setUp(cls)
+        self.default_value = self.files[0]
+        self.default_value_rendered = Bits(bytes=self.default_value)
+
+    def get_expected_values(self):
+        return self.files
+
+
+class FsContentTests(FsFieldTestCase):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsContent):
+        super(FsContentTests, self).setUp(cls)
+        self.default_value = ''
+        self.default_value_rendered = Bits(bytes=self.default_value)
+
+    def get_expected_values(self):
+        return [open(f, 'rb').read() for f in self.files]
+
+    @metaTest
+    def testGetRenderedFields(self):
+        # default value is empty, so the field is not rendered before mutation
+        pass
+
+
+class FsNamesManifestTests(FsNamesTests):
+
+    __meta__ = False
+
+    def get_field_kwargs(self):
+        kwargs = super(FsNamesManifestTests, self).get_field_kwargs()
+        kwargs['manifest'] = os.path.join(self.base_dir, 'manifest.fsm')
+        return kwargs
+
+    def testManifestReused(self):
+        self.get_default_field()
+        manifest = self.get_field_kwargs()['manifest']
+        with open(manifest, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write('X')
+        field = self.get_default_field()
+        values = [m.bytes for m in self._get_all_mutations(field)]
+        self.assertEqual(values[-1][-1], 'X')
+
+    def testManifestRebuiltOnChange(self):
+        self.get_default_field()
+        new_file = os.path.join(self.base_dir, 'b', 'file_9.bin')
+        with open(new_file, 'wb') as f:
+            f.write('new')
+        # make sure the directory mtime changes on coarse filesystems
+        st = os.stat(os.path.dirname(new_file))
+        os.utime(os.path.dirname(new_file), (st.st_atime, st.st_mtime + 10))
+        field = self.get_default_field()
+        values = [m.bytes for m in self._get_all_mutations(field)]
+        self.assertEqual(len(values), len(self.files) + 1)
+        self.assertEqual(values[10], new_file)
+
+    def testSameAsWithoutManifest(self):
+        field = self.get_default_field()
+        with_manifest = [m.bytes for m in self._get_all_mutations(field)]
+        kwargs = self.get_field_kwargs()
+        del kwargs['manifest']
+        field = self.cls(name=self.uut_name, **kwargs)
+        without_manifest = [m.bytes for m in self._get_all_mutations(field)]
+        self.assertListEqual(with_manifest, without_manifest)
+
+
+class FsContentCachedTests(FsContentTests):
+
+    __meta__ = False
+
+    def get_field_kwargs(self):
+        kwargs = super(FsContentCachedTests, self).get_field_kwargs()
+        kwargs['cache_size'] = 40
+        kwargs['read_ahead'] = 2
+        return kwargs
+
+    def testCacheBoundedBySize(self):
+        field = self.get_default_field()
+        try:
+            self._get_all_mutations(field)
+            self.assertLessEqual(field._cache._size, 40)
+        finally:
+            field.close()
+
+    def testValueIsNotCopied(self):
+        field = self.get_default_field()
+        try:
+            field.mutate()
+            self.assertNotIsInstance(field._current_value, bytes)
+            self.assertEqual(bytes(field._current_value), self.get_expected_values()[0])
+            self.assertEqual(field.get_info()['value']['raw'], repr(self.get_expected_values()[0]))
+        finally:
+            field.close()
+
+    def testEvictedMapsClosed(self):
+        field = self.get_default_field()
+        try:
+            field.mutate()
+            first = field._cache._pinned
+            while field.mutate():
+                pass
+            self.assertNotIn(first, field._cache._maps.values())
+            self.assertRaises(ValueError, first.__getitem__, 0)
+        finally:
+            field.close()
+
+    def testReadAheadStoppedWhenCollected(self):
+        field = self.get_default_field()
+        field.mutate()
+        thread = field._read_ahead_thread
+        self.assertTrue(thread.is_alive())
+        del field
+        gc.collect()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+
+class FsPackContentTests(FsContentTests):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsPackContent):
+        super(FsPackContentTests, self).setUp(cls)
+        self.pack_path = os.path.join(self.base_dir, 'corpus.kpack')
+        build_corpus_pack(self.pack_path, self.base_dir, '*.bin', recurse=True)
+
+    def get_field_kwargs(self):
+        return {'pack_path': self.pack_path}
+
+    def testCurrentView(self):
+        field = self.get_default_field()
+        field.seek(4)
+        self.assertEqual(bytes(field.current_view()), self.get_expected_values()[4])
+
+    def testValueIsNotCopied(self):
+        field = self.get_default_field()
+        field.mutate()
+        self.assertNotIsInstance(field._current_value, bytes)
+        self.assertEqual(field.get_info()['value']['raw'], repr(self.get_expected_values()[0]))
+
+
+class FsNamesShardTests(FsNamesTests):
+
+    __meta__ = False
+
+    shard_by = 'hash'
+
+    def get_field_kwargs(self):
+        kwargs = super(FsNamesShardTests, self).get_field_kwargs()
+        kwargs['shard_index'] = 1
+        kwargs['shard_count'] = 3
+        kwargs['shard_by'] = self.shard_by
+        return kwargs
+
+    def get_expected_values(self):
+        kwargs = self.get_field_kwargs()
+        kwargs['name'] = self.uut_name
+        field = self.cls(**kwargs)
+        return [m.bytes for m in self._get_all_mutations(field)]
+
+    def testShardsCoverAllFiles(self):
+        kwargs = self.get_field_kwargs()
+        kwargs['name'] = self.uut_name
+        covered = []
+        for shard_index in range(kwargs['shard_count']):
+            kwargs['shard_index'] = shard_index
+            field = self.cls(**kwargs)
+            covered.extend(m.bytes for m in self._get_all_mutations(field))
+        self.assertEqual(sorted(covered), sorted(self.files))
+
+
+class FsNamesRangeShardTests(FsNamesShardTests):
+
+    __meta__ = False
+
+    shard_by = 'range'
+
+    def testRangeShard(self):
+        self.assertListEqual(self.get_expected_values(), self.files[5:10])
+
+
+class FsContentDedupTests(FsContentTests):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsContent):
+        super(FsContentDedupTests, self).setUp(cls)
+        with open(os.path.join(self.base_dir, 'b', 'file_7.bin'), 'wb') as f:
+            f.write(open(self.files[2], 'rb').read())
+        with open(os.path.join(self.base_dir, 'c', 'file_7.bin'), 'wb') as f:
+            f.write('x' * 100)
+        self.dedup_cache = os.path.join(self.base_dir, 'dedup.json')
+
+    def get_field_kwargs(self):
+        kwargs = super(FsContentDedupTests, self).get_field_kwargs()
+        kwargs['dedup'] = True
+        kwargs['max_size'] = 50
+        kwargs['dedup_cache'] = self.dedup_cache
+        return kwargs
+
+    def testRemovedReported(self):
+        field = self.get_default_field()
+        field.mutate()
+        info = field.get_info()
+        self.assertEqual(info['removed_files'], {'duplicates': 1, 'oversized': 1})
+
+    def testCachedHashesUsed(self):
+        self.get_default_field()
+        with open(self.dedup_cache, 'rb') as f:
+            cache = json.load(f)
+        cache[os.path.join('b', 'file_7.bin')][2] = 'not a real digest'
+        with open(self.dedup_cache, 'wb') as f:
+            json.dump(cache, f)
+        field = self.get_default_field()
+        self.assertEqual(field.num_mutations(), len(self.files) + 1)
+
+
+class FsContentZipTests(FsContentTests):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsContent):
+        super(FsContentZipTests, self).setUp(cls)
+        self.archive_path = os.path.join(self.base_dir, 'corpus.archive')
+        self.create_archive()
+
+    def create_archive(self):
+        with closing(zipfile.ZipFile(self.archive_path, 'w')) as archive:
+            # add in reverse order, to make sure the members are sorted
+            for filepath in reversed(self.files):
+                archive.write(filepath, os.path.relpath(filepath, self.base_dir))
+
+    def get_field_kwargs(self):
+        kwargs = super(FsContentZipTests, self).get_field_kwargs()
+        kwargs['path'] = self.archive_path
+        return kwargs
+
+
+class FsContentTarGzTests(FsContentZipTests):
+
+    __meta__ = False
+
+    def create_archive(self):
+        with closing(tarfile.open(self.archive_path, 'w:gz')) as archive:
+            for filepath in reversed(self.files):
+                archive.add(filepath, os.path.relpath(filepath, self.base_dir))
+
+
+class FsContentDotTarTests(FsContentZipTests):
+    '''
+    Members of archives that are created with ``tar -C dir .`` start with ./
+    '''
+
+    __meta__ = False
+
+    def create_archive(self):
+        with closing(tarfile.open(self.archive_path, 'w')) as archive:
+            for filepath in reversed(self.files):
+                archive.add(filepath, './' + os.path.relpath(filepath, self.base_dir))
+
+    def testTopLevelMembers(self):
+        with closing(tarfile.open(self.archive_path, 'w')) as archive:
+            archive.add(self.files[0], './top.bin')
+            archive.add(self.files[1], './a/inner.bin')
+        kwargs = self.get_field_kwargs()
+        kwargs['recurse'] = False
+        field = self.cls(name=self.uut_name, **kwargs)
+        mutations = [m.bytes for m in self._get_all_mutations(field)]
+        self.assertListEqual(mutations, [self.get_expected_values()[0]])
+
+    def testXzRejected(self):
+        xz_path = os.path.join(self.base_dir, 'corpus.tar.xz')
+        shutil.copy(self.archive_path, xz_path)
+        kwargs = self.get_field_kwargs()
+        kwargs['path'] = xz_path
+        self.assertRaisesRegexp(KittyException, 'xz', self.cls, name=self.uut_name, **kwargs)
+
+
+class FsNamesTarTests(FsNamesTests):
+
+    __meta__ = False
+
+    def setUp(self, cls=FsNames):
+        super(FsNamesTarTests, self).setUp(cls)
+        self.archive_path = os.path.join(self.base_dir, 'corpus.tar')
+        with closing(tarfile.open(self.archive_path, 'w')) as archive:
+            for filepath in self.files:
+                archive.add(filepath, os.path.relpath(filepath, self.base_dir))
+        self.files = [os.path.join(self.archive_path, os.path.relpath(f, self.base_dir)) for f in self.files]
+        self.default_value = self.files[0]
+        self.default_value_rendered = Bits(bytes=self.default_value)
+
+    def get_field_kwargs(self):
+        kwargs = super(FsNamesTarTests, self).get_field_kwargs()
+        kwargs['path'] = self.archive_path
+        return kwargs
+
+
+class FsNamesWatchTests(FsNamesTests):
+
+    __meta__ = False
+
+    def get_field_kwargs(self):
+        kwargs = super(FsNamesWatchTests, self).get_field_kwargs()
+        kwargs['watch'] = True
+        return kwargs
+
+    def testNewFilesAppended(self):
+        field = self.get_default_field()
+        try:
+            self.assertTrue(field.mutate())
+            new_dir = os.path.join(self.base_dir, 'd')
+            os.mkdir(new_dir)
+            new_files = [os.path.join(self.base_dir, 'a', 'file_0_new.bin'), os.path.join(new_dir, 'file_0.bin')]
+            for filepath in new_files:
+                with open(filepath, 'wb') as f:
+                    f.write('new')
+            with open(os.path.join(self.base_dir, 'a', 'new.txt'), 'wb') as f:
+                f.write('filtered')
+            values = [field.render().bytes]
+            while field.mutate():
+                values.append(field.render().bytes)
+            self.assertEqual(field.num_mutations(), len(self.files) + 2)
+            self.assertListEqual(values[:len(self.files)], self.files)
+            self.assertEqual(sorted(values[len(self.files):]), sorted(new_files))
+        finally:
+            field.close()
+
+
+class FsContentOrderTests(FsContentTests):
+
+    __meta__ = False
+
+    order_by = 'size'
+
+    def setUp(self, cls=FsContent):
+        super(FsContentOrderTests, self).setUp(cls)
+        # file i in each directory is i * 10 + 1 bytes long
+        for filepath in self.files:
+            index = filepath[-len('0.bin')]
+            dirname = os.path.basename(os.path.dirname(filepath))
+            with open(filepath, 'wb') as f:
+                f.write(index * (int(index) * 10) + dirname)
+        self.timing_file = os.path.join(self.base_dir, 'timing.json')
+
+    def get_field_kwargs(self):
+        kwargs = super(FsContentOrderTests, self).get_field_kwargs()
+        kwargs['order_by'] = self.order_by
+        kwargs['timing_file'] = self.timing_file
+        return kwargs
+
+    def get_expected_values(self):
+        contents = [open(f, 'rb').read() for f in self.files]
+        return sorted(contents, key=len)
+
+    def _recorded_files(self):
+        with open(self.timing_file, 'rb') as f:
+            return sorted(os.path.join(self.base_dir, relpath) for relpath in json.load(f))
+
+    def testTimingRecorded(self):
+        field = self.get_default_field()
+        self._get_all_mutations(field)
+        field.close()
+        self.assertEqual(self._recorded_files(), sorted(self.files))
+
+    def testTimingSavedWithoutClose(self):
+        field = self.get_default_field()
+        self._get_all_mutations(field, reset=False)
+        self.assertEqual(self._recorded_files(), sorted(self.files))
+
+    def testTimingSavedOnReset(self):
+        field = self.get_default_field()
+        field.mutate()
+        field.mutate()
+        field.reset()
+        self.assertEqual(len(self._recorded_files()), 2)
+
+
+class FsContentSizeBucketsOrderTests(FsContentOrderTests):
+
+    __meta__ = False
+
+    order_by = 'size_buckets'
+
+    def get_expected_values(self):
+        contents = [open(f, 'rb').read() for f in self.files]
+        buckets = {}
+        for content in contents:
+            buckets.setdefault(len(content).bit_length(), []).append(content)
+        rounds = [buckets[k] for k in sorted(buckets)]
+        expected = []
+        for i in range(max(len(b) for b in rounds)):
+            expected.extend(b[i] for b in rounds if i < len(b))
+        return expected
+
+
+class FsContentExecTimeOrderTests(FsContentOrderTests):
+
+    __meta__ = False
+
+    order_by = 'exec_time'
+
+    def setUp(self, cls=FsContent):
+        super(FsContentExecTimeOrderTests, self).setUp(cls)
+        timings = {}
+        for i, filepath in enumerate(reversed(self.files[5:])):
+            timings[os.path.relpath(filepath, self.base_dir)] = i
+        with open(self.timing_file, 'wb') as f:
+            json.dump(timings, f)
+
+    def get_expected_values(self):
+        contents = [open(f, 'rb').read() for f in self.files]
+        return list(reversed(contents[5:])) + sorted(contents[:5], key=len)
+
+    def testTimingRecorded(self):
+        pass
+
+    def testTimingSavedWithoutClose(self):
+        pass
+
+    def testTimingSavedOnReset(self):
+        pass
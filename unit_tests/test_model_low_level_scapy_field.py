@@ -21,6 +21,7 @@
 Tests for Scapy field:
 '''
 
+import gc
 from common import metaTest
 from test_model_low_level_field import ValueTestCase
 from bitstring import Bits
@@ -63,6 +64,60 @@ class ScapyFieldTests(ValueTestCase):
         pass
 
 
+class ScapyFieldBatchTests(ScapyFieldTests):
 
+    __meta__ = False
 
+    def setUp(self, cls=ScapyField):
+        super(ScapyFieldBatchTests, self).setUp(cls)
+        self.batch_size = 300
+        self.workers = 0
 
+    def get_default_field(self, fuzzable=True):
+        return self.cls(value=self._fuzz_packet, fuzzable=fuzzable, name=self.uut_name, fuzz_count=self._fuzz_count, seed=self.seed, batch_size=self.batch_size, workers=self.workers)
+
+    def testSameResultWithWorkers(self):
+        field = self.get_default_field()
+        expected = self._get_all_mutations(field)
+        self.workers = 2
+        field = self.get_default_field()
+        try:
+            res = self._get_all_mutations(field)
+        finally:
+            field.close()
+        self.assertListEqual(expected, res)
+
+    def testPoolStartedAndReleased(self):
+        self.workers = 2
+        field = self.get_default_field()
+        pool = field._pool
+        self.assertIsNotNone(pool)
+        workers = list(pool._pool)
+        self.assertTrue(all(worker.is_alive() for worker in workers))
+        del field
+        gc.collect()
+        for worker in workers:
+            worker.join(5)
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+
+    def testBlockInFlightPerWorker(self):
+        self.workers = 3
+        field = self.get_default_field()
+        try:
+            field.mutate()
+            self.assertEqual(sorted(field._pending), [1, 2, 3])
+            field.skip(self.batch_size * 2)
+            self.assertEqual(sorted(field._pending), [3, 4, 5])
+        finally:
+            field.close()
+
+    def testSkipSameAsMutate(self):
+        field = self.get_default_field()
+        to_skip = self.batch_size + 7
+        for _ in range(to_skip + 1):
+            field.mutate()
+        expected = field.render()
+        field.reset()
+        self.assertEqual(field.skip(to_skip), to_skip)
+        field.mutate()
+        self.assertEqual(field.render(), expected)